@@ -0,0 +1,642 @@
+"""
+monitor_tip 的性能基准：与运行时代码分开，只在本地手动运行。
+
+用法:
+    uv run python bench/bench_monitor.py                  # 列出全部基准
+    uv run python bench/bench_monitor.py message_scan     # 运行一个或多个基准
+    uv run python bench/bench_monitor.py all              # 运行全部（不含需要真实页面的 capture_profiles）
+    uv run python bench/bench_monitor.py capture_profiles <主播名>
+    uv run python bench/bench_monitor.py uniq_extraction room.html ...
+
+每个基准只使用本文件里构造的数据（房间状态、主播列表、去重存储都是新建的），
+要经过 monitor_tip 全局状态的代码路径用 isolated() 临时换成基准自己的对象，结束后原样恢复；
+数据目录指向临时目录，不会读写真实的 streamers.json、凭据缓存和消息快照。
+"""
+import asyncio
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict
+from unittest.mock import patch
+
+os.environ["SUPERCHAT_DATA_DIR"] = tempfile.mkdtemp(prefix="superchat-bench-")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import monitor_tip as m  # noqa: E402
+
+
+# ---------- 公共工具 ----------
+def best_of(fn: Callable[[], Any], rounds: int) -> float:
+    """运行 fn rounds 次，返回最快一次的耗时（秒）。"""
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def traced_bytes(factory: Callable[[], Any]) -> int:
+    """factory() 构造出的对象新占用的内存（tracemalloc 统计，字节）。"""
+    tracemalloc.start()
+    base = tracemalloc.take_snapshot()
+    built = factory()
+    size = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(base, "filename"))
+    tracemalloc.stop()
+    del built
+    return size
+
+
+@contextmanager
+def isolated(**replacements):
+    """把 monitor_tip 的若干全局对象临时换成基准自己的，退出时恢复。"""
+    with ExitStack() as stack:
+        for name, value in replacements.items():
+            stack.enter_context(patch.object(m, name, value))
+        yield
+
+
+# ---------- 抓取配置 ----------
+async def bench_capture_profiles(username: str, rounds: int = 3, profiles: tuple[str, ...] = ("full", "lite")):
+    """对比不同抓取配置获取 uniq 的耗时与传输字节数（需要能访问真实页面）。"""
+    results = {}
+    with isolated(CAPTURE_STATS={}, VERBOSE=False):
+        for profile in profiles:
+            hits = 0
+            for _ in range(rounds):
+                uniq, *_ = await m.fetch_page_uniq_and_cookies(username, True, 30000, profile=profile)
+                hits += 1 if uniq else 0
+            stats = m.CAPTURE_STATS.get(profile)
+            if not stats or not stats["captures"]:
+                continue
+            captures = stats["captures"]
+            results[profile] = {
+                "uniq_hits": f"{hits}/{rounds}",
+                "wall_ms_avg": stats["wall_ms_total"] / captures,
+                "kb_avg": stats["bytes_total"] / captures / 1024,
+                "requests_avg": stats["requests"] / captures,
+                "blocked_avg": stats["blocked"] / captures,
+                "early_exits": stats["early_exits"],
+                "captures": captures,
+            }
+        await m.BROWSER_POOL.close()
+    for profile, row in results.items():
+        print(
+            f"[基准] {profile:<5} uniq={row['uniq_hits']}  耗时 {row['wall_ms_avg']:.0f}ms  "
+            f"传输 {row['kb_avg']:.0f}KB  请求 {row['requests_avg']:.0f}  拦截 {row['blocked_avg']:.0f}  "
+            f"提前结束 {row['early_exits']}/{row['captures']}"
+        )
+    return results
+
+
+# ---------- uniq 提取 ----------
+def bench_uniq_extraction(*paths: str, rounds: int = 20):
+    """
+    对比单遍扫描与逐条正则扫描提取 uniq 的耗时，并校验两者结果一致。
+    paths 为抓取保存的主页 HTML / __NUXT__ 文件；不传则使用合成的大页面。
+    """
+    fixtures: Dict[str, str] = {}
+    for path in paths:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            fixtures[os.path.basename(path)] = f.read()
+    if not fixtures:
+        block = (
+            '<div class="chat-container model-chat"><a href="/models/user/chat">Chat</a>'
+            '<script src="/static/js/chunk-vendors.js"></script><span class="viewers">1.2K</span></div>\n'
+        )
+        fixtures["synthetic"] = (
+            block * 3000
+            + '<link href="/api/front/v2/models/username/demo/chat?source=regular&uniq=abcdef123456">'
+            + block * 2000
+            + 'window.__NUXT__={"config":{"uniq":"nuxtuniq7788"},"state":"uniq%22%3A%22encoded99%22"}'
+            + block * 1000
+        )
+    results = {}
+    for name, text in fixtures.items():
+        actual = m.extract_uniq_candidates(text)
+        regex_ms = best_of(lambda: m._extract_uniq_candidates_regex(text), rounds) * 1000
+        single_ms = best_of(lambda: m.extract_uniq_candidates(text), rounds) * 1000
+        row = results[name] = {
+            "kb": len(text) / 1024,
+            "regex_ms": regex_ms,
+            "single_ms": single_ms,
+            "speedup": regex_ms / single_ms if single_ms else 0.0,
+            "identical": actual == m._extract_uniq_candidates_regex(text),
+            "candidates": actual,
+        }
+        print(
+            f"[基准] {name}  {row['kb']:.0f}KB  逐条正则 {row['regex_ms']:.2f}ms  单遍扫描 {row['single_ms']:.2f}ms  "
+            f"加速 {row['speedup']:.1f}x  结果一致={row['identical']}  uniq={actual[:3]}"
+        )
+    return results
+
+
+# ---------- 消息去重 / 水位线 ----------
+def bench_message_scan(polls: int = 2000, window: int = 50, new_per_poll: int = 3, rounds: int = 5):
+    """
+    回放一段 chat 响应序列（每次返回最近 window 条，其中 new_per_poll 条为新消息），
+    对比逐条去重与水位线增量扫描的每次轮询 CPU 耗时，并校验两者挑出的新消息一致。
+    """
+    stream = [
+        {"id": 10_000_000 + i, "createdAt": f"2024-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}Z", "type": "tip",
+         "details": {"amount": i % 100}}
+        for i in range(polls * new_per_poll + window)
+    ]
+    responses = [stream[k * new_per_poll:k * new_per_poll + window] for k in range(polls)]
+    room = "bench_room"
+
+    def run_full() -> list[str]:
+        fresh = []
+        for msgs in responses:
+            for msg in msgs:
+                mid = str(msg.get("id") or f"{msg.get('createdAt')}_{msg.get('cacheId')}")
+                if not m.is_duplicate_message(room, mid):
+                    fresh.append(mid)
+        return fresh
+
+    def run_watermark() -> list[str]:
+        fresh = []
+        for msgs in responses:
+            for msg in m.select_new_messages(room, msgs):
+                mid = str(msg.get("id") or f"{msg.get('createdAt')}_{msg.get('cacheId')}")
+                if not m.is_duplicate_message(room, mid):
+                    fresh.append(mid)
+        return fresh
+
+    timings: Dict[str, float] = {}
+    outputs: Dict[str, list[str]] = {}
+    for label, fn in (("full", run_full), ("watermark", run_watermark)):
+
+        def fresh_run(fn=fn, label=label):
+            # 每轮都从空的去重存储与水位线开始
+            with isolated(
+                SEEN_MESSAGES={}, MESSAGE_WATERMARKS={}, SEEN_MESSAGES_DIRTY=False,
+                MESSAGE_SCAN_STATS=dict.fromkeys(m.MESSAGE_SCAN_STATS, 0),
+            ):
+                outputs[label] = fn()
+
+        timings[label] = best_of(fresh_run, rounds) * 1_000_000 / polls
+    result = {
+        "full_us_per_poll": timings["full"],
+        "watermark_us_per_poll": timings["watermark"],
+        "speedup": timings["full"] / timings["watermark"] if timings["watermark"] else 0.0,
+        "identical": outputs["full"] == outputs["watermark"],
+    }
+    print(
+        f"[基准] {polls} 次轮询，每次 {window} 条（新 {new_per_poll} 条）  逐条去重 {result['full_us_per_poll']:.1f}µs/次  "
+        f"水位线 {result['watermark_us_per_poll']:.1f}µs/次  加速 {result['speedup']:.1f}x  结果一致={result['identical']}"
+    )
+    return result
+
+
+# ---------- 房间状态 ----------
+def bench_room_state(rooms: int = 1000, polls_per_refresh: int = 12, rounds: int = 3):
+    """
+    rooms 个房间的运行时状态，对比旧的 dict 状态（每次刷新 uniq 复制重建、每次轮询拼请求头）
+    与 RoomState（原地换凭据、请求头随凭据缓存）的内存占用和 CPU 耗时。
+    一个周期 = 一次刷新 + polls_per_refresh 次轮询，每次轮询附带一次界面读取（状态/打赏字段）。
+    """
+    site = m.PRIMARY_SITE_ORIGIN
+    ua = m.DEFAULT_USER_AGENT
+    names = [f"bench_room_{i}" for i in range(rooms)]
+    cookie_sets = [
+        {"__cf_bm": f"cf{i:06d}" * 6, "stripchat_com_sessionId": f"s{i:08x}" * 4, "guestWatchHistoryIds": "", "alreadyVisited": "1"}
+        for i in range(rooms)
+    ]
+
+    def make_dict(name: str, i: int) -> Dict[str, Any]:
+        return {
+            "api_url": m.build_chat_api_url(site, name, f"uniq{i:08d}"), "cookies": cookie_sets[i], "ua": ua,
+            "site_origin": site, "last_refresh": time.time(), "online_status": True, "last_status_check": 0,
+            "uniq": f"uniq{i:08d}", "high_tip_count": 0, "last_high_tip": None, "status_loading": False,
+            "model_id": None, "last_menu_tip": None, "last_wheel_tip": None, "offline_check_count": 0,
+            "low_freq_mode": False, "credential_source": "playwright",
+        }
+
+    def make_slots(name: str, i: int) -> m.RoomState:
+        state = m.RoomState()
+        state.set_credentials(name, site, f"uniq{i:08d}", cookie_sets[i], ua, "playwright")
+        state.online_status = True
+        return state
+
+    def cycle_dict(table: Dict[str, Dict[str, Any]]):
+        for i, name in enumerate(names):
+            old_state = table[name]
+            table[name] = {
+                "api_url": m.build_chat_api_url(site, name, f"uniq{i:08d}"), "cookies": cookie_sets[i], "ua": ua,
+                "site_origin": site, "last_refresh": time.time(),
+                "online_status": old_state.get("online_status"),
+                "last_status_check": old_state.get("last_status_check", 0), "uniq": f"uniq{i:08d}",
+                "high_tip_count": old_state.get("high_tip_count", 0), "last_high_tip": old_state.get("last_high_tip"),
+                "status_loading": old_state.get("status_loading", True), "model_id": old_state.get("model_id"),
+                "last_menu_tip": old_state.get("last_menu_tip"), "last_wheel_tip": old_state.get("last_wheel_tip"),
+                "offline_check_count": old_state.get("offline_check_count", 0),
+                "low_freq_mode": old_state.get("low_freq_mode", False), "credential_source": "playwright",
+            }
+            for _ in range(polls_per_refresh):
+                state = table[name]
+                cookies = state.get("cookies", {})
+                headers = {
+                    "User-Agent": state.get("ua") or ua,
+                    "Accept": "application/json, text/plain, */*",
+                    "Referer": m.build_room_url(state.get("site_origin") or site, name),
+                    "Cookie": "; ".join([f"{k}={v}" for k, v in cookies.items()]),
+                }
+                ui_state = table.get(name) or {}
+                _ = (headers, ui_state.get("status_loading", False), ui_state.get("online_status"),
+                     ui_state.get("last_high_tip") or {}, ui_state.get("last_menu_tip"))
+
+    def cycle_slots(table: Dict[str, m.RoomState]):
+        for i, name in enumerate(names):
+            table[name].set_credentials(name, site, f"uniq{i:08d}", cookie_sets[i], ua, "playwright")
+            for _ in range(polls_per_refresh):
+                state = table[name]
+                headers = state.chat_headers
+                ui_state = table.get(name) or m.RoomState()
+                _ = (headers, ui_state.status_loading, ui_state.online_status,
+                     ui_state.last_high_tip or {}, ui_state.last_menu_tip)
+
+    result: Dict[str, float] = {
+        "dict_bytes_per_room": traced_bytes(lambda: [make_dict(n, i) for i, n in enumerate(names)]) / rooms,
+        "slots_bytes_per_room": traced_bytes(lambda: [make_slots(n, i) for i, n in enumerate(names)]) / rooms,
+        # 容器本身（不含字段值）：dict 的哈希表 vs 固定槽位
+        "dict_object_bytes": sys.getsizeof(make_dict(names[0], 0)),
+        "slots_object_bytes": sys.getsizeof(make_slots(names[0], 0)),
+    }
+    for label, factory, cycle in (("dict", make_dict, cycle_dict), ("slots", make_slots, cycle_slots)):
+        table = {name: factory(name, i) for i, name in enumerate(names)}
+        result[f"{label}_ms_per_cycle"] = best_of(lambda: cycle(table), rounds) * 1000
+    result["speedup"] = result["dict_ms_per_cycle"] / result["slots_ms_per_cycle"] if result["slots_ms_per_cycle"] else 0.0
+    print(
+        f"[基准] {rooms} 个房间  内存 dict {result['dict_bytes_per_room']:.0f}B/房间（容器 {result['dict_object_bytes']}B）  "
+        f"RoomState {result['slots_bytes_per_room']:.0f}B/房间（容器 {result['slots_object_bytes']}B，含缓存请求头）  "
+        f"每周期（1 次刷新 + {polls_per_refresh} 次轮询）dict {result['dict_ms_per_cycle']:.1f}ms  "
+        f"RoomState {result['slots_ms_per_cycle']:.1f}ms  加速 {result['speedup']:.1f}x"
+    )
+    return result
+
+
+# ---------- 消息分类 ----------
+def _legacy_clean_text(text):
+    """旧版菜单文本清理：每次调用都重新编译全部 emoji 正则。"""
+    if not text:
+        return ""
+    try:
+        if '\\u' in text:
+            text = text.encode().decode('unicode_escape')
+    except Exception:
+        pass
+    for pattern in [
+        re.compile("[\U0001F600-\U0001F64F]+", flags=re.UNICODE), re.compile("[\U0001F300-\U0001F5FF]+", flags=re.UNICODE),
+        re.compile("[\U0001F680-\U0001F6FF]+", flags=re.UNICODE), re.compile("[\U0001F1E0-\U0001F1FF]+", flags=re.UNICODE),
+        re.compile("[\U00002702-\U000027B0]+", flags=re.UNICODE), re.compile("[\U000024C2-\U000024FF]+", flags=re.UNICODE),
+        re.compile("[\U00002600-\U000026FF]+", flags=re.UNICODE), re.compile("[\U0001F900-\U0001F9FF]+", flags=re.UNICODE),
+        re.compile("[\U0001FA00-\U0001FAFF]+", flags=re.UNICODE),
+    ]:
+        text = pattern.sub('', text)
+    text = re.sub(r'[^\w\s\u4e00-\u9fff~-]', '', text)
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip().lower()
+
+
+def _legacy_menu_hit(cleaned_selected: str, cleaned_menu_body: str) -> bool:
+    return cleaned_selected == cleaned_menu_body or (
+        cleaned_selected in cleaned_menu_body
+        and len(cleaned_selected) >= max(3, int(len(cleaned_menu_body) * 0.3))
+    ) or (
+        cleaned_menu_body in cleaned_selected
+        and len(cleaned_menu_body) >= max(3, int(len(cleaned_selected) * 0.3))
+    )
+
+
+def bench_message_classifier(messages: int = 20000, selected: int = 20, streamers: int = 200, rounds: int = 3):
+    """
+    回放一段混合消息（聊天、普通/高额打赏、菜单打赏、转轮、达标），对比旧的逐条 if 链
+    （每条消息都解析金额/时间、拼日志字符串、线性查找主播配置，菜单打赏每次重新清理全部选中项）
+    与查表分类（RoomConfigSnapshot + MESSAGE_HANDLERS）的吞吐量，并校验两者命中的事件数一致。
+    """
+    room = "bench_classifier"
+    menu = [f"💃 Dance #{i} 跳舞{i} 🔥" for i in range(selected * 2)]
+    records = [{"username": f"bench_other_{i}", "threshold": 30.0} for i in range(streamers)]
+    records.append({"username": room, "threshold": 50.0, "selected_menu_items": menu[:selected], "running": True})
+    start_ts = datetime.now(timezone.utc) - timedelta(minutes=1)
+    payload = []
+    for i in range(messages):
+        msg: Dict[str, Any] = {"id": 50_000_000 + i, "createdAt": (start_ts + timedelta(microseconds=i)).isoformat(),
+                               "userData": {"username": f"user{i % 97}"}}
+        kind = i % 20
+        if kind < 12:
+            msg.update(type="text", details={"body": f"hello {i}"})
+        elif kind < 16:
+            msg.update(type="tip", details={"source": "", "amount": 10 if kind < 15 else 100})
+        elif kind == 16:
+            msg.update(type="tip", details={"source": "tipMenu", "amount": 25, "body": menu[i // 20 % len(menu)]})
+        elif kind == 17:
+            msg.update(type="tip", details={"source": "app_9", "amount": 20})
+        elif kind == 18:
+            msg.update(type="thresholdGoal", details={"goal": i % 2})
+        else:
+            msg.update(type="tip", details={"source": "interactiveToy", "amount": 5})
+        payload.append(msg)
+
+    def run_legacy() -> int:
+        # 旧 poll_room_tick 中每条消息的判定路径（省略状态写入与通知）
+        events = []
+        for msg in payload:
+            mid = str(msg.get("id"))
+            mtype = msg.get("type")
+            details = msg.get("details") or {}
+            amt = 0.0
+            if "amount" in details:
+                try:
+                    amt = float(details.get("amount", 0))
+                except Exception:
+                    amt = 0.0
+            user = (msg.get("userData") or {}).get("username") or (details.get("clientUserInfo") or {}).get("username")
+            ts = msg.get("createdAt")
+            if mtype == "thresholdGoal" and details.get("goal") == 0 and ts:
+                minutes_ago = m.get_minutes_ago(ts)
+                if minutes_ago is not None and minutes_ago <= 5:
+                    events.append("goal")
+            if mtype == "tip" and details.get("source") == "tipMenu":
+                menu_body = (details.get("body") or "").strip()
+                if menu_body and ts:
+                    tip_time = datetime.fromisoformat(ts.replace('Z', '+00:00'))
+                    if datetime.now(timezone.utc) - tip_time <= timedelta(minutes=5):
+                        selected_items = [s for s in m.get_streamer_selected_menu_items(room) if s and s.strip()]
+                        cleaned_menu_body = _legacy_clean_text(menu_body)
+                        for selected_item in selected_items:
+                            cleaned_selected = _legacy_clean_text(selected_item)
+                            if not cleaned_selected or not cleaned_menu_body:
+                                continue
+                            if _legacy_menu_hit(cleaned_selected, cleaned_menu_body):
+                                events.append(selected_item)
+                                break
+            if mtype == "tip" and details.get("source") == "app_9" and ts:
+                minutes_ago = m.get_minutes_ago(ts)
+                if minutes_ago is None or minutes_ago <= 5:
+                    events.append("wheel")
+            source = details.get("source", "")
+            threshold = m.get_streamer_threshold(room)
+            out = f"[{room}] [{ts}] type={mtype} user={user} amount={amt} id={mid}"
+            if mtype == "tip" and (source == "interactiveToy" or source == "") and amt >= threshold:
+                tip_time = datetime.fromisoformat(ts.replace('Z', '+00:00'))
+                if datetime.now(timezone.utc) - tip_time <= timedelta(minutes=5):
+                    events.append(out)
+        return len(events)
+
+    hits: list[str] = []
+
+    def run_table() -> int:
+        hits.clear()
+        state = m.RoomState()
+        config = m.RoomConfigSnapshot(room)
+        for msg in payload:
+            m.classify_message(room, state, config, msg, str(msg.get("id")))
+        return len(hits)
+
+    timings: Dict[str, float] = {}
+    counts: Dict[str, int] = {}
+    # 事件时间严格递增，每次命中都会调用一次 prioritize_streamer_on_event，据此计数
+    with isolated(
+        STREAMERS=m.StreamerRegistry(records),
+        MENU_MATCHERS={},
+        MENU_MATCH_STATS=dict.fromkeys(m.MENU_MATCH_STATS, 0),
+        notify_print_and_telegram=lambda text, priority=None: None,
+        browser_notify=lambda title, body, priority=None: None,
+        prioritize_streamer_on_event=hits.append,
+        VERBOSE=False,
+    ):
+        for label, fn in (("legacy", run_legacy), ("table", run_table)):
+
+            def counted(fn=fn, label=label):
+                counts[label] = fn()
+
+            timings[label] = best_of(counted, rounds)
+    result = {
+        "legacy_msgs_per_sec": messages / timings["legacy"],
+        "table_msgs_per_sec": messages / timings["table"],
+        "speedup": timings["legacy"] / timings["table"] if timings["table"] else 0.0,
+        "events": counts["table"],
+        "identical": counts["legacy"] == counts["table"],
+    }
+    print(
+        f"[基准] {messages} 条消息（选中 {selected} 个菜单项，{streamers + 1} 位主播）  "
+        f"if 链 {result['legacy_msgs_per_sec']:,.0f} 条/秒  查表 {result['table_msgs_per_sec']:,.0f} 条/秒  "
+        f"加速 {result['speedup']:.1f}x  事件 {result['events']}  结果一致={result['identical']}"
+    )
+    return result
+
+
+# ---------- 菜单匹配 ----------
+def bench_menu_matcher(selected_counts: tuple[int, ...] = (5, 20, 50, 200), bodies: int = 2000, rounds: int = 3):
+    """
+    不同选中项数量下，对比逐项清理+比较（旧做法，每条菜单打赏都重新清理全部选中项）
+    与 MenuMatcher（预先构建索引）的单条匹配耗时，并校验两者结果一致。
+    MenuMatcher 分两种情况：冷（每条文本都不同，走自动机）与热（文本来自固定菜单，命中结果缓存）。
+    """
+    clean = m.clean_menu_text.__wrapped__  # 不带缓存的清理函数，还原旧做法的开销
+    menu = [f"💃 Dance #{i} 跳舞{i} 🔥" if i % 3 else f"Flash 😍 show {i} 分钟" for i in range(max(selected_counts) * 2)]
+
+    def linear_match(menu_body: str, selected_items: list[str]):
+        cleaned_menu_body = clean(menu_body)
+        if not cleaned_menu_body:
+            return None
+        for selected_item in selected_items:
+            cleaned_selected = clean(selected_item)
+            if cleaned_selected and _legacy_menu_hit(cleaned_selected, cleaned_menu_body):
+                return selected_item, cleaned_selected, cleaned_menu_body
+        return None
+
+    rows = []
+    with isolated(MENU_MATCH_STATS=dict.fromkeys(m.MENU_MATCH_STATS, 0)):
+        for count in selected_counts:
+            selected_items = menu[:count]
+            warm_bodies = [menu[(i * 7) % len(menu)] for i in range(bodies)]
+            cold_bodies = [f"{body} #{i}" for i, body in enumerate(warm_bodies)]
+            start = time.perf_counter()
+            matcher = m.MenuMatcher(selected_items)
+            build_ms = (time.perf_counter() - start) * 1000
+
+            def run_cold():
+                matcher._candidate_cache.clear()
+                m.clean_menu_text.cache_clear()
+                return [matcher.match(body) for body in cold_bodies]
+
+            row = {
+                "selected": count,
+                "build_ms": build_ms,
+                "linear_us": best_of(lambda: [linear_match(body, selected_items) for body in cold_bodies], rounds)
+                * 1_000_000 / bodies,
+                "index_cold_us": best_of(run_cold, rounds) * 1_000_000 / bodies,
+                "index_warm_us": best_of(lambda: [matcher.match(body) for body in warm_bodies], rounds)
+                * 1_000_000 / bodies,
+                "identical": run_cold() == [linear_match(body, selected_items) for body in cold_bodies]
+                and [matcher.match(body) for body in warm_bodies] == [linear_match(body, selected_items) for body in warm_bodies],
+            }
+            rows.append(row)
+            print(
+                f"[基准] 选中 {count} 项（建索引 {row['build_ms']:.1f}ms）  逐项比较 {row['linear_us']:.1f}µs/条  "
+                f"索引（冷）{row['index_cold_us']:.1f}µs/条  索引（热）{row['index_warm_us']:.2f}µs/条  结果一致={row['identical']}"
+            )
+    return rows
+
+
+# ---------- 已处理消息 id 存储 ----------
+def bench_seen_store(sample_rooms: int = 50, ids_per_room: int = 1000, stream: int = 20000, rounds: int = 3):
+    """
+    已处理消息 id 的存储，对比旧的 {id 字符串: 时间戳} 字典（超过 4000 条复制键列表删掉最早 1000 条）
+    与 SeenIdRing（整数环形缓冲 + 有序数组）的内存（换算成每 1000 个房间）、去重耗时与快照大小。
+    """
+    capacity = m.SEEN_ID_CAPACITY
+    legacy_limit, legacy_prune = 4000, 1000
+    base_id = 2_000_000_000
+
+    def legacy_add(seen_map: Dict[str, float], key: str) -> bool:
+        if key in seen_map:
+            return False
+        seen_map[key] = time.time()
+        if len(seen_map) > legacy_limit:
+            for old_key in list(seen_map.keys())[:legacy_prune]:
+                seen_map.pop(old_key, None)
+        return True
+
+    def fill_legacy(count: int):
+        return [
+            {str(base_id + r * 100_000 + i): time.time() for i in range(count)}
+            for r in range(sample_rooms)
+        ]
+
+    def fill_ring(count: int):
+        stores = []
+        for r in range(sample_rooms):
+            store = m.SeenIdRing(capacity)
+            for i in range(count):
+                store.add(m.seen_message_key(str(base_id + r * 100_000 + i)))
+            stores.append(store)
+        return stores
+
+    def mb_per_1000_rooms(fill, count: int) -> float:
+        return traced_bytes(lambda: fill(count)) * (1000 / sample_rooms) / (1024 * 1024)
+
+    # 每条新消息会在之后几次轮询的响应中重复出现，按每个 id 查询 4 次回放
+    ids = [str(base_id + i // 4 + (i % 4) * 3) for i in range(stream)]
+
+    def run_legacy():
+        seen_map: Dict[str, float] = {}
+        for key in ids:
+            legacy_add(seen_map, key)
+
+    def run_ring():
+        store = m.SeenIdRing(capacity)
+        for key in ids:
+            store.add(m.seen_message_key(key))
+
+    legacy_steady = legacy_limit - legacy_prune // 2  # 旧字典在 3000~4000 条之间来回
+    result: Dict[str, float] = {
+        "legacy_mb_at_capacity": mb_per_1000_rooms(fill_legacy, capacity),
+        "ring_mb_at_capacity": mb_per_1000_rooms(fill_ring, capacity),
+        "legacy_mb_steady": mb_per_1000_rooms(fill_legacy, legacy_steady),
+        "ring_mb_per_100_ids": mb_per_1000_rooms(fill_ring, min(100, ids_per_room)),
+        "legacy_us_per_msg": best_of(run_legacy, rounds) * 1_000_000 / stream,
+        "ring_us_per_msg": best_of(run_ring, rounds) * 1_000_000 / stream,
+    }
+    # 快照：1000 个房间、每个房间保存 SEEN_SNAPSHOT_IDS 条 id 与水位线
+    sample = fill_ring(ids_per_room)[0]
+    payload = {"saved_at": time.time(), "rooms": {
+        f"bench_room_{r}": {"ids": sample.recent(m.SEEN_SNAPSHOT_IDS), "watermark": base_id + r} for r in range(1000)
+    }}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time.perf_counter()
+        result["snapshot_bytes"] = m._write_seen_snapshot(payload, os.path.join(tmp_dir, "seen_messages.json"))
+        result["snapshot_ms"] = (time.perf_counter() - start) * 1000
+    print(
+        f"[基准] 每 1000 个房间  旧字典 {result['legacy_mb_at_capacity']:.1f}MB（{capacity} 条/房间），"
+        f"稳态 {result['legacy_mb_steady']:.1f}MB（约 {legacy_steady} 条）  SeenIdRing {result['ring_mb_at_capacity']:.1f}MB"
+        f"（满 {capacity} 条），{result['ring_mb_per_100_ids']:.1f}MB（100 条）  "
+        f"去重 旧 {result['legacy_us_per_msg']:.2f}µs/条  新 {result['ring_us_per_msg']:.2f}µs/条  "
+        f"快照 {result['snapshot_bytes'] / 1024:.0f}KB / {result['snapshot_ms']:.0f}ms"
+    )
+    return result
+
+
+# ---------- 主播列表索引 ----------
+def bench_streamer_registry(sizes: tuple[int, ...] = (100, 1000, 5000), lookups: int = 4000, rounds: int = 3):
+    """
+    不同主播数量下按用户名查找主播记录，对比原先的线性扫描与 StreamerRegistry 的字典索引，
+    并给出一次调整顺序（切片赋值、重建索引）的耗时。
+    """
+    def linear_find(records: list, username: str):
+        for idx, streamer in enumerate(records):
+            if m.get_streamer_username(streamer) == username:
+                return idx, streamer
+        return None, None
+
+    rng = random.Random(0)
+    rows = []
+    for size in sizes:
+        records = [{"username": f"bench_streamer_{i}", "running": True, "threshold": 30.0} for i in range(size)]
+        registry = m.StreamerRegistry(records)
+        names = [f"bench_streamer_{rng.randrange(size)}" for _ in range(lookups)]
+        linear = best_of(lambda: [linear_find(records, name) for name in names], rounds)
+        indexed = best_of(lambda: [registry.get(name) for name in names], rounds)
+        identical = all(linear_find(records, name)[1] is registry.get(name) for name in names[:200])
+        shuffled = list(records)
+        rng.shuffle(shuffled)
+        reorder = best_of(lambda: registry.__setitem__(slice(None), shuffled), rounds)
+        row = {
+            "streamers": size,
+            "linear_us": linear * 1_000_000 / lookups,
+            "indexed_us": indexed * 1_000_000 / lookups,
+            "reorder_ms": reorder * 1000,
+            "identical": identical,
+        }
+        rows.append(row)
+        print(
+            f"[基准] {size} 位主播  线性查找 {row['linear_us']:.2f}µs/次  索引 {row['indexed_us']:.3f}µs/次  "
+            f"加速 {row['linear_us'] / row['indexed_us']:.0f}x  调整顺序（重建索引）{row['reorder_ms']:.2f}ms  结果一致={row['identical']}"
+        )
+    return rows
+
+
+BENCHMARKS: Dict[str, Callable[..., Any]] = {
+    "capture_profiles": bench_capture_profiles,
+    "uniq_extraction": bench_uniq_extraction,
+    "message_scan": bench_message_scan,
+    "room_state": bench_room_state,
+    "message_classifier": bench_message_classifier,
+    "menu_matcher": bench_menu_matcher,
+    "seen_store": bench_seen_store,
+    "streamer_registry": bench_streamer_registry,
+}
+
+
+def main(argv: list[str]) -> int:
+    if not argv:
+        print("可用的基准: " + " ".join(BENCHMARKS))
+        return 0
+    name, args = argv[0], argv[1:]
+    if name == "all":
+        for key, fn in BENCHMARKS.items():
+            if key != "capture_profiles":
+                fn()
+        return 0
+    fn = BENCHMARKS.get(name)
+    if fn is None:
+        print(f"未知的基准: {name}（可用: {' '.join(BENCHMARKS)}）")
+        return 2
+    result = fn(*args)
+    if asyncio.iscoroutine(result):
+        asyncio.run(result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -340,7 +340,7 @@ fn check_python_deps(python: &Path, cwd: &Path) -> bool {
     let mut cmd = Command::new(python);
     cmd.args([
         "-c",
-        "import aiohttp,aiohttp_socks,certifi,nicegui,playwright,requests;print('ok')",
+        "import aiohttp,aiohttp_socks,certifi,nicegui,playwright;print('ok')",
     ])
     .current_dir(cwd);
     run_command(cmd).is_ok()
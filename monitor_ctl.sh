@@ -11,7 +11,7 @@
 #   SUPERCHAT_PYTHON     指定 Python 可执行文件（否则自动探测）
 #   SUPERCHAT_RUNTIME_DIR / SUPERCHAT_DATA_DIR
 #     桌面版 DMG 使用：脚本与 monitor_tip.py 在只读 RUNTIME_DIR；
-#     venv、streamers.json、日志、pid 在可写 DATA_DIR（需同时设置两者）
+#     venv、streamers.json、credentials_cache.json、seen_messages.json、日志、pid 在可写 DATA_DIR（需同时设置两者）
 
 set -euo pipefail
 
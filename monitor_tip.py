@@ -6,17 +6,18 @@ multi_room_monitor_playwright.py
 长期稳定监控高额打赏。
 
 依赖:
-  pip install playwright aiohttp requests
+  pip install playwright aiohttp
   python -m playwright install chromium
 """
 
-import asyncio, re, os, ssl, time, json, subprocess
+import asyncio, bisect, functools, hashlib, heapq, random, re, os, signal, ssl, time, json, subprocess
 import urllib.parse as up
+from array import array
+from collections import deque
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Any
+from typing import Any, Callable, Dict
 from aiohttp_socks import ProxyConnector
 import aiohttp
-import requests
 
 # Playwright Python 默认会使用其自带的 driver/node。
 # 若用户环境里设置了 PLAYWRIGHT_NODEJS_PATH，可能会强制使用系统 Node（例如 v24），
@@ -42,7 +43,7 @@ def _configure_trusted_ca_bundle() -> str | None:
 
 _CA_BUNDLE_PATH = _configure_trusted_ca_bundle()
 
-from playwright.sync_api import sync_playwright
+from playwright.async_api import async_playwright
 from nicegui import ui, app
 
 PROXY = ""  # v2rayN 的本地 SOCKS5 代理端口
@@ -56,17 +57,48 @@ def _aiohttp_ssl_param() -> ssl.SSLContext | bool:
 
 def make_aiohttp_connector():
     ssl_param = _aiohttp_ssl_param()
+    # 连接池参数见配置区 HTTP_POOL_*；SOCKS 代理的 ProxyConnector 同样是 TCPConnector，参数一致
+    pool_kwargs = {
+        "limit": HTTP_POOL_LIMIT,
+        "limit_per_host": HTTP_POOL_LIMIT_PER_HOST,
+        "keepalive_timeout": HTTP_KEEPALIVE_SEC,
+        "use_dns_cache": HTTP_DNS_CACHE_TTL > 0,
+        "ttl_dns_cache": HTTP_DNS_CACHE_TTL or None,
+    }
     if PROXY:
-        return ProxyConnector.from_url(PROXY, ssl=ssl_param)
-    return aiohttp.TCPConnector(ssl=ssl_param)
+        return ProxyConnector.from_url(PROXY, ssl=ssl_param, **pool_kwargs)
+    return aiohttp.TCPConnector(ssl=ssl_param, **pool_kwargs)
 
 # ---------- 配置区 ----------
+def _env_int(name: str, default: int, minimum: int | None = None) -> int:
+    """读取整数型环境变量，非法值回退为默认值。"""
+    try:
+        value = int(str(os.getenv(name, "")).strip() or default)
+    except ValueError:
+        value = default
+    if minimum is not None and value < minimum:
+        value = minimum
+    return value
+
+
 _SUPERCHAT_DATA = os.environ.get("SUPERCHAT_DATA_DIR", "").strip()
 STREAMERS_FILE = (
     os.path.join(_SUPERCHAT_DATA, "streamers.json")
     if _SUPERCHAT_DATA
     else "streamers.json"
 )
+# uniq/cookies/UA 磁盘缓存：重启后优先复用，避免所有房间重新走 Playwright
+CREDENTIALS_FILE = (
+    os.path.join(_SUPERCHAT_DATA, "credentials_cache.json")
+    if _SUPERCHAT_DATA
+    else "credentials_cache.json"
+)
+# 最近处理过的消息 id 与水位线快照：重启后不再重复提醒最近的事件
+SEEN_MESSAGES_FILE = (
+    os.path.join(_SUPERCHAT_DATA, "seen_messages.json")
+    if _SUPERCHAT_DATA
+    else "seen_messages.json"
+)
 
 # 主站点与镜像站点配置（默认以 stripchat 为主，兼容 superchat 镜像）
 def _normalize_site_origin(value: str) -> str:
@@ -114,16 +146,16 @@ def get_site_candidates(preferred_origin: str | None = None) -> list[str]:
 
 
 def get_streamer_site_origin(username: str) -> str:
-    _, streamer = find_streamer_by_username(username)
+    streamer = get_streamer(username)
     if isinstance(streamer, dict):
         site = _normalize_site_origin(str(streamer.get("site") or ""))
         if site:
             return site
-    state = ROOM_STATE.get(username) or {}
-    state_site = _normalize_site_origin(str(state.get("site_origin") or ""))
+    state = ROOM_STATE.get(username)
+    state_site = _normalize_site_origin(str(state.site_origin or "")) if state else ""
     if state_site:
         return state_site
-    api_url = state.get("api_url")
+    api_url = state.api_url if state else None
     if isinstance(api_url, str) and api_url:
         try:
             parsed = up.urlparse(api_url)
@@ -155,6 +187,127 @@ def build_suggestion_api_url(site_origin: str, username: str, uniq: str) -> str:
         f"?query={username}&limit=10&primaryTag=girls&rcmGrp=A&oRcmGrp=A&uniq={uniq}"
     )
 
+# 主播列表：保持显示顺序的列表 + 用户名索引
+class StreamerRegistry(list):
+    """
+    主播记录列表（STREAMERS）。列表本身保存显示顺序，另维护 用户名 -> 记录 的字典索引，按用户名查找是 O(1)。
+    所有改变成员的列表操作（append / insert / remove / pop / del / 下标赋值等）只更新涉及的用户名，
+    调整顺序（sort、STREAMERS[:] = 新顺序等切片操作）会整体重建索引，与调整顺序本身同为 O(n) 级别。
+    改名必须通过 rename()，直接改记录里的 username 索引不会感知。
+    同名记录（正常不会出现）以列表中靠前的为准，与原先线性查找的结果一致。
+    """
+
+    def __init__(self, records=()):
+        super().__init__(records)
+        self._index: Dict[str, dict] = {}
+        self._reindex()
+
+    def _reindex(self):
+        self._index = {}
+        for record in self:
+            name = get_streamer_username(record)
+            if name:
+                self._index.setdefault(name, record)
+
+    def _reindex_name(self, name: str):
+        # 只在删除/改名/插入同名记录时按名字重新找第一条，常规路径不扫描
+        if not name:
+            return
+        for record in self:
+            if get_streamer_username(record) == name:
+                self._index[name] = record
+                return
+        self._index.pop(name, None)
+
+    def _added(self, record):
+        name = get_streamer_username(record)
+        if name and name in self._index:
+            self._reindex_name(name)
+        elif name:
+            self._index[name] = record
+
+    def _removed(self, record):
+        name = get_streamer_username(record)
+        if name and self._index.get(name) is record:
+            self._reindex_name(name)
+
+    def get(self, username: str) -> dict | None:
+        """按用户名取记录，不存在时返回 None。"""
+        return self._index.get(username)
+
+    def position(self, record) -> int | None:
+        """记录在列表中的位置（按对象比较，只在调整顺序时使用）。"""
+        for idx, item in enumerate(self):
+            if item is record:
+                return idx
+        return None
+
+    def rename(self, record: dict, new_username: str):
+        old_username = get_streamer_username(record)
+        record["username"] = new_username
+        self._reindex_name(old_username)
+        self._reindex_name(new_username)
+
+    def append(self, record):
+        super().append(record)
+        self._added(record)
+
+    def insert(self, index, record):
+        super().insert(index, record)
+        self._added(record)
+
+    def extend(self, records):
+        super().extend(records)
+        self._reindex()
+
+    def __iadd__(self, records):
+        super().__iadd__(records)
+        self._reindex()
+        return self
+
+    def __imul__(self, n):
+        super().__imul__(n)
+        self._reindex()
+        return self
+
+    def remove(self, record):
+        # list.remove / list.index 都按 == 比较，可能删掉另一条内容相同的记录，这里按对象定位
+        idx = self.position(record)
+        if idx is None:
+            raise ValueError("StreamerRegistry.remove(x): x not in list")
+        self._removed(super().pop(idx))
+
+    def pop(self, index=-1):
+        record = super().pop(index)
+        self._removed(record)
+        return record
+
+    def clear(self):
+        super().clear()
+        self._index.clear()
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self._reindex()
+
+    def __setitem__(self, key, value):
+        if isinstance(key, slice):
+            super().__setitem__(key, value)
+            self._reindex()
+            return
+        old = self[key]
+        super().__setitem__(key, value)
+        self._removed(old)
+        self._added(value)
+
+    def __delitem__(self, key):
+        if isinstance(key, slice):
+            super().__delitem__(key)
+            self._reindex()
+            return
+        self._removed(super().pop(key))
+
+
 # 数据持久化函数
 def load_streamers():
     """从文件加载主播列表（字典格式）"""
@@ -164,7 +317,7 @@ def load_streamers():
             with open(STREAMERS_FILE, 'r', encoding='utf-8') as f:
                 data = json.load(f)
                 if isinstance(data, dict) and "streamers" in data:
-                    STREAMERS = data["streamers"]
+                    STREAMERS = StreamerRegistry(data["streamers"])
                     # 确保所有元素都是字典格式，并确保有必要的键
                     for s in STREAMERS:
                         if not isinstance(s, dict):
@@ -179,13 +332,13 @@ def load_streamers():
                         if "selected_menu_items" not in s:
                             s["selected_menu_items"] = []  # 选中的菜单项
                 else:
-                    STREAMERS = []
+                    STREAMERS = StreamerRegistry()
         else:
-            STREAMERS = []
+            STREAMERS = StreamerRegistry()
             save_streamers()
     except Exception as e:
         print(f"加载主播列表失败: {e}")
-        STREAMERS = []
+        STREAMERS = StreamerRegistry()
 
 def save_streamers():
     """保存主播列表到文件（字典格式）"""
@@ -225,37 +378,41 @@ def get_streamer_username(streamer):
         return streamer.get("username", "")
     return ""
 
+def get_streamer(username):
+    """根据用户名查找主播字典（O(1)，走 STREAMERS 的用户名索引），不存在时返回 None"""
+    return STREAMERS.get(username)
+
 def find_streamer_by_username(username):
-    """根据用户名查找主播字典，返回索引和字典"""
-    for idx, streamer in enumerate(STREAMERS):
-        if get_streamer_username(streamer) == username:
-            return idx, streamer
-    return None, None
+    """根据用户名查找主播字典，返回索引和字典；只需要字典时用 get_streamer（不必计算位置）"""
+    streamer = STREAMERS.get(username)
+    if streamer is None:
+        return None, None
+    return STREAMERS.position(streamer), streamer
 
 def get_streamer_running(username):
     """获取主播的 running 状态"""
-    _, streamer = find_streamer_by_username(username)
+    streamer = get_streamer(username)
     if streamer:
         return streamer.get("running", False)
     return False
 
 def set_streamer_running(username, running):
     """设置主播的 running 状态并保存"""
-    idx, streamer = find_streamer_by_username(username)
+    streamer = get_streamer(username)
     if streamer is not None:
         streamer["running"] = running
         save_streamers()
 
 def get_streamer_threshold(username):
     """获取主播的打赏金额提醒阈值"""
-    _, streamer = find_streamer_by_username(username)
+    streamer = get_streamer(username)
     if streamer:
         return streamer.get("threshold", 30.0)
     return 30.0
 
 def set_streamer_threshold(username, threshold):
     """设置主播的打赏金额提醒阈值并保存"""
-    idx, streamer = find_streamer_by_username(username)
+    streamer = get_streamer(username)
     if streamer is not None:
         try:
             streamer["threshold"] = float(threshold)
@@ -265,37 +422,41 @@ def set_streamer_threshold(username, threshold):
 
 def get_streamer_menu_items(username):
     """获取主播的完整菜单项列表"""
-    _, streamer = find_streamer_by_username(username)
+    streamer = get_streamer(username)
     if streamer:
         return streamer.get("menu_items", [])
     return []
 
 def set_streamer_menu_items(username, menu_items):
     """设置主播的完整菜单项列表并保存"""
-    idx, streamer = find_streamer_by_username(username)
+    streamer = get_streamer(username)
     if streamer is not None:
         streamer["menu_items"] = menu_items
+        rebuild_menu_matcher(username)
         save_streamers()
 
 def get_streamer_selected_menu_items(username):
     """获取主播的选中菜单项列表"""
-    _, streamer = find_streamer_by_username(username)
+    streamer = get_streamer(username)
     if streamer:
         return streamer.get("selected_menu_items", [])
     return []
 
 def set_streamer_selected_menu_items(username, selected_items):
     """设置主播的选中菜单项列表并保存"""
-    idx, streamer = find_streamer_by_username(username)
+    streamer = get_streamer(username)
     if streamer is not None:
         streamer["selected_menu_items"] = selected_items
+        rebuild_menu_matcher(username)
         save_streamers()
 
 def update_streamer_username(old_username: str, new_username: str):
     """更新主播的用户名并保存，同时更新UI绑定"""
-    idx, streamer = find_streamer_by_username(old_username)
+    streamer = get_streamer(old_username)
     if streamer is not None:
-        streamer["username"] = new_username
+        STREAMERS.rename(streamer, new_username)
+        MENU_MATCHERS.pop(old_username, None)
+        move_seen_messages(old_username, new_username)
         save_streamers()
         print(f"[系统] 已更新用户名: {old_username} -> {new_username}")
         
@@ -320,10 +481,90 @@ ensure_stopped_streamers_at_end(persist=True)
 THRESHOLD = 30.0
 POLL_INTERVAL = 5        # 轮询间隔（直播中）
 OFFLINE_POLL_INTERVAL = 600  # 已下播后的低频轮询间隔（10分钟 = 600秒）
+# 自适应轮询：按消息速率在 [MIN, MAX] 间调整直播中房间的轮询间隔，POLL_INTERVAL 为初始值
+POLL_INTERVAL_MIN = _env_int("SUPERCHAT_POLL_INTERVAL_MIN", 2, minimum=1)
+POLL_INTERVAL_MAX = _env_int("SUPERCHAT_POLL_INTERVAL_MAX", 15, minimum=1)
+POLL_EVENT_BOOST_SEC = _env_int("SUPERCHAT_POLL_EVENT_BOOST_SEC", 60, minimum=0)  # 打赏/转轮/达标事件后多少秒内按最短间隔轮询
+POLL_EWMA_ALPHA = 0.3  # 新消息数 EWMA 的平滑系数
+POLL_OVERFLOW_FRACTION = 0.8  # 接近满窗口的响应中新消息占比超过此值，视为可能漏消息
+# 轮询调度器：所有房间共用固定数量的 worker，到期时间加随机抖动以错开请求
+POLL_WORKERS = _env_int("SUPERCHAT_POLL_WORKERS", 16, minimum=1)
+POLL_JITTER_PERCENT = _env_int("SUPERCHAT_POLL_JITTER_PERCENT", 10, minimum=0)  # 间隔的 ±百分比
 REFRESH_UNIQ_INTERVAL = 60 # 每多少秒强制刷新一次 uniq（避免长连接失效）
+# 刚刷新的 uniq 又被拒绝（如 Cloudflare 拦截页）时逐次加倍等待（5 秒起），成功轮询一次后清零
+REJECTED_UNIQ_BACKOFF_MAX = _env_int("SUPERCHAT_REJECTED_UNIQ_BACKOFF_MAX_SEC", 300, minimum=5)
 ONLINE_CHECK_INTERVAL = 180  # 直播中轮询suggestion API的检查间隔（3分钟），用于及时检测下播
+STATUS_CACHE_TTL = _env_int("SUPERCHAT_STATUS_CACHE_TTL", 30, minimum=0)  # suggestion 响应中其他主播状态的复用时长（秒），0 关闭
 VERBOSE = True
 
+# Playwright 浏览器池：常驻 Chromium，每次刷新 uniq 只分配 BrowserContext，避免反复冷启动浏览器
+BROWSER_POOL_SIZE = _env_int("SUPERCHAT_BROWSER_POOL_SIZE", 2, minimum=1)  # 常驻浏览器数量（即最大并发抓取数）
+BROWSER_CONTEXT_MAX_USES = _env_int("SUPERCHAT_BROWSER_CONTEXT_MAX_USES", 20, minimum=1)  # 单个 context 复用多少次后重建
+# 凭据抓取准入队列：限制同时进行的抓取数，排队的房间按 直播中 > 近期有事件 > 其他 的优先级放行
+# 准入是浏览器抓取唯一的并发闸门：上限不超过浏览器数量，浏览器池本身永远不会让抓取排队
+BROWSER_ADMISSION_MAX = min(
+    _env_int("SUPERCHAT_BROWSER_MAX_LAUNCHES", BROWSER_POOL_SIZE, minimum=1), BROWSER_POOL_SIZE
+)  # 同时进行的抓取数上限
+BROWSER_ADMISSION_QUEUE_MAX = _env_int("SUPERCHAT_BROWSER_QUEUE_MAX", 100, minimum=1)  # 最多排队的抓取请求数
+ROOM_EVENT_PRIORITY_WINDOW = 30 * 60  # 多少秒内有过监控事件的房间算“近期有事件”
+# 浏览器内存看门狗：浏览器子系统总 RSS 超过上限或浏览器运行过久时，在空闲时重启浏览器
+BROWSER_MEMORY_CEILING_MB = _env_int("SUPERCHAT_BROWSER_MEMORY_CEILING_MB", 1500, minimum=0)  # 0 表示不按内存回收
+BROWSER_MAX_AGE_SEC = _env_int("SUPERCHAT_BROWSER_MAX_AGE_SEC", 6 * 3600, minimum=0)  # 0 表示不按运行时长回收
+BROWSER_WATCHDOG_INTERVAL = _env_int("SUPERCHAT_BROWSER_WATCHDOG_INTERVAL", 60, minimum=5)  # 检查间隔（秒）
+# 抓取配置：lite 拦截与触发 chat XHR 无关的资源（视频流、图片、字体、样式等），full 为完整加载页面
+CAPTURE_PROFILE = (os.getenv("SUPERCHAT_CAPTURE_PROFILE", "lite") or "lite").strip().lower()
+CAPTURE_PROFILES: Dict[str, frozenset[str]] = {
+    "full": frozenset(),
+    "lite": frozenset({"media", "image", "font", "stylesheet", "texttrack", "manifest"}),
+}
+_capture_block_env = os.getenv("SUPERCHAT_CAPTURE_BLOCK_TYPES")
+CAPTURE_BLOCK_TYPES_OVERRIDE = (
+    frozenset(t.strip().lower() for t in re.split(r"[,;\s]+", _capture_block_env) if t.strip())
+    if _capture_block_env is not None
+    else None
+)
+DEFAULT_USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/109.0.0.0 Safari/537.36"
+HTTP_FAST_PATH_ENABLED = _env_int("SUPERCHAT_HTTP_FAST_PATH", 1) != 0  # 先用纯 HTTP 请求主页提取 uniq，失败再启动浏览器
+CREDENTIAL_CACHE_TTL = _env_int("SUPERCHAT_CREDENTIAL_CACHE_TTL", 6 * 3600, minimum=0)  # 缓存凭据有效期（秒），0 表示不使用缓存
+CREDENTIAL_RENEW_ENABLED = _env_int("SUPERCHAT_CREDENTIAL_RENEW", 1) != 0  # 按观测到的凭据寿命在失效前主动续期
+CREDENTIAL_RENEW_LEAD_SEC = _env_int("SUPERCHAT_CREDENTIAL_RENEW_LEAD_SEC", 30, minimum=0)  # 预计失效前多少秒开始续期
+CREDENTIAL_RENEW_MIN_SAMPLES = 3  # 站点至少观测到几次失效才开始预测
+CREDENTIAL_RENEW_CHECK_INTERVAL = 5  # 续期任务的检查间隔（秒）
+CREDENTIAL_GRACE_SEC = _env_int("SUPERCHAT_CREDENTIAL_GRACE_SEC", 10, minimum=0)  # 刚获取的凭据在此窗口内直接复用，不再重复抓取
+SEEN_ID_CAPACITY = _env_int("SUPERCHAT_SEEN_ID_CAPACITY", 4000, minimum=100)  # 每个房间记住最近多少条消息 id（chat 接口每次返回的消息远少于此）
+SEEN_SNAPSHOT_INTERVAL = _env_int("SUPERCHAT_SEEN_SNAPSHOT_SEC", 30, minimum=0)  # 已处理消息快照写盘间隔（秒），0 表示不持久化
+SEEN_SNAPSHOT_IDS = 200  # 快照中每个房间保存最近多少条 id（覆盖一次 chat 响应即可）
+# 共享 aiohttp 会话的连接池（所有房间共用一个 connector），limit / limit_per_host 为 0 表示不限制
+HTTP_POOL_LIMIT = _env_int("SUPERCHAT_HTTP_POOL_LIMIT", 100, minimum=0)  # 总连接数上限，超出的请求排队等待空闲连接
+HTTP_POOL_LIMIT_PER_HOST = _env_int("SUPERCHAT_HTTP_POOL_LIMIT_PER_HOST", 0, minimum=0)  # 单个目标站点的连接数上限
+HTTP_KEEPALIVE_SEC = _env_int("SUPERCHAT_HTTP_KEEPALIVE_SEC", 30, minimum=1)  # 空闲连接保留多久（秒），应不短于常见轮询间隔
+HTTP_DNS_CACHE_TTL = _env_int("SUPERCHAT_HTTP_DNS_CACHE_TTL", 300, minimum=0)  # 本地 DNS 缓存时长（秒），0 关闭
+HTTP_CONNECT_TIMEOUT = _env_int("SUPERCHAT_HTTP_CONNECT_TIMEOUT", 10, minimum=1)  # 建立 TCP/代理连接的超时（秒）
+
+
+def _endpoint_timeout(endpoint: str, total: int, read: int) -> aiohttp.ClientTimeout:
+    """
+    单个接口的超时：SUPERCHAT_HTTP_TIMEOUT_<接口> 为总时长，..._READ 为两次读取之间的最长间隔。
+    连接超时只限制建立套接字（sock_connect），在连接池中排队的时间只受总时长约束。
+    """
+    prefix = f"SUPERCHAT_HTTP_TIMEOUT_{endpoint.upper()}"
+    total = _env_int(prefix, total, minimum=1)
+    return aiohttp.ClientTimeout(
+        total=total,
+        sock_connect=min(HTTP_CONNECT_TIMEOUT, total),
+        sock_read=min(_env_int(f"{prefix}_READ", read, minimum=1), total),
+    )
+
+
+HTTP_TIMEOUTS: Dict[str, aiohttp.ClientTimeout] = {
+    "chat": _endpoint_timeout("chat", 15, 10),  # /chat 消息轮询
+    "cam": _endpoint_timeout("cam", 15, 10),  # /cam 菜单与直播间信息
+    "suggestion": _endpoint_timeout("suggestion", 10, 8),  # 直播状态检查
+    "room_page": _endpoint_timeout("room_page", 15, 10),  # HTTP 快速通道请求主播主页
+    "telegram": _endpoint_timeout("telegram", 10, 10),  # Telegram 通知
+    "bark": _endpoint_timeout("bark", 4, 4),  # 手机推送通知
+}
+
 # Telegram 推送（环境变量或直接写在这里）
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN","")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID","")
@@ -334,16 +575,28 @@ PHONE_PUSH_BASE_URL = os.getenv(
     "PHONE_PUSH_BASE_URL",
     "https://api.day.app/3oaR7upc6nHQkCPDCAuM3m",
 )
+# 通知派发：Telegram / 手机推送各自一个有界队列，按 高(打赏等事件) > 普通 > 低(直播状态变化) 分道发送
+NOTIFY_QUEUE_MAX = _env_int("SUPERCHAT_NOTIFY_QUEUE_MAX", 200, minimum=1)  # 每个通道最多排队的通知数
+NOTIFY_CONCURRENCY = _env_int("SUPERCHAT_NOTIFY_CONCURRENCY", 2, minimum=1)  # 每个通道同时发送的请求数
+NOTIFY_MAX_ATTEMPTS = _env_int("SUPERCHAT_NOTIFY_MAX_ATTEMPTS", 4, minimum=1)  # 单条通知最多尝试次数（含首次）
+NOTIFY_RETRY_BASE_SEC = 1.0  # 重试退避基数，第 n 次重试等待 base * 2^(n-1) 秒（带抖动）
+NOTIFY_RETRY_MAX_SEC = 60.0
 
 # --------------------------------
 
 # 用于存放每个主播的运行时信息 (uniq, cookies)
-ROOM_STATE: Dict[str, Dict[str, Any]] = {}
-RUNNING_TASKS: Dict[str, asyncio.Task] = {}
+ROOM_STATE: Dict[str, "RoomState"] = {}
+RUNNING_TASKS: Dict[str, "RoomPollHandle"] = {}  # 正在监控的房间（由 POLL_SCHEDULER 调度）
 START_MONITOR_LOCKS: Dict[str, asyncio.Lock] = {}
-SEEN_MESSAGE_IDS: Dict[str, dict[str, float]] = {}
-SEEN_ID_LIMIT = 4000
-SEEN_ID_PRUNE = 1000
+SEEN_MESSAGES: Dict[str, "SeenIdRing"] = {}  # 每个房间最近处理过的消息 id
+# 每个房间已处理到的最新消息 id（水位线），chat 响应中不高于水位线的消息无需再逐条去重
+MESSAGE_WATERMARKS: Dict[str, int] = {}
+MESSAGE_SCAN_STATS = {"responses": 0, "watermark_hits": 0, "full_scans": 0, "messages_total": 0, "messages_scanned": 0}
+# 每个房间上一次 chat 响应的指纹（原始字节摘要 / ETag / Last-Modified），内容未变时跳过解码与分类
+CHAT_PAYLOAD_FINGERPRINTS: Dict[str, Dict[str, Any]] = {}
+CHAT_PAYLOAD_STATS = {
+    "responses": 0, "unchanged": 0, "not_modified": 0, "refetched": 0, "bytes_not_decoded": 0, "bytes_not_transferred": 0,
+}
 LAST_NOTIFICATION_TS: Dict[str, float] = {}
 NOTIFY_DEDUP_WINDOW_SEC = 8.0
 ASYNC_SESSION: aiohttp.ClientSession | None = None
@@ -355,6 +608,304 @@ STREAMERS_CONTAINER = None  # 用于动态更新列表
 PENDING_BROWSER_NOTIFICATIONS: list[tuple[str, str]] = []  # (title, body)
 EVENT_ACTIVE_STATE: Dict[str, bool] = {}
 
+# ---------- 房间运行时状态 ----------
+class RoomState:
+    """单个房间的运行时状态：chat 接口凭据、直播状态与最近事件。
+
+    常用字段固定（__slots__），刷新 uniq 时由 set_credentials 原地替换凭据字段，
+    轮询用的请求头（UA / Referer / Cookie）也只在凭据变化时重建一次。
+    缓存的请求头（含拼好的 Cookie 串）让有凭据的房间比旧的 dict 状态更大，这是用内存换每次轮询的 CPU。
+    大多数房间从不触发的事件字段（最近打赏/选单/转轮/目标、错误信息）不占槽位，
+    未赋值时读到类属性上的默认值，第一次写入时才分配实例字典。
+    """
+
+    __slots__ = (
+        # 凭据
+        "api_url", "cookies", "ua", "site_origin", "uniq", "last_refresh", "credential_source", "chat_headers",
+        # 直播状态
+        "online_status", "last_status_check", "status_loading", "offline_check_count",
+        "low_freq_mode", "low_freq_logged",
+        # 消息
+        "model_id",
+        # 事件字段按需存放
+        "__dict__",
+    )
+
+    # 事件字段的默认值（按需写入实例字典）
+    last_error: str | None = None
+    high_tip_count = 0
+    last_high_tip: Dict[str, Any] | None = None
+    last_menu_tip: Dict[str, Any] | None = None  # 最后匹配的菜单打赏信息
+    last_wheel_tip: Dict[str, Any] | None = None  # 最后一次转轮游戏信息
+    last_threshold_goal: Dict[str, Any] | None = None
+
+    def __init__(self):
+        self.api_url: str | None = None
+        self.cookies: Dict[str, str] = {}
+        self.ua: str | None = None
+        self.site_origin: str | None = None
+        self.uniq: str | None = None
+        self.last_refresh = 0.0
+        self.credential_source: str | None = None  # cache / site / http / playwright
+        self.chat_headers: Dict[str, str] = {}
+        self.online_status: bool | None = None
+        self.last_status_check = 0.0
+        self.status_loading = False
+        self.offline_check_count = 0  # 连续检测到已下播的次数
+        self.low_freq_mode = False
+        self.low_freq_logged = False
+        self.model_id: Any = None  # 从消息中提取
+
+    def clear_events(self):
+        """清空事件字段，恢复为默认值并释放实例字典中的记录。"""
+        for name in ("high_tip_count", "last_high_tip", "last_menu_tip", "last_wheel_tip", "last_threshold_goal"):
+            self.__dict__.pop(name, None)
+
+    def set_credentials(self, username: str, site_origin: str, uniq: str, cookies: Dict[str, str],
+                        ua: str | None, source: str):
+        """换上一组新凭据（同步执行，轮询任务读到的总是完整的一组）。"""
+        self.site_origin = site_origin
+        self.uniq = uniq
+        self.api_url = build_chat_api_url(site_origin, username, uniq)
+        self.cookies = cookies or {}
+        self.ua = ua
+        self.credential_source = source
+        self.last_refresh = time.time()
+        self.chat_headers = {
+            "User-Agent": ua or DEFAULT_USER_AGENT,
+            "Accept": "application/json, text/plain, */*",
+            "Referer": build_room_url(site_origin, username),
+            "Cookie": "; ".join([f"{k}={v}" for k, v in self.cookies.items()]),
+        }
+
+
+def credential_source_of(creds: Dict[str, Any]) -> str:
+    return "site" if creds["scope"] == "site" else creds.get("via", "playwright")
+
+
+def get_room_state(username: str) -> RoomState:
+    """取房间状态，不存在时创建并登记。只读场景用 ROOM_STATE.get(username)。"""
+    state = ROOM_STATE.get(username)
+    if state is None:
+        state = ROOM_STATE[username] = RoomState()
+    return state
+
+
+def move_room_state(old_username: str, new_username: str) -> RoomState:
+    """主播改名后，把运行时状态迁移到新用户名下。"""
+    state = ROOM_STATE.pop(old_username, None) or get_room_state(new_username)
+    ROOM_STATE[new_username] = state
+    return state
+
+
+# ---------- 消息去重存储 ----------
+class SeenIdRing:
+    """一个房间最近处理过的消息 id（整数），每条约 16 字节。
+
+    ring 按插入顺序保存 id（环形覆盖最早的一条，供淘汰与快照使用），
+    ordered 是同一批 id 的有序副本，用二分查找判断是否见过。
+    chat 消息 id 基本递增：新 id 通常追加在 ordered 末尾，被淘汰的最早 id 通常就是最小值，
+    只需前移 head，攒够一批再统一截掉，避免每次都整体搬移数组。
+    """
+
+    __slots__ = ("capacity", "ring", "ordered", "head", "pos")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.ring = array("q")  # 按需增长到 capacity，之后循环覆盖
+        self.ordered = array("q")  # ordered[head:] 为当前全部 id（升序）
+        self.head = 0
+        self.pos = 0  # 环满之后下一个被覆盖的位置（即最早的一条）
+
+    def __len__(self) -> int:
+        return len(self.ring)
+
+    def __contains__(self, key: int) -> bool:
+        ordered = self.ordered
+        if len(ordered) == self.head or key > ordered[-1]:
+            return False
+        idx = bisect.bisect_left(ordered, key, self.head)
+        return ordered[idx] == key
+
+    def add(self, key: int) -> bool:
+        """记录 id，已存在时返回 False。"""
+        ordered, ring, head = self.ordered, self.ring, self.head
+        if len(ordered) > head and key <= ordered[-1]:
+            idx = bisect.bisect_left(ordered, key, head)
+            if ordered[idx] == key:
+                return False
+        else:
+            idx = -1  # 比已有 id 都大：追加到末尾
+        if len(ring) < self.capacity:
+            ring.append(key)
+        else:
+            pos = self.pos
+            evicted = ring[pos]
+            ring[pos] = key
+            self.pos = pos + 1 if pos + 1 < self.capacity else 0
+            if ordered[head] == evicted:
+                if idx == head:
+                    # 新 id 恰好落在被淘汰的最小值的位置：原地替换
+                    ordered[idx] = key
+                    return True
+                head += 1
+                if head >= self.capacity >> 1:
+                    del ordered[:head]
+                    idx -= head if idx > 0 else 0
+                    head = 0
+                self.head = head
+            else:
+                gone = bisect.bisect_left(ordered, evicted, head)
+                del ordered[gone]
+                if 0 <= gone < idx:
+                    idx -= 1
+        if idx < 0:
+            ordered.append(key)
+        else:
+            ordered.insert(idx, key)
+        return True
+
+    def recent(self, count: int) -> list[int]:
+        """最近记录的 count 条 id（按插入顺序）。"""
+        ordered = self.ring[self.pos:] + self.ring[:self.pos] if self.pos else self.ring
+        return ordered[-count:].tolist() if count > 0 else []
+
+
+def seen_message_key(message_id: str) -> int:
+    """消息 id 转成 64 位整数：数字 id 直接使用，其他（如 createdAt_cacheId）取稳定摘要，重启后保持一致。"""
+    try:
+        value = int(message_id)
+        if -(1 << 63) <= value < (1 << 63):
+            return value
+    except ValueError:
+        pass
+    return int.from_bytes(hashlib.blake2b(message_id.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+
+SEEN_SNAPSHOT_STATS: Dict[str, Any] = {
+    "snapshots": 0,
+    "last_snapshot_at": 0.0,
+    "last_snapshot_ms": 0.0,
+    "last_snapshot_bytes": 0,
+    "rooms_restored": 0,
+    "ids_restored": 0,
+    "last_error": None,
+}
+SEEN_SNAPSHOT_TASK: asyncio.Task | None = None
+SEEN_SNAPSHOT_LOADED = False
+SEEN_MESSAGES_DIRTY = False
+
+
+def load_seen_snapshot():
+    """启动时读回上次保存的已处理消息 id 与水位线，与内存中已有的记录合并。"""
+    global SEEN_SNAPSHOT_LOADED
+    SEEN_SNAPSHOT_LOADED = True
+    try:
+        if not os.path.exists(SEEN_MESSAGES_FILE):
+            return
+        with open(SEEN_MESSAGES_FILE, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        rooms = (data or {}).get("rooms") or {}
+        for username, entry in rooms.items():
+            if not isinstance(entry, dict):
+                continue
+            store = SEEN_MESSAGES.get(username)
+            if store is None:
+                store = SEEN_MESSAGES[username] = SeenIdRing(SEEN_ID_CAPACITY)
+            for key in entry.get("ids") or []:
+                if isinstance(key, int) and store.add(key):
+                    SEEN_SNAPSHOT_STATS["ids_restored"] += 1
+            watermark = entry.get("watermark")
+            if isinstance(watermark, int):
+                MESSAGE_WATERMARKS[username] = max(MESSAGE_WATERMARKS.get(username, 0), watermark)
+            SEEN_SNAPSHOT_STATS["rooms_restored"] += 1
+    except Exception as e:
+        SEEN_SNAPSHOT_STATS["last_error"] = str(e)
+        print(f"加载已处理消息快照失败: {e}")
+
+
+def _build_seen_snapshot() -> Dict[str, Any]:
+    # 只保存仍在列表中的主播，删除或改名后的旧记录随下一次快照丢弃
+    usernames = {get_streamer_username(s) for s in STREAMERS}
+    rooms = {}
+    for username in usernames.intersection(SEEN_MESSAGES.keys() | MESSAGE_WATERMARKS.keys()):
+        store = SEEN_MESSAGES.get(username)
+        rooms[username] = {
+            "ids": store.recent(SEEN_SNAPSHOT_IDS) if store else [],
+            "watermark": MESSAGE_WATERMARKS.get(username),
+        }
+    return {"saved_at": time.time(), "rooms": rooms}
+
+
+def _write_seen_snapshot(payload: Dict[str, Any], path: str) -> int:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+        size = f.tell()
+    os.replace(tmp_path, path)
+    return size
+
+
+async def save_seen_snapshot(force: bool = False):
+    """有新消息时把快照写入磁盘（序列化与写文件放到线程中，不阻塞事件循环）。"""
+    global SEEN_MESSAGES_DIRTY
+    if not SEEN_SNAPSHOT_LOADED or not (SEEN_MESSAGES_DIRTY or force):
+        return
+    SEEN_MESSAGES_DIRTY = False
+    start = time.perf_counter()
+    try:
+        payload = _build_seen_snapshot()
+        size = await asyncio.to_thread(_write_seen_snapshot, payload, SEEN_MESSAGES_FILE)
+    except Exception as e:
+        SEEN_MESSAGES_DIRTY = True
+        SEEN_SNAPSHOT_STATS["last_error"] = str(e)
+        print(f"保存已处理消息快照失败: {e}")
+        return
+    SEEN_SNAPSHOT_STATS["snapshots"] += 1
+    SEEN_SNAPSHOT_STATS["last_snapshot_at"] = time.time()
+    SEEN_SNAPSHOT_STATS["last_snapshot_ms"] = (time.perf_counter() - start) * 1000
+    SEEN_SNAPSHOT_STATS["last_snapshot_bytes"] = size
+
+
+async def seen_snapshot_loop():
+    while True:
+        await asyncio.sleep(SEEN_SNAPSHOT_INTERVAL)
+        await save_seen_snapshot()
+
+
+def ensure_seen_snapshotter():
+    """首次启动监控时读回快照，并启动定期写盘任务。"""
+    global SEEN_SNAPSHOT_TASK
+    if SEEN_SNAPSHOT_INTERVAL <= 0:
+        return
+    if not SEEN_SNAPSHOT_LOADED:
+        load_seen_snapshot()
+    if SEEN_SNAPSHOT_TASK is None or SEEN_SNAPSHOT_TASK.done():
+        SEEN_SNAPSHOT_TASK = asyncio.create_task(seen_snapshot_loop())
+
+
+async def stop_seen_snapshotter():
+    """退出前停止定期任务并写入最后一次快照。"""
+    global SEEN_SNAPSHOT_TASK
+    if SEEN_SNAPSHOT_TASK is not None:
+        SEEN_SNAPSHOT_TASK.cancel()
+        try:
+            await SEEN_SNAPSHOT_TASK
+        except (asyncio.CancelledError, Exception):
+            pass
+        SEEN_SNAPSHOT_TASK = None
+    await save_seen_snapshot()
+
+
+def get_seen_store_stats() -> Dict[str, Any]:
+    return {
+        **SEEN_SNAPSHOT_STATS,
+        "rooms": len(SEEN_MESSAGES),
+        "ids": sum(len(store) for store in SEEN_MESSAGES.values()),
+        "capacity_per_room": SEEN_ID_CAPACITY,
+    }
+
+
 # ---------- time helpers ----------
 def get_local_timezone_offset_minutes() -> int:
     """返回当前环境的时区偏移（分钟，和 JS Date.getTimezoneOffset 一致）。"""
@@ -395,26 +946,79 @@ def _dedup_preserve(seq: list[str]) -> list[str]:
             result.append(item)
     return result
 
-def extract_uniq_candidates(text: str) -> list[str]:
-    if not text:
-        return []
-    patterns = [
-        r'/api/front/v\d+/models/username/[\w\-\.]+/chat\?[^"\s]*?uniq=([A-Za-z0-9_-]+)',
-        r'chat\?[^"\s]*?uniq=([A-Za-z0-9_-]+)',
-        r'"uniq"\s*:\s*"([A-Za-z0-9_-]+)"',
-        r"'uniq'\s*:\s*'([A-Za-z0-9_-]+)'",
-        r'uniq%22%3A%22([A-Za-z0-9_-]+)%22',
-        r'uniq%3D([A-Za-z0-9_-]+)',
-        r'uniq\\"\s*:\s*\\"([A-Za-z0-9_-]+)\\"'
-    ]
+# uniq 提取规则，按优先级排列（越靠前越可信）
+UNIQ_PATTERNS = [
+    r'/api/front/v\d+/models/username/[\w\-\.]+/chat\?[^"\s]*?uniq=([A-Za-z0-9_-]+)',
+    r'chat\?[^"\s]*?uniq=([A-Za-z0-9_-]+)',
+    r'"uniq"\s*:\s*"([A-Za-z0-9_-]+)"',
+    r"'uniq'\s*:\s*'([A-Za-z0-9_-]+)'",
+    r'uniq%22%3A%22([A-Za-z0-9_-]+)%22',
+    r'uniq%3D([A-Za-z0-9_-]+)',
+    r'uniq\\"\s*:\s*\\"([A-Za-z0-9_-]+)\\"'
+]
+UNIQ_PATTERNS_COMPILED = [re.compile(p, re.IGNORECASE) for p in UNIQ_PATTERNS]
+# 单遍扫描：每条规则都以固定字面量开头，先在小写文本上用 str.find 定位这些锚点，
+# 再只在锚点处用对应规则做锚定匹配，避免 7 次 IGNORECASE 全文正则扫描。
+# 锚点 -> [(规则下标, 规则起点相对锚点的偏移, 需先校验的 (相对偏移, 字符) 或 None)]
+UNIQ_ANCHOR_RULES: Dict[str, list[tuple[int, int, tuple[int, str] | None]]] = {
+    "/api/front/v": [(0, 0, None)],
+    "chat?": [(1, 0, None)],
+    "uniq": [
+        (2, -1, (-1, '"')),
+        (3, -1, (-1, "'")),
+        (4, 0, (4, "%")),
+        (5, 0, (4, "%")),
+        (6, 0, (4, "\\")),
+    ],
+}
+# 这些字符在 IGNORECASE 下会与 ASCII 的 i/k/s 互相匹配，但 str.lower() 无法还原，
+# 出现时回退到逐条正则扫描以保证结果一致
+UNIQ_CASEFOLD_TRAPS = ("\u0130", "\u0131", "\u212a", "\u017f")
+
+
+def _extract_uniq_candidates_regex(text: str) -> list[str]:
+    """逐条规则全文扫描（单遍扫描的回退实现，也是基准测试的对照组）。"""
     candidates: list[str] = []
-    for pattern in patterns:
-        for match in re.findall(pattern, text, flags=re.IGNORECASE):
+    for pattern in UNIQ_PATTERNS_COMPILED:
+        for match in pattern.findall(text):
             candidate = _sanitize_uniq_candidate(match)
             if candidate:
                 candidates.append(candidate)
     return _dedup_preserve(candidates)
 
+
+def extract_uniq_candidates(text: str) -> list[str]:
+    if not text:
+        return []
+    if any(ch in text for ch in UNIQ_CASEFOLD_TRAPS):
+        return _extract_uniq_candidates_regex(text)
+    lowered = text.lower()
+    if "uniq" not in lowered:
+        return []
+    buckets: list[list[str]] = [[] for _ in UNIQ_PATTERNS_COMPILED]
+    # 每条规则上次匹配的结束位置，模拟 findall 的不重叠语义
+    last_end = [0] * len(UNIQ_PATTERNS_COMPILED)
+    for anchor, rules in UNIQ_ANCHOR_RULES.items():
+        start = lowered.find(anchor)
+        while start != -1:
+            for index, offset, guard in rules:
+                pos = start + offset
+                if pos < last_end[index]:
+                    continue
+                # 先比较单个字符，绝大多数 "uniq" 字样（如 unique）在这里就被排除
+                if guard is not None and lowered[start + guard[0]:start + guard[0] + 1] != guard[1]:
+                    continue
+                match = UNIQ_PATTERNS_COMPILED[index].match(text, pos)
+                if match is None:
+                    continue
+                last_end[index] = match.end()
+                # 捕获组只含 [A-Za-z0-9_-]，清洗等价于截断到 64 位并要求至少 6 位
+                value = match.group(1)
+                if len(value) >= 6:
+                    buckets[index].append(value[:64])
+            start = lowered.find(anchor, start + 1)
+    return _dedup_preserve([value for bucket in buckets for value in bucket])
+
 def extract_uniq_from_html(username: str, html: str) -> str | None:
     """从主播主页 HTML 中提取 uniq"""
     candidates = extract_uniq_candidates(html)
@@ -423,33 +1027,19 @@ def extract_uniq_from_html(username: str, html: str) -> str | None:
     return None
 
 
-def notify_print_and_telegram(text: str):
+def notify_print_and_telegram(text: str, priority: int | None = None):
     print(text)
-    # Correct Telegram send endpoint
     if TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID:
-        try:
-            requests.post(
-                f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage",
-                json={"chat_id": TELEGRAM_CHAT_ID, "text": text}, timeout=10)
-        except Exception as e:
-            print("Telegram 发送失败:", e)
+        NOTIFIER.submit("telegram", {"text": text}, NOTIFY_PRIORITY_NORMAL if priority is None else priority)
 
-def push_phone_notification(title: str, body: str):
+def push_phone_notification(title: str, body: str, priority: int | None = None):
     """通过 Bark/Day.app 推送到手机，title/body 与浏览器通知保持一致。"""
-    base_url = (PHONE_PUSH_BASE_URL or "").strip().rstrip("/")
-    if not base_url:
+    if not (PHONE_PUSH_BASE_URL or "").strip():
         return
-    try:
-        title_enc = up.quote(str(title or "通知"), safe="")
-        body_enc = up.quote(str(body or ""), safe="")
-        push_url = f"{base_url}/{title_enc}/{body_enc}"
-        requests.get(push_url, timeout=4)
-    except Exception as e:
-        if VERBOSE:
-            print(f"[推送] 手机推送失败: {e}")
+    NOTIFIER.submit("bark", {"title": title, "body": body}, NOTIFY_PRIORITY_NORMAL if priority is None else priority)
 
-def browser_notify(title: str, body: str):
-    """发送手机推送，并将通知加入前端队列用于浏览器系统通知。"""
+def browser_notify(title: str, body: str, priority: int | None = None):
+    """发送手机推送，并将通知加入前端队列用于浏览器系统通知；priority 决定手机推送的排队优先级。"""
     dedup_key = f"{str(title)}|{str(body)}"
     now_ts = time.time()
     last_ts = LAST_NOTIFICATION_TS.get(dedup_key, 0.0)
@@ -462,16 +1052,8 @@ def browser_notify(title: str, body: str):
         # 控制字典大小，清理较早的一批
         for k in list(LAST_NOTIFICATION_TS.keys())[:1000]:
             LAST_NOTIFICATION_TS.pop(k, None)
-    # 手机推送走后台线程，避免阻塞事件循环导致前端“后台断连”
-    try:
-        loop = asyncio.get_running_loop()
-        loop.run_in_executor(None, push_phone_notification, title, body)
-    except Exception:
-        # 若当前不在事件循环（极少数场景），退化为同步调用
-        try:
-            push_phone_notification(title, body)
-        except Exception:
-            pass
+    # 手机推送交给通知派发器异步发送，不阻塞事件循环
+    push_phone_notification(title, body, priority)
     try:
         PENDING_BROWSER_NOTIFICATIONS.append((str(title), str(body)))
     except Exception:
@@ -479,323 +1061,1815 @@ def browser_notify(title: str, body: str):
 
 def is_duplicate_message(username: str, message_id: str) -> bool:
     """全局去重消息 ID，防止并发轮询导致同一事件被重复通知。"""
+    global SEEN_MESSAGES_DIRTY
     key = str(message_id or "")
     if not key:
         return False
-    seen_map = SEEN_MESSAGE_IDS.setdefault(username, {})
-    if key in seen_map:
+    store = SEEN_MESSAGES.get(username)
+    if store is None:
+        store = SEEN_MESSAGES[username] = SeenIdRing(SEEN_ID_CAPACITY)
+    # 超过容量时环形缓冲自动淘汰最早的 id
+    if not store.add(seen_message_key(key)):
         return True
-    seen_map[key] = time.time()
-    # 控制内存：超限后按插入顺序清理最早的一批
-    if len(seen_map) > SEEN_ID_LIMIT:
-        old_keys = list(seen_map.keys())[:SEEN_ID_PRUNE]
-        for old_key in old_keys:
-            seen_map.pop(old_key, None)
+    SEEN_MESSAGES_DIRTY = True
     return False
 
-# ---------- Playwright helpers (同步 API used in dedicated thread) ----------
-# 替换用的 fetch_page_uniq_and_cookies（同步，供 run_in_executor 使用）
-def fetch_page_uniq_and_cookies(username: str, headless: bool = True, nav_timeout: int = 30000, watch_time: int = 8000):
+def move_seen_messages(old_username: str, new_username: str):
+    """主播改名后把已处理消息 id 与水位线迁移到新用户名下，改名前后的同一条消息不会再次提醒。"""
+    global SEEN_MESSAGES_DIRTY
+    store = SEEN_MESSAGES.pop(old_username, None)
+    if store is not None and new_username not in SEEN_MESSAGES:
+        SEEN_MESSAGES[new_username] = store
+    watermark = MESSAGE_WATERMARKS.pop(old_username, None)
+    if watermark is not None:
+        MESSAGE_WATERMARKS[new_username] = max(watermark, MESSAGE_WATERMARKS.get(new_username, watermark))
+    if store is not None or watermark is not None:
+        SEEN_MESSAGES_DIRTY = True
+
+def _message_seq(message: Dict[str, Any]) -> int | None:
+    try:
+        return int(message.get("id"))
+    except (TypeError, ValueError):
+        return None
+
+
+def select_new_messages(username: str, msgs: list) -> list:
     """
-    用 Playwright 打开主播主页，监听网络请求以捕获 '/chat?source=regular&uniq=...' 的请求。
-    返回 (uniq_or_None, cookies_dict, user_agent, html_or_error).
-    - nav_timeout: 页面导航超时时间（毫秒）
-    - watch_time: 在页面加载后继续监听网络请求的时间（毫秒）
+    按水位线挑出本次响应中需要处理的消息（保持原顺序）。
+    chat 接口按 id 有序返回最近的消息，从最新一端向回扫描，遇到不高于水位线的 id 即停止；
+    id 非数字或扫描段内顺序被打乱时，退回对整段响应逐条去重。
     """
-    preferred_site = get_streamer_site_origin(username)
-    site_candidates = get_site_candidates(preferred_site)
-    last_error = ""
-    for site_origin in site_candidates:
-        home = build_room_url(site_origin, username)
-        print(
-            f"[Playwright] 打开页面获取 uniq: {home} "
-            f"(nav_timeout={nav_timeout}ms, watch_time={watch_time}ms)"
-        )
-        try:
-            with sync_playwright() as p:
-                browser = p.chromium.launch(headless=headless)
-                context = browser.new_context()
-                page = context.new_page()
+    MESSAGE_SCAN_STATS["responses"] += 1
+    MESSAGE_SCAN_STATS["messages_total"] += len(msgs)
+    watermark = MESSAGE_WATERMARKS.get(username)
+    selected = None
+    if msgs:
+        first, last = _message_seq(msgs[0]), _message_seq(msgs[-1])
+        if first is not None and last is not None:
+            # 新消息在列表末尾（升序）或开头（降序）
+            ascending = first <= last
+            indices = range(len(msgs) - 1, -1, -1) if ascending else range(len(msgs))
+            picked: list[int] = []
+            prev = None
+            for idx in indices:
+                seq = _message_seq(msgs[idx])
+                if seq is None or (prev is not None and seq > prev):
+                    picked = None  # 顺序假设不成立
+                    break
+                if watermark is not None and seq <= watermark:
+                    break
+                picked.append(idx)
+                prev = seq
+            if picked is not None:
+                if watermark is not None:
+                    MESSAGE_SCAN_STATS["watermark_hits"] += 1
+                MESSAGE_SCAN_STATS["messages_scanned"] += len(picked) + (1 if len(picked) < len(msgs) else 0)
+                selected = [msgs[idx] for idx in sorted(picked)]
+                if picked:
+                    MESSAGE_WATERMARKS[username] = max(watermark or 0, _message_seq(msgs[picked[0]]))
+    if selected is None:
+        MESSAGE_SCAN_STATS["full_scans"] += 1
+        MESSAGE_SCAN_STATS["messages_scanned"] += len(msgs)
+        selected = list(msgs)
+        # 顺序不可信时不保留水位线，下一次响应重新建立
+        MESSAGE_WATERMARKS.pop(username, None)
+    return selected
+
+
+def build_chat_conditional_headers(username: str, api_url: str) -> Dict[str, str]:
+    """接口曾返回 ETag / Last-Modified 时，为同一 api_url 的下一次请求带上条件请求头。"""
+    fp = CHAT_PAYLOAD_FINGERPRINTS.get(username)
+    if not fp or fp.get("api_url") != api_url:
+        return {}
+    headers = {}
+    if fp.get("etag"):
+        headers["If-None-Match"] = fp["etag"]
+    if fp.get("last_modified"):
+        headers["If-Modified-Since"] = fp["last_modified"]
+    return headers
+
+
+async def read_chat_payload(
+    username: str,
+    api_url: str,
+    resp: aiohttp.ClientResponse,
+    session: aiohttp.ClientSession | None = None,
+    plain_headers: Dict[str, str] | None = None,
+) -> list | None:
+    """
+    读取 chat 响应并返回消息列表；与上一次响应内容相同时返回 None（不解码 JSON）。
+    上一次响应本身没有消息时仍返回 []，保留"长时间无消息强制刷新 uniq"的判断。
+    304 但本地没有可比的指纹时，丢掉 ETag 用 session + plain_headers（不带条件请求头）重新请求一次。
+    """
+    CHAT_PAYLOAD_STATS["responses"] += 1
+    fp = CHAT_PAYLOAD_FINGERPRINTS.get(username)
+    if fp is not None and fp.get("api_url") != api_url:
+        fp = None  # 换了 uniq / 接口地址，旧指纹不再可比
+    if resp.status == 304 and fp is not None:
+        CHAT_PAYLOAD_STATS["not_modified"] += 1
+        CHAT_PAYLOAD_STATS["bytes_not_transferred"] += fp["size"]
+        return None if fp["count"] else []
+    if resp.status == 304:
+        # 没有对应的指纹就不知道"没变"指的是什么，不能当作空响应处理
+        CHAT_PAYLOAD_FINGERPRINTS.pop(username, None)
+        if session is None:
+            raise RuntimeError("chat 接口返回 304，但本地没有可比的响应指纹")
+        CHAT_PAYLOAD_STATS["refetched"] += 1
+        async with session.get(api_url, headers=plain_headers, timeout=HTTP_TIMEOUTS["chat"]) as full:
+            if full.status != 200:
+                raise RuntimeError(f"无条件重新请求 chat 接口失败（{full.status}）")
+            return await read_chat_payload(username, api_url, full)
+    raw = await resp.read()
+    digest = hashlib.blake2b(raw, digest_size=16).digest()
+    etag, last_modified = resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+    if fp is not None and fp["digest"] == digest:
+        CHAT_PAYLOAD_STATS["unchanged"] += 1
+        CHAT_PAYLOAD_STATS["bytes_not_decoded"] += len(raw)
+        fp["etag"], fp["last_modified"] = etag, last_modified
+        return None if fp["count"] else []
+    doc = json.loads(raw) if raw else []
+    # doc 可能是 list 或 dict{'messages':[...] }
+    msgs = doc if isinstance(doc, list) else doc.get("messages") or doc.get("data") or []
+    CHAT_PAYLOAD_FINGERPRINTS[username] = {
+        "api_url": api_url,
+        "digest": digest,
+        "size": len(raw),
+        "count": len(msgs),
+        "etag": etag,
+        "last_modified": last_modified,
+    }
+    return msgs
 
-                found = {"url": None}
-                captured_urls: list[str] = []
 
-                def on_request(req):
-                    try:
-                        url = req.url
-                        if "uniq" in url.lower():
-                            captured_urls.append(url)
-                        if "/api/front/v2/models/username/" in url and "uniq" in url.lower():
-                            if not found["url"]:
-                                found["url"] = url
-                                print(f"[Playwright] 捕获到 chat 请求 URL: {url}")
-                    except Exception:
-                        pass
+# ---------- 通知派发 ----------
+NOTIFY_PRIORITY_HIGH = 0  # 高额打赏、选单命中、转轮、目标达成
+NOTIFY_PRIORITY_NORMAL = 1
+NOTIFY_PRIORITY_LOW = 2  # 直播状态变化等
+NOTIFY_PRIORITY_KEYS = {
+    NOTIFY_PRIORITY_HIGH: "high",
+    NOTIFY_PRIORITY_NORMAL: "normal",
+    NOTIFY_PRIORITY_LOW: "low",
+}
 
-                page.on("request", on_request)
-                page.goto(home, timeout=nav_timeout, wait_until="domcontentloaded")
-                try:
-                    page.wait_for_load_state("networkidle", timeout=8000)
-                except Exception:
-                    pass
-                if watch_time > 0:
-                    page.wait_for_timeout(watch_time)
-
-                uniq = None
-                uniq_source = None
-                api_url = None
-                actual_username = None
-                if found["url"]:
-                    parsed = up.urlparse(found["url"])
-                    path_parts = parsed.path.split('/')
-                    try:
-                        username_idx = path_parts.index('username')
-                        if username_idx >= 0 and username_idx + 1 < len(path_parts):
-                            actual_username = path_parts[username_idx + 1]
-                    except ValueError:
-                        pass
 
-                    qs = up.parse_qs(parsed.query)
-                    uvals = qs.get("uniq") or qs.get("uniq[]") or []
-                    if uvals:
-                        uniq = _sanitize_uniq_candidate(uvals[0])
-                        uniq_source = "network-request"
-                        api_url = found["url"]
-                    else:
-                        m = re.search(r"uniq=([A-Za-z0-9_-]+)", found["url"], re.IGNORECASE)
-                        if m:
-                            uniq = _sanitize_uniq_candidate(m.group(1))
-                            uniq_source = "network-request-regex"
-                            api_url = found["url"]
-
-                if not uniq and captured_urls:
-                    for entry in captured_urls:
-                        m = re.search(r"uniq=([A-Za-z0-9_-]+)", entry, re.IGNORECASE)
-                        if not m:
-                            continue
-                        candidate = _sanitize_uniq_candidate(m.group(1))
-                        if candidate:
-                            uniq = candidate
-                            uniq_source = "captured-request"
-                            break
+class NotificationDeliveryError(RuntimeError):
+    """通知发送失败；retryable 表示可重试，retry_after 为服务端要求的等待秒数。"""
 
-                html = page.content()
-                if not uniq:
-                    uniq_from_html = extract_uniq_from_html(username, html)
-                    if uniq_from_html:
-                        uniq = uniq_from_html
-                        uniq_source = "page-html"
-                        print(f"[Playwright] 在 HTML 中提取到 uniq={uniq}")
-                if not uniq:
-                    try:
-                        nuxt_snapshot = page.evaluate("""() => {
-                            const root = window.__NUXT__ || null;
-                            if (!root) {
-                                return null;
-                            }
-                            try {
-                                return JSON.stringify(root);
-                            } catch (err) {
-                                return null;
-                            }
-                        }""")
-                    except Exception:
-                        nuxt_snapshot = None
-                    if nuxt_snapshot and not uniq:
-                        uniq_from_nuxt = extract_uniq_from_html(username, nuxt_snapshot)
-                        if uniq_from_nuxt:
-                            uniq = uniq_from_nuxt
-                            uniq_source = "nuxt-state"
-                            print(f"[Playwright] 在 __NUXT__ 数据中提取到 uniq={uniq}")
-
-                if not uniq:
-                    try:
-                        nuxt_data_script = page.evaluate("""() => {
-                            const el = document.querySelector('script[id="__NUXT_DATA__"]');
-                            return el ? el.textContent : null;
-                        }""")
-                    except Exception:
-                        nuxt_data_script = None
-                    if nuxt_data_script:
-                        uniq_from_script = extract_uniq_from_html(username, nuxt_data_script)
-                        if uniq_from_script:
-                            uniq = uniq_from_script
-                            uniq_source = "nuxt-data-script"
-                            print(f"[Playwright] 在 __NUXT_DATA__ 中提取到 uniq={uniq}")
-
-                storage_snapshots: list[dict[str, str]] = []
-                if not uniq:
-                    try:
-                        local_storage = page.evaluate("""() => {
-                            if (!window.localStorage) { return null; }
-                            const data = {};
-                            for (let i = 0; i < localStorage.length; i++) {
-                                const key = localStorage.key(i);
-                                data[key] = localStorage.getItem(key);
-                            }
-                            return data;
-                        }""")
-                        if isinstance(local_storage, dict):
-                            storage_snapshots.append(local_storage)
-                    except Exception:
-                        pass
-                    try:
-                        session_storage = page.evaluate("""() => {
-                            if (!window.sessionStorage) { return null; }
-                            const data = {};
-                            for (let i = 0; i < sessionStorage.length; i++) {
-                                const key = sessionStorage.key(i);
-                                data[key] = sessionStorage.getItem(key);
-                            }
-                            return data;
-                        }""")
-                        if isinstance(session_storage, dict):
-                            storage_snapshots.append(session_storage)
-                    except Exception:
-                        pass
-                    for snapshot in storage_snapshots:
-                        if not snapshot:
-                            continue
-                        for key, value in snapshot.items():
-                            if key and "uniq" in key.lower():
-                                candidate = _sanitize_uniq_candidate(value)
-                                if candidate:
-                                    uniq = candidate
-                                    uniq_source = f"storage:{key}"
-                                    print(f"[Playwright] 在 storage {key} 中提取到 uniq={uniq}")
-                                    break
-                        if uniq:
-                            break
+    def __init__(self, message: str, retryable: bool = True, retry_after: float | None = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
 
-                cookies = context.cookies()
-                cookie_dict = {c['name']: c['value'] for c in cookies}
-                if not uniq:
-                    for c in cookies:
-                        name = c.get('name', '')
-                        if name and 'uniq' in name.lower():
-                            candidate = _sanitize_uniq_candidate(c.get('value'))
-                            if candidate:
-                                uniq = candidate
-                                uniq_source = f"cookie:{name}"
-                                print(f"[Playwright] 在 Cookie {name} 中提取到 uniq={uniq}")
-                                break
-                try:
-                    ua = page.evaluate("() => navigator.userAgent")
-                except Exception:
-                    ua = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/109.0.0.0 Safari/537.36"
 
-                browser.close()
-                final_username = actual_username or username
-                if uniq and not api_url:
-                    api_url = build_chat_api_url(site_origin, final_username, uniq)
+async def _send_telegram(session: aiohttp.ClientSession, payload: Dict[str, Any]):
+    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
+    body = {"chat_id": TELEGRAM_CHAT_ID, "text": payload["text"]}
+    async with session.post(url, json=body, timeout=HTTP_TIMEOUTS["telegram"]) as resp:
+        if resp.status == 200:
+            return
+        retry_after = None
+        if resp.status == 429:
+            try:
+                doc = await resp.json(content_type=None)
+                retry_after = float((doc.get("parameters") or {}).get("retry_after"))
+            except Exception:
+                retry_after = None
+        raise NotificationDeliveryError(
+            f"Telegram 状态码 {resp.status}", retryable=resp.status == 429 or resp.status >= 500, retry_after=retry_after
+        )
 
-                if uniq:
-                    print(
-                        f"[Playwright] 成功获取 uniq={uniq}，"
-                        f"cookies_keys={list(cookie_dict.keys())}，来源={uniq_source or 'unknown'}"
-                    )
-                    if actual_username and actual_username != username:
-                        print(f"[Playwright] ⚠️ 检测到用户名变更: {username} -> {actual_username}")
-                    state = ROOM_STATE.get(username) or {}
-                    state["site_origin"] = site_origin
-                    ROOM_STATE[username] = state
-                    if actual_username and actual_username != username:
-                        new_state = ROOM_STATE.get(actual_username) or {}
-                        new_state["site_origin"] = site_origin
-                        ROOM_STATE[actual_username] = new_state
-                else:
-                    print(f"[Playwright] 未提取到 uniq（network requests 和 HTML 均无），已抓取 {len(cookie_dict)} 个 cookie")
 
-                return uniq, cookie_dict, ua, html, actual_username
-        except Exception as e:
-            err = f"ERROR in playwright fetch ({site_origin}): {e}"
-            last_error = err
-            print(err)
-            continue
-    return None, {}, "", (last_error or "ERROR in playwright fetch: no site candidates"), None
+async def _send_bark(session: aiohttp.ClientSession, payload: Dict[str, Any]):
+    base_url = (PHONE_PUSH_BASE_URL or "").strip().rstrip("/")
+    title_enc = up.quote(str(payload.get("title") or "通知"), safe="")
+    body_enc = up.quote(str(payload.get("body") or ""), safe="")
+    async with session.get(f"{base_url}/{title_enc}/{body_enc}", timeout=HTTP_TIMEOUTS["bark"]) as resp:
+        if resp.status != 200:
+            raise NotificationDeliveryError(
+                f"手机推送状态码 {resp.status}", retryable=resp.status == 429 or resp.status >= 500
+            )
+
+
+NOTIFY_SINKS = {
+    "telegram": _send_telegram,
+    "bark": _send_bark,
+}
 
 
-# ---------- 通过官方接口提取菜单（优先方案） ----------
-def fetch_tip_menu_via_api(username: str, nav_timeout: int = 30000) -> Dict[str, Any]:
-    result = {"menu_items": [], "detailed_items": [], "error": None, "source": "api"}
-    try:
-        state = ROOM_STATE.get(username) or {}
-        uniq = state.get("uniq")
-        cookies = state.get("cookies", {})
-        ua = state.get("ua") or "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/109.0.0.0 Safari/537.36"
+class _NotifyChannel:
+    """一个通知通道：按优先级分道的有界队列，以及固定数量的发送 worker。"""
 
-        if not uniq:
-            uniq, cookies, ua, html, actual_username = fetch_page_uniq_and_cookies(username, True, nav_timeout)
-            if actual_username and actual_username != username:
-                try:
-                    if update_streamer_username(username, actual_username):
-                        username = actual_username
-                        state = ROOM_STATE.get(username) or {}
-                except Exception as rename_err:
-                    print(f"[{username}] 更新用户名失败: {rename_err}")
-            if not uniq:
-                result["error"] = "未能获取 uniq，无法调用菜单接口"
-                return result
+    def __init__(self, name: str):
+        self.name = name
+        self.lanes: Dict[int, deque] = {p: deque() for p in NOTIFY_PRIORITY_KEYS}
+        self.wakeup = asyncio.Event()
+        self.workers: list[asyncio.Task] = []
+        self.retry_handles: set[asyncio.TimerHandle] = set()
+        self.in_flight = 0
+        self.metrics: Dict[str, int] = {"submitted": 0, "sent": 0, "failed": 0, "dropped": 0, "retries": 0}
+        # 每个优先级最近的送达延迟（入队到发送成功，毫秒）
+        self.latencies: Dict[int, deque] = {p: deque(maxlen=200) for p in NOTIFY_PRIORITY_KEYS}
 
-        timezone_offset = get_local_timezone_offset_minutes()
-        params = {
-            "timezoneOffset": timezone_offset,
-            "triggerRequest": "loadCam",
-            "withEnhancedMixedTags": "true",
-            "primaryTag": "girls",
-            "isRevised": "false",
-            "uniq": uniq
-        }
+    def queued(self) -> int:
+        return sum(len(lane) for lane in self.lanes.values())
 
-        site_origin = get_streamer_site_origin(username)
-        headers = {
-            "User-Agent": ua,
-            "Accept": "application/json, text/plain, */*",
-            "Referer": build_room_url(site_origin, username)
-        }
-        if cookies:
-            headers["Cookie"] = "; ".join([f"{k}={v}" for k, v in cookies.items()])
 
-        base_url = build_cam_api_url(site_origin, username)
-        proxies = {"http": PROXY, "https": PROXY} if PROXY else None
+class NotificationDispatcher:
+    """异步通知派发器：各通道独立排队与限流，失败按指数退避重试，不阻塞轮询与前端。
+
+    通知按优先级分道，worker 总是先取高优先级的通知，因此打赏提醒不会排在直播状态消息后面；
+    排队与等待重试的通知合计达到上限时，挤掉优先级最低的最早一条，新通知（或重试）优先级更低时直接丢弃。
+    发送使用轮询共用的 ensure_session 会话，连接池上限、PROXY 代理与连接池统计与 chat 请求一致。
+    """
+
+    def __init__(self, max_queue: int, concurrency: int, max_attempts: int):
+        self.max_queue = max_queue
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.channels: Dict[str, _NotifyChannel] = {name: _NotifyChannel(name) for name in NOTIFY_SINKS}
 
+    def submit(self, channel: str, payload: Dict[str, Any], priority: int = NOTIFY_PRIORITY_NORMAL) -> bool:
+        """登记一条通知，立即返回；不在事件循环中（如命令行演示）时同步发送。"""
         try:
-            resp = requests.get(base_url, headers=headers, params=params, timeout=15, proxies=proxies)
-        except requests.exceptions.InvalidSchema as proxy_err:
-            if "SOCKS" in str(proxy_err).upper():
-                resp = requests.get(base_url, headers=headers, params=params, timeout=15)
-            else:
-                result["error"] = f"接口请求失败: {proxy_err}"
-                return result
-        except Exception as req_err:
-            result["error"] = f"接口请求失败: {req_err}"
-            return result
+            asyncio.get_running_loop()
+        except RuntimeError:
+            asyncio.run(self._deliver_once(channel, payload))
+            return True
+        ch = self.channels[channel]
+        ch.metrics["submitted"] += 1
+        if not self._make_room(ch, priority):
+            ch.metrics["dropped"] += 1
+            return False
+        ch.lanes[priority].append((time.monotonic(), 1, payload))
+        self._ensure_workers(ch)
+        ch.wakeup.set()
+        return True
 
-        if resp.status_code != 200:
-            result["error"] = f"接口状态码 {resp.status_code}"
-            return result
+    def _make_room(self, ch: _NotifyChannel, priority: int) -> bool:
+        """等待重试的通知也占队列名额；已满时挤掉优先级最低的最早一条，挤不动（对方优先级更高）返回 False。"""
+        if ch.queued() + len(ch.retry_handles) < self.max_queue:
+            return True
+        victim = max((p for p, lane in ch.lanes.items() if lane), default=None)
+        if victim is None or victim < priority:
+            return False
+        ch.lanes[victim].popleft()
+        ch.metrics["dropped"] += 1
+        return True
+
+    def _ensure_workers(self, ch: _NotifyChannel):
+        ch.workers = [w for w in ch.workers if not w.done()]
+        while len(ch.workers) < self.concurrency:
+            ch.workers.append(asyncio.create_task(self._worker(ch)))
 
+    async def _deliver_once(self, channel: str, payload: Dict[str, Any]):
         try:
-            data = resp.json()
-        except ValueError as json_err:
-            result["error"] = f"JSON解析失败: {json_err}"
-            return result
+            async with aiohttp.ClientSession(connector=make_aiohttp_connector()) as session:
+                await NOTIFY_SINKS[channel](session, payload)
+        except Exception as e:
+            print(f"[通知] {channel} 发送失败: {e}")
 
-        tip_menu = ((data or {}).get("cam") or {}).get("tipMenu") or {}
-        settings = tip_menu.get("settings") or []
-        if not settings:
-            result["error"] = "接口未返回 tipMenu 数据"
-            return result
+    def _next_job(self, ch: _NotifyChannel):
+        for priority in sorted(ch.lanes):
+            if ch.lanes[priority]:
+                return priority, ch.lanes[priority].popleft()
+        return None
 
-        detailed_items = []
-        for entry in settings:
-            activity = str(entry.get("activity") or "").strip()
-            price_val = entry.get("price")
-            if not activity or price_val in (None, ""):
+    async def _worker(self, ch: _NotifyChannel):
+        sink = NOTIFY_SINKS[ch.name]
+        while True:
+            job = self._next_job(ch)
+            if job is None:
+                ch.wakeup.clear()
+                await ch.wakeup.wait()
                 continue
-            price_text = str(price_val)
-            detailed_items.append({
-                "activity": activity,
+            priority, (enqueued, attempt, payload) = job
+            ch.in_flight += 1
+            try:
+                await sink(await ensure_session(), payload)
+            except Exception as e:
+                retryable = getattr(e, "retryable", isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError)))
+                if retryable and attempt < self.max_attempts:
+                    delay = getattr(e, "retry_after", None)
+                    if delay is None:
+                        delay = NOTIFY_RETRY_BASE_SEC * (2 ** (attempt - 1)) * random.uniform(0.8, 1.2)
+                    delay = min(delay, NOTIFY_RETRY_MAX_SEC)
+                    self._schedule_retry(ch, priority, (enqueued, attempt + 1, payload), delay)
+                else:
+                    ch.metrics["failed"] += 1
+                    print(f"[通知] {ch.name} 发送失败（第 {attempt} 次）: {e}")
+            else:
+                ch.metrics["sent"] += 1
+                ch.latencies[priority].append((time.monotonic() - enqueued) * 1000)
+            finally:
+                ch.in_flight -= 1
+
+    def _schedule_retry(self, ch: _NotifyChannel, priority: int, job: tuple, delay: float):
+        if not self._make_room(ch, priority):
+            ch.metrics["dropped"] += 1
+            print(f"[通知] {ch.name} 队列已满，放弃重试")
+            return
+        ch.metrics["retries"] += 1
+
+        # 退避期间不占用 worker，到期后回到原优先级队列的队首（名额已在上面预留）
+        def _requeue():
+            ch.retry_handles.discard(handle)
+            ch.lanes[priority].appendleft(job)
+            ch.wakeup.set()
+
+        handle = asyncio.get_running_loop().call_later(delay, _requeue)
+        ch.retry_handles.add(handle)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for name, ch in self.channels.items():
+            stats: Dict[str, Any] = dict(ch.metrics)
+            stats["queued"] = {NOTIFY_PRIORITY_KEYS[p]: len(lane) for p, lane in ch.lanes.items()}
+            stats["in_flight"] = ch.in_flight
+            stats["retrying"] = len(ch.retry_handles)
+            latency: Dict[str, Any] = {}
+            for p, samples in ch.latencies.items():
+                if samples:
+                    ordered = sorted(samples)
+                    latency[NOTIFY_PRIORITY_KEYS[p]] = {
+                        "avg_ms": round(sum(ordered) / len(ordered), 1),
+                        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+                        "max_ms": round(ordered[-1], 1),
+                    }
+            stats["latency"] = latency
+            out[name] = stats
+        return out
+
+    async def close(self, drain_timeout: float = 3.0):
+        # 退出前给排队中的通知一点时间发完
+        deadline = time.monotonic() + drain_timeout
+        while time.monotonic() < deadline and any(
+            ch.queued() or ch.in_flight for ch in self.channels.values() if ch.workers
+        ):
+            await asyncio.sleep(0.1)
+        for ch in self.channels.values():
+            for handle in ch.retry_handles:
+                handle.cancel()
+            ch.retry_handles.clear()
+            for worker in ch.workers:
+                worker.cancel()
+            ch.workers = []
+
+
+NOTIFIER = NotificationDispatcher(NOTIFY_QUEUE_MAX, NOTIFY_CONCURRENCY, NOTIFY_MAX_ATTEMPTS)
+
+
+# ---------- Playwright 浏览器池 ----------
+class _BrowserSlot:
+    """浏览器池中的一个槽位：一个常驻 Chromium 及其当前复用的 BrowserContext。"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.browser = None
+        self.headless = True
+        self.context = None
+        self.context_uses = 0
+        self.launched_at = 0.0
+
+
+class BrowserPool:
+    """常驻 Chromium 浏览器池（async Playwright，运行在主事件循环上）。
+
+    浏览器只在首次使用或异常断开时启动，每次抓取分配新建或复用的 BrowserContext；
+    所有槽位共用一个 Playwright driver。
+    """
+
+    def __init__(self, size: int, context_max_uses: int):
+        self.size = size
+        self.context_max_uses = context_max_uses
+        self._slots = [_BrowserSlot(i) for i in range(size)]
+        self._idle: asyncio.Queue[_BrowserSlot] = asyncio.Queue()
+        for slot in self._slots:
+            self._idle.put_nowait(slot)
+        self._playwright = None
+        self._playwright_lock = asyncio.Lock()
+        self.metrics: Dict[str, float] = {
+            "browser_launches": 0,
+            "browser_launch_ms_total": 0.0,
+            "browser_launch_ms_last": 0.0,
+            "context_acquires": 0,
+            "context_acquire_ms_total": 0.0,
+            "context_acquire_ms_last": 0.0,
+            "contexts_created": 0,
+            "contexts_reused": 0,
+            "contexts_recycled": 0,
+            "contexts_discarded": 0,
+            "browsers_recycled": 0,
+        }
+
+    async def run(self, fn, headless: bool = True):
+        """等待一个空闲槽位，以 await fn(context) 执行抓取并返回结果。"""
+        slot = await self._idle.get()
+        try:
+            context = await self._acquire_context(slot, headless)
+            try:
+                return await fn(context)
+            except (Exception, asyncio.CancelledError):
+                # 抓取异常或被取消后 context 状态不可信（可能残留页面或渲染进程），直接丢弃
+                await self._discard_context(slot)
+                self.metrics["contexts_discarded"] += 1
+                raise
+        finally:
+            self._idle.put_nowait(slot)
+
+    async def close(self):
+        """关闭全部浏览器与 driver，下次使用时会重新启动。"""
+        for slot in self._slots:
+            try:
+                await self._shutdown_slot(slot)
+            except Exception as e:
+                print(f"[浏览器池] 关闭槽位 {slot.index} 失败: {e}")
+        async with self._playwright_lock:
+            pw, self._playwright = self._playwright, None
+            if pw is not None:
+                try:
+                    await pw.stop()
+                except Exception:
+                    pass
+
+    async def recycle_idle(self, should_recycle) -> int:
+        """关闭当前空闲且满足 should_recycle(slot) 的浏览器，下次使用时重新启动；正在抓取的槽位不受影响。"""
+        taken: list[_BrowserSlot] = []
+        while not self._idle.empty():
+            taken.append(self._idle.get_nowait())
+        recycled = 0
+        try:
+            for slot in taken:
+                if slot.browser is not None and should_recycle(slot):
+                    await self._shutdown_slot(slot)
+                    recycled += 1
+        finally:
+            for slot in taken:
+                self._idle.put_nowait(slot)
+        self.metrics["browsers_recycled"] += recycled
+        return recycled
+
+    def get_metrics(self) -> Dict[str, float]:
+        metrics = dict(self.metrics)
+        launches = metrics["browser_launches"]
+        acquires = metrics["context_acquires"]
+        metrics["browser_launch_ms_avg"] = metrics["browser_launch_ms_total"] / launches if launches else 0.0
+        metrics["context_acquire_ms_avg"] = metrics["context_acquire_ms_total"] / acquires if acquires else 0.0
+        metrics["browsers_running"] = sum(1 for slot in self._slots if slot.browser is not None)
+        metrics["pool_size"] = self.size
+        metrics["idle_slots"] = self._idle.qsize()
+        now = time.time()
+        ages = [now - slot.launched_at for slot in self._slots if slot.browser is not None]
+        metrics["oldest_browser_age_sec"] = max(ages, default=0.0)
+        return metrics
+
+    async def _ensure_playwright(self):
+        async with self._playwright_lock:
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            return self._playwright
+
+    async def _ensure_browser(self, slot: _BrowserSlot, headless: bool):
+        if slot.browser is not None and slot.headless == headless:
+            try:
+                if slot.browser.is_connected():
+                    return
+            except Exception:
+                pass
+        await self._shutdown_slot(slot)
+        started = time.perf_counter()
+        pw = await self._ensure_playwright()
+        slot.browser = await pw.chromium.launch(headless=headless)
+        slot.headless = headless
+        slot.launched_at = time.time()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.metrics["browser_launches"] += 1
+        self.metrics["browser_launch_ms_total"] += elapsed_ms
+        self.metrics["browser_launch_ms_last"] = elapsed_ms
+        print(f"[浏览器池] 槽位 {slot.index} 启动 Chromium 耗时 {elapsed_ms:.0f}ms")
+        try:
+            # 立即登记新浏览器的 pid 与 profile 目录，供看门狗识别本进程遗留的孤儿
+            await collect_browser_processes()
+        except (FileNotFoundError, OSError):
+            pass
+
+    async def _acquire_context(self, slot: _BrowserSlot, headless: bool):
+        await self._ensure_browser(slot, headless)
+        started = time.perf_counter()
+        if slot.context is not None and slot.context_uses >= self.context_max_uses:
+            await self._discard_context(slot)
+            self.metrics["contexts_recycled"] += 1
+        if slot.context is None:
+            slot.context = await slot.browser.new_context()
+            slot.context_uses = 0
+            self.metrics["contexts_created"] += 1
+        else:
+            self.metrics["contexts_reused"] += 1
+        slot.context_uses += 1
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.metrics["context_acquires"] += 1
+        self.metrics["context_acquire_ms_total"] += elapsed_ms
+        self.metrics["context_acquire_ms_last"] = elapsed_ms
+        if VERBOSE:
+            print(f"[浏览器池] 槽位 {slot.index} 分配 context 耗时 {elapsed_ms:.0f}ms（第 {slot.context_uses} 次使用）")
+        return slot.context
+
+    async def _discard_context(self, slot: _BrowserSlot):
+        context, slot.context, slot.context_uses = slot.context, None, 0
+        if context is not None:
+            try:
+                await context.close()
+            except Exception:
+                pass
+
+    async def _shutdown_slot(self, slot: _BrowserSlot):
+        await self._discard_context(slot)
+        browser, slot.browser = slot.browser, None
+        if browser is not None:
+            try:
+                await browser.close()
+            except Exception:
+                pass
+
+
+BROWSER_POOL = BrowserPool(BROWSER_POOL_SIZE, BROWSER_CONTEXT_MAX_USES)
+
+
+# ---------- 凭据抓取准入队列 ----------
+ADMISSION_PRIORITY_LIVE = 0
+ADMISSION_PRIORITY_RECENT_EVENT = 1
+ADMISSION_PRIORITY_OTHER = 2
+ADMISSION_PRIORITY_KEYS = {
+    ADMISSION_PRIORITY_LIVE: "live",
+    ADMISSION_PRIORITY_RECENT_EVENT: "recent_event",
+    ADMISSION_PRIORITY_OTHER: "other",
+}
+
+# 最近一次确认的直播状态（True/False），不随 ROOM_STATE 重建而丢失
+ROOM_LAST_KNOWN_LIVE: Dict[str, bool] = {}
+# 最近一次触发监控事件（打赏/转轮/达标/选单）的时间戳
+ROOM_LAST_EVENT_AT: Dict[str, float] = {}
+
+
+class BrowserAdmissionRejected(RuntimeError):
+    """准入队列已满且当前请求优先级不够，本次抓取被拒绝。"""
+
+
+class BrowserAdmission:
+    """凭据抓取准入控制：最多 max_active 个抓取同时进行，其余按 (优先级, 到达顺序) 排队。
+
+    队列满时，新请求若比队尾（优先级最低、最晚到达）的请求更重要则将其挤出，否则直接拒绝。
+    """
+
+    def __init__(self, max_active: int, max_queue: int):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self._active = 0
+        self._seq = 0
+        # 排队中的请求: [(priority, seq, 入队时间, future)]，用 heapq 维护
+        self._waiters: list[tuple[int, int, float, asyncio.Future]] = []
+        self.metrics: Dict[str, float] = {
+            "admitted": 0,
+            "rejected": 0,
+            "evicted": 0,
+            "wait_ms_total": 0.0,
+            "wait_ms_max": 0.0,
+            "wait_ms_last": 0.0,
+        }
+
+    async def acquire(self, priority: int):
+        started = time.perf_counter()
+        if self._active < self.max_active and not self._waiters:
+            self._active += 1
+            self._record_wait(started)
+            return
+        if len(self._waiters) >= self.max_queue:
+            worst = max(self._waiters, key=lambda w: (w[0], w[1]))
+            if priority >= worst[0]:
+                self.metrics["rejected"] += 1
+                raise BrowserAdmissionRejected(f"抓取排队已满（{len(self._waiters)}）")
+            self._waiters.remove(worst)
+            heapq.heapify(self._waiters)
+            self.metrics["evicted"] += 1
+            self.metrics["rejected"] += 1
+            if not worst[3].done():
+                worst[3].set_exception(BrowserAdmissionRejected("被更高优先级的抓取请求挤出队列"))
+        self._seq += 1
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, self._seq, started, future)
+        heapq.heappush(self._waiters, entry)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # 已被放行但调用方同时被取消：把名额让给下一个
+                self.release()
+            elif entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            raise
+        self._record_wait(started)
+
+    def release(self):
+        # 名额直接移交给优先级最高的排队者，_active 不变
+        while self._waiters:
+            future = heapq.heappop(self._waiters)[3]
+            if not future.done():
+                future.set_result(None)
+                return
+        self._active -= 1
+
+    def get_metrics(self) -> Dict[str, float]:
+        metrics = dict(self.metrics)
+        admitted = metrics["admitted"]
+        metrics["wait_ms_avg"] = metrics["wait_ms_total"] / admitted if admitted else 0.0
+        metrics["active"] = self._active
+        metrics["max_active"] = self.max_active
+        metrics["queued"] = len(self._waiters)
+        for priority, key in ADMISSION_PRIORITY_KEYS.items():
+            metrics[f"queued_{key}"] = sum(1 for w in self._waiters if w[0] == priority)
+        now = time.perf_counter()
+        metrics["oldest_wait_ms"] = max(((now - w[2]) * 1000 for w in self._waiters), default=0.0)
+        return metrics
+
+    def _record_wait(self, started: float):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.metrics["admitted"] += 1
+        self.metrics["wait_ms_total"] += elapsed_ms
+        self.metrics["wait_ms_last"] = elapsed_ms
+        self.metrics["wait_ms_max"] = max(self.metrics["wait_ms_max"], elapsed_ms)
+
+
+BROWSER_ADMISSION = BrowserAdmission(BROWSER_ADMISSION_MAX, BROWSER_ADMISSION_QUEUE_MAX)
+
+
+def get_room_admission_priority(username: str) -> int:
+    """直播中 > 近期有事件 > 其他（下播/未知）。"""
+    state = ROOM_STATE.get(username)
+    if (state and state.online_status is True) or ROOM_LAST_KNOWN_LIVE.get(username):
+        return ADMISSION_PRIORITY_LIVE
+    last_event = ROOM_LAST_EVENT_AT.get(username)
+    if last_event and time.time() - last_event <= ROOM_EVENT_PRIORITY_WINDOW:
+        return ADMISSION_PRIORITY_RECENT_EVENT
+    return ADMISSION_PRIORITY_OTHER
+
+
+def format_browser_admission_status() -> str:
+    """顶部栏展示用：正在抓取数 / 排队数 / 平均与最近等待时间。"""
+    m = BROWSER_ADMISSION.get_metrics()
+    text = f"抓取 {m['active']:.0f}/{m['max_active']:.0f} · 排队 {m['queued']:.0f}"
+    if m["queued"]:
+        text += f"（直播 {m['queued_live']:.0f} / 事件 {m['queued_recent_event']:.0f}，最久 {m['oldest_wait_ms'] / 1000:.0f}s）"
+    if m["admitted"]:
+        text += f" · 平均等待 {m['wait_ms_avg'] / 1000:.1f}s"
+    return text
+# 每种抓取配置的累计耗时与流量: {profile: {captures, wall_ms_total, bytes_total, requests, blocked, early_exits}}
+CAPTURE_STATS: Dict[str, Dict[str, float]] = {}
+
+
+def get_browser_pool_metrics() -> Dict[str, float]:
+    """浏览器池指标：浏览器启动耗时 vs context 分配耗时等。"""
+    return BROWSER_POOL.get_metrics()
+
+
+# ---------- 浏览器内存看门狗 ----------
+BROWSER_WATCHDOG_STATS: Dict[str, Any] = {
+    "checks": 0,
+    "last_check_at": 0.0,
+    "processes": 0,
+    "rss_mb": 0.0,
+    "peak_rss_mb": 0.0,
+    "recycles_memory": 0,
+    "recycles_age": 0,
+    "orphans_killed": 0,
+    "last_error": None,
+}
+BROWSER_WATCHDOG_TASK: asyncio.Task | None = None
+# 本进程启动过的 Playwright Chromium：{pid: 启动参数中的 --user-data-dir}。
+# 看门狗只回收这些进程的孤儿，不会误杀其他用户或其他实例的浏览器
+LAUNCHED_BROWSER_PROCESSES: Dict[int, str] = {}
+
+
+def _is_playwright_browser_command(command: str) -> bool:
+    lowered = command.lower()
+    return "ms-playwright" in lowered or "playwright_chromiumdev_profile" in lowered
+
+
+def _browser_profile_dir(command: str) -> str:
+    for arg in command.split():
+        if arg.startswith("--user-data-dir="):
+            return arg.split("=", 1)[1]
+    return ""
+
+
+async def _list_processes() -> list[Dict[str, Any]]:
+    """用 ps 读取进程表（macOS/Linux 通用），返回 [{pid, ppid, rss_kb, command}]。"""
+    proc = await asyncio.create_subprocess_exec(
+        "ps", "-A", "-o", "pid=,ppid=,rss=,command=",
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    out, _ = await proc.communicate()
+    rows: list[Dict[str, Any]] = []
+    for line in out.decode(errors="replace").splitlines():
+        parts = line.split(None, 3)
+        if len(parts) < 3:
+            continue
+        try:
+            pid, ppid, rss_kb = int(parts[0]), int(parts[1]), int(parts[2])
+        except ValueError:
+            continue
+        if pid == proc.pid:
+            continue  # ps 自身也是本进程的子进程，不计入
+        rows.append({"pid": pid, "ppid": ppid, "rss_kb": rss_kb, "command": parts[3] if len(parts) > 3 else ""})
+    return rows
+
+
+async def collect_browser_processes() -> Dict[str, Any]:
+    """统计本进程的全部子孙进程（Playwright driver 与 Chromium），以及被遗弃的 Playwright Chromium 进程。"""
+    rows = await _list_processes()
+    children: Dict[int, list[Dict[str, Any]]] = {}
+    for row in rows:
+        children.setdefault(row["ppid"], []).append(row)
+    descendants: list[Dict[str, Any]] = []
+    stack = [os.getpid()]
+    while stack:
+        for row in children.get(stack.pop(), []):
+            descendants.append(row)
+            stack.append(row["pid"])
+    own_pids = {row["pid"] for row in descendants}
+    # 登记仍挂在本进程下的 Chromium；已退出的 pid 移除，避免 pid 被系统复用后误杀
+    alive = {row["pid"] for row in rows}
+    for pid in [pid for pid in LAUNCHED_BROWSER_PROCESSES if pid not in alive]:
+        del LAUNCHED_BROWSER_PROCESSES[pid]
+    for row in descendants:
+        if _is_playwright_browser_command(row["command"]):
+            LAUNCHED_BROWSER_PROCESSES.setdefault(row["pid"], _browser_profile_dir(row["command"]))
+    profiles = {profile for profile in LAUNCHED_BROWSER_PROCESSES.values() if profile}
+    # 本进程启动、但父进程已退出（被 init/launchd 收养）的 Chromium 视为孤儿进程：
+    # 按登记的 pid（命令行仍需一致）或登记的 profile 目录识别
+    orphans = [
+        row["pid"] for row in rows
+        if row["ppid"] == 1 and row["pid"] not in own_pids and (
+            (row["pid"] in LAUNCHED_BROWSER_PROCESSES
+             and LAUNCHED_BROWSER_PROCESSES[row["pid"]] in row["command"]
+             and _is_playwright_browser_command(row["command"]))
+            or any(profile in row["command"] for profile in profiles)
+        )
+    ]
+    return {
+        "processes": len(descendants),
+        "rss_mb": sum(row["rss_kb"] for row in descendants) / 1024,
+        "orphans": orphans,
+    }
+
+
+def kill_orphan_browser_processes(pids: list[int]) -> int:
+    killed = 0
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGKILL)
+            killed += 1
+        except (ProcessLookupError, PermissionError):
+            pass
+        LAUNCHED_BROWSER_PROCESSES.pop(pid, None)
+    if killed:
+        print(f"[看门狗] 已强制结束 {killed} 个遗留 Chromium 进程")
+    return killed
+
+
+async def run_browser_watchdog_once():
+    stats = BROWSER_WATCHDOG_STATS
+    stats["checks"] += 1
+    stats["last_check_at"] = time.time()
+    try:
+        snapshot = await collect_browser_processes()
+    except (FileNotFoundError, OSError) as e:
+        # 没有 ps（如 Windows）时只做按运行时长回收
+        snapshot = None
+        stats["last_error"] = f"无法读取进程表: {e}"
+    if snapshot is not None:
+        stats["processes"] = snapshot["processes"]
+        stats["rss_mb"] = snapshot["rss_mb"]
+        stats["peak_rss_mb"] = max(stats["peak_rss_mb"], snapshot["rss_mb"])
+        stats["orphans_killed"] += kill_orphan_browser_processes(snapshot["orphans"])
+        if BROWSER_MEMORY_CEILING_MB and snapshot["rss_mb"] > BROWSER_MEMORY_CEILING_MB:
+            recycled = await BROWSER_POOL.recycle_idle(lambda slot: True)
+            stats["recycles_memory"] += recycled
+            if recycled:
+                print(f"[看门狗] 浏览器内存 {snapshot['rss_mb']:.0f}MB 超过上限 {BROWSER_MEMORY_CEILING_MB}MB，已重启 {recycled} 个浏览器")
+    if BROWSER_MAX_AGE_SEC:
+        now = time.time()
+        recycled = await BROWSER_POOL.recycle_idle(lambda slot: now - slot.launched_at > BROWSER_MAX_AGE_SEC)
+        stats["recycles_age"] += recycled
+        if recycled:
+            print(f"[看门狗] {recycled} 个浏览器运行超过 {BROWSER_MAX_AGE_SEC}s，已重启")
+
+
+async def browser_watchdog_loop():
+    while True:
+        await asyncio.sleep(BROWSER_WATCHDOG_INTERVAL)
+        try:
+            await run_browser_watchdog_once()
+        except Exception as e:
+            BROWSER_WATCHDOG_STATS["last_error"] = str(e)
+            print(f"[看门狗] 检查异常: {e}")
+
+
+def ensure_browser_watchdog():
+    global BROWSER_WATCHDOG_TASK
+    if BROWSER_WATCHDOG_TASK is None or BROWSER_WATCHDOG_TASK.done():
+        BROWSER_WATCHDOG_TASK = asyncio.create_task(browser_watchdog_loop())
+
+
+# ---------- 凭据磁盘缓存 ----------
+# 结构: {"<site_origin>|<username>": {uniq, cookies, ua, site_origin, api_url, acquired_at}}
+CREDENTIAL_CACHE: Dict[str, Dict[str, Any]] | None = None
+
+
+def _credential_cache_key(site_origin: str, username: str) -> str:
+    return f"{_normalize_site_origin(site_origin)}|{username}"
+
+
+def _load_credential_cache() -> Dict[str, Dict[str, Any]]:
+    global CREDENTIAL_CACHE
+    if CREDENTIAL_CACHE is not None:
+        return CREDENTIAL_CACHE
+    CREDENTIAL_CACHE = {}
+    try:
+        if os.path.exists(CREDENTIALS_FILE):
+            with open(CREDENTIALS_FILE, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                CREDENTIAL_CACHE = {k: v for k, v in data.items() if isinstance(v, dict)}
+    except Exception as e:
+        print(f"加载凭据缓存失败: {e}")
+    restore_site_credentials(CREDENTIAL_CACHE)
+    return CREDENTIAL_CACHE
+
+
+def _save_credential_cache():
+    cache = _load_credential_cache()
+    tmp_path = f"{CREDENTIALS_FILE}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, CREDENTIALS_FILE)
+    except Exception as e:
+        print(f"保存凭据缓存失败: {e}")
+
+
+def remember_room_credentials(
+    username: str,
+    site_origin: str,
+    uniq: str,
+    cookies: Dict[str, str],
+    ua: str,
+    api_url: str,
+    acquired_at: float | None = None,
+):
+    """记录房间获取或复用到的凭据（写入磁盘），供重启后直接复用；acquired_at 为凭据实际获取时间。"""
+    if CREDENTIAL_CACHE_TTL <= 0 or not uniq:
+        return
+    cache = _load_credential_cache()
+    key = _credential_cache_key(site_origin, username)
+    if (cache.get(key) or {}).get("uniq") == uniq:
+        return  # 同一份凭据已经记录过，不重复写盘
+    cache[key] = {
+        "uniq": uniq,
+        "cookies": dict(cookies or {}),
+        "ua": ua,
+        "site_origin": _normalize_site_origin(site_origin),
+        "api_url": api_url,
+        "acquired_at": acquired_at or time.time(),
+    }
+    # 顺带清理过期条目，避免文件无限增长
+    now = time.time()
+    for key in [k for k, v in cache.items() if now - float(v.get("acquired_at") or 0) > CREDENTIAL_CACHE_TTL]:
+        cache.pop(key, None)
+    _save_credential_cache()
+
+
+def get_cached_credentials(username: str) -> Dict[str, Any] | None:
+    """按站点优先级返回未过期的缓存凭据，没有则返回 None。"""
+    if CREDENTIAL_CACHE_TTL <= 0:
+        return None
+    cache = _load_credential_cache()
+    now = time.time()
+    for site_origin in get_site_candidates(get_streamer_site_origin(username)):
+        entry = cache.get(_credential_cache_key(site_origin, username))
+        if not entry or not entry.get("uniq"):
+            continue
+        if now - float(entry.get("acquired_at") or 0) > CREDENTIAL_CACHE_TTL:
+            continue
+        return entry
+    return None
+
+
+def invalidate_cached_credentials(username: str, site_origin: str | None = None):
+    """凭据被 chat 接口拒绝后清除对应缓存条目。"""
+    cache = _load_credential_cache()
+    if site_origin:
+        keys = [_credential_cache_key(site_origin, username)]
+    else:
+        keys = [k for k in cache if k.endswith(f"|{username}")]
+    removed = False
+    for key in keys:
+        if cache.pop(key, None) is not None:
+            removed = True
+    if removed:
+        _save_credential_cache()
+
+
+# ---------- 站点级凭据共享 ----------
+# uniq/cookie 绑定的是访客会话而非房间：同一站点抓到一次即可供该站点所有房间复用，
+# 只有某个房间用共享凭据请求失败时才为该房间单独抓取。
+SITE_CREDENTIALS: Dict[str, Dict[str, Any]] = {}
+SITE_CREDENTIAL_LOCKS: Dict[str, asyncio.Lock] = {}
+# 每个站点正在进行的浏览器抓取，同站其他房间等它结束后先尝试复用结果
+SITE_CAPTURE_FLIGHTS: Dict[str, asyncio.Future] = {}
+SITE_CREDENTIAL_STATS: Dict[str, int] = {"shared_hits": 0, "room_captures": 0, "capture_waits": 0}
+
+
+def remember_site_credentials(
+    site_origin: str,
+    uniq: str,
+    cookies: Dict[str, str],
+    ua: str,
+    source_username: str,
+    acquired_at: float | None = None,
+):
+    """记录某站点最新一次抓取到的访客会话凭据。"""
+    site = _normalize_site_origin(site_origin)
+    if not site or not uniq:
+        return
+    SITE_CREDENTIALS[site] = {
+        "uniq": uniq,
+        "cookies": dict(cookies or {}),
+        "ua": ua,
+        "site_origin": site,
+        "source_username": source_username,
+        "acquired_at": acquired_at or time.time(),
+    }
+
+
+def restore_site_credentials(cache: Dict[str, Dict[str, Any]]):
+    """重启后用磁盘缓存中各站点最新的未过期凭据恢复站点共享凭据，没有缓存条目的房间也能直接复用。"""
+    now = time.time()
+    for key, entry in cache.items():
+        uniq = entry.get("uniq")
+        acquired_at = float(entry.get("acquired_at") or 0)
+        site = _normalize_site_origin(entry.get("site_origin") or key.rsplit("|", 1)[0])
+        if not uniq or not site or now - acquired_at > CREDENTIAL_CACHE_TTL:
+            continue
+        current = SITE_CREDENTIALS.get(site)
+        if current is not None and current["acquired_at"] >= acquired_at:
+            continue
+        SITE_CREDENTIALS[site] = {
+            "uniq": uniq,
+            "cookies": dict(entry.get("cookies") or {}),
+            "ua": entry.get("ua"),
+            "site_origin": site,
+            "source_username": key.rsplit("|", 1)[-1],
+            "acquired_at": acquired_at,
+        }
+        CREDENTIAL_ISSUED_AT.setdefault(uniq, acquired_at)
+
+
+def get_site_credentials(site_origin: str, exclude_uniq: str | None = None, max_age: float | None = None) -> Dict[str, Any] | None:
+    """返回站点共享凭据；exclude_uniq 用于跳过刚被拒绝的那份，max_age 限制凭据年龄（秒）。"""
+    _load_credential_cache()  # 首次调用时从磁盘缓存恢复站点凭据
+    entry = SITE_CREDENTIALS.get(_normalize_site_origin(site_origin))
+    if not entry or not entry.get("uniq"):
+        return None
+    if exclude_uniq and entry["uniq"] == exclude_uniq:
+        return None
+    if max_age is not None and time.time() - entry["acquired_at"] > max_age:
+        return None
+    return entry
+
+
+# HTTP 快速通道从页面 HTML 里提取的 uniq 未经接口验证（可能是页面里的过期值）：
+# 先只给抓取它的房间用，第一次 chat 轮询成功后才写入缓存并共享给全站。{uniq: 待发布的凭据}
+UNCONFIRMED_CREDENTIALS: Dict[str, Dict[str, Any]] = {}
+UNCONFIRMED_CREDENTIAL_TTL = 600  # 待验证凭据最多保留多久（秒），房间停止监控后留下的条目随之清理
+
+
+def confirm_room_credentials(uniq: str | None):
+    """chat 接口接受了 uniq：把暂存的快速通道凭据写入房间缓存与站点共享凭据。"""
+    pending = UNCONFIRMED_CREDENTIALS.pop(uniq, None) if uniq else None
+    if pending is None:
+        return
+    _bump_fast_path_stat(pending["site_origin"], "confirmed")
+    remember_room_credentials(
+        pending["username"], pending["site_origin"], uniq, pending["cookies"], pending["ua"], pending["api_url"],
+        acquired_at=pending["acquired_at"],
+    )
+    remember_site_credentials(
+        pending["site_origin"], uniq, pending["cookies"], pending["ua"], pending["username"],
+        acquired_at=pending["acquired_at"],
+    )
+
+
+def discard_unconfirmed_credentials(uniq: str | None):
+    """chat 接口拒绝了尚未验证的 uniq：丢弃，不再发布。"""
+    if uniq and UNCONFIRMED_CREDENTIALS.pop(uniq, None) is not None and VERBOSE:
+        print(f"[HTTP快速通道] uniq={uniq} 未通过 chat 接口验证，已丢弃")
+
+
+# ---------- Playwright helpers (async API，运行在主事件循环) ----------
+def _record_acquired_credentials(
+    username: str,
+    actual_username: str | None,
+    site_origin: str,
+    uniq: str,
+    cookies: Dict[str, str],
+    ua: str,
+    api_url: str,
+    confirmed: bool = True,
+):
+    """
+    成功获取凭据后：记录房间所属站点，并写入房间缓存与站点共享凭据。
+    confirmed=False（HTTP 快速通道）时只暂存，等 confirm_room_credentials 在首次轮询成功后发布。
+    """
+    final_username = actual_username or username
+    now = time.time()
+    CREDENTIAL_ISSUED_AT.setdefault(uniq, now)
+    get_room_state(username).site_origin = site_origin
+    if actual_username and actual_username != username:
+        get_room_state(actual_username).site_origin = site_origin
+    if not confirmed:
+        for stale in [u for u, v in UNCONFIRMED_CREDENTIALS.items() if now - v["acquired_at"] > UNCONFIRMED_CREDENTIAL_TTL]:
+            UNCONFIRMED_CREDENTIALS.pop(stale, None)
+        UNCONFIRMED_CREDENTIALS[uniq] = {
+            "username": final_username,
+            "site_origin": site_origin,
+            "cookies": dict(cookies or {}),
+            "ua": ua,
+            "api_url": api_url,
+            "acquired_at": now,
+        }
+        return
+    remember_room_credentials(final_username, site_origin, uniq, cookies, ua, api_url)
+    remember_site_credentials(site_origin, uniq, cookies, ua, final_username)
+
+
+def get_capture_blocked_types(profile: str | None = None) -> frozenset[str]:
+    """返回抓取配置对应的拦截资源类型；SUPERCHAT_CAPTURE_BLOCK_TYPES 可覆盖 lite 配置的默认列表。"""
+    name = (profile or CAPTURE_PROFILE).strip().lower()
+    if name == "full":
+        return frozenset()
+    if CAPTURE_BLOCK_TYPES_OVERRIDE is not None:
+        return CAPTURE_BLOCK_TYPES_OVERRIDE
+    return CAPTURE_PROFILES.get(name, CAPTURE_PROFILES["lite"])
+
+
+def _record_capture_stats(profile: str, traffic: Dict[str, int], elapsed_ms: float):
+    stats = CAPTURE_STATS.setdefault(profile, {
+        "captures": 0, "wall_ms_total": 0.0, "bytes_total": 0, "requests": 0, "blocked": 0, "early_exits": 0,
+    })
+    stats["captures"] += 1
+    stats["wall_ms_total"] += elapsed_ms
+    stats["bytes_total"] += traffic["bytes"]
+    stats["requests"] += traffic["requests"]
+    stats["blocked"] += traffic["blocked"]
+    stats["early_exits"] += traffic["early_exit"]
+
+
+async def _capture_uniq_in_context(
+    context,
+    username: str,
+    site_origin: str,
+    nav_timeout: int,
+    watch_time: int,
+    profile: str | None = None,
+):
+    """在浏览器池分配的 BrowserContext 中打开主播主页并提取 uniq，页面用完即关闭。"""
+    home = build_room_url(site_origin, username)
+    profile_name = (profile or CAPTURE_PROFILE).strip().lower()
+    blocked_types = get_capture_blocked_types(profile_name)
+    traffic = {"bytes": 0, "requests": 0, "blocked": 0, "early_exit": 0}
+    pending_sizes: list[asyncio.Future] = []  # 各请求的 request.sizes()，收尾时汇总字节数
+    started = time.perf_counter()
+    page = await context.new_page()
+    try:
+        found = {"url": None}
+        captured_urls: list[str] = []
+
+        if blocked_types:
+            # 只需要触发 chat XHR 与拿到 HTML/cookie：视频流、图片、字体、样式等直接中止
+            async def on_route(route):
+                try:
+                    if route.request.resource_type in blocked_types:
+                        await route.abort()
+                        traffic["blocked"] += 1
+                        return
+                except Exception as e:
+                    # 中止失败也必须处理该请求，否则它会一直挂起到页面关闭
+                    print(f"[Playwright] 拦截 {route.request.url} 失败，改为放行: {e}")
+                try:
+                    await route.continue_()
+                except Exception as e:
+                    if VERBOSE:
+                        print(f"[Playwright] 放行 {route.request.url} 失败: {e}")
+
+            await page.route("**/*", on_route)
+
+        # 流量按请求完成后的实际传输大小统计（分块传输、没有 content-length 的响应同样计入）
+        def on_request_finished(req):
+            traffic["requests"] += 1
+            pending_sizes.append(asyncio.ensure_future(req.sizes()))
+
+        page.on("requestfinished", on_request_finished)
+
+        chat_seen = asyncio.Event()
+
+        def on_request(req):
+            try:
+                url = req.url
+                if "uniq" in url.lower():
+                    captured_urls.append(url)
+                if "/api/front/v2/models/username/" in url and "uniq" in url.lower():
+                    if not found["url"]:
+                        found["url"] = url
+                        print(f"[Playwright] 捕获到 chat 请求 URL: {url}")
+                    m = re.search(r"uniq=([A-Za-z0-9_-]+)", url, re.IGNORECASE)
+                    if m and _sanitize_uniq_candidate(m.group(1)):
+                        chat_seen.set()
+            except Exception:
+                pass
+
+        page.on("request", on_request)
+        await page.goto(home, timeout=nav_timeout, wait_until="domcontentloaded")
+        # 捕获到带有效 uniq 的 chat 请求即结束等待；原先固定的 networkidle(8s) + watch_time 仅作为上限
+        if chat_seen.is_set():
+            traffic["early_exit"] = 1
+        else:
+            try:
+                await asyncio.wait_for(chat_seen.wait(), timeout=(8000 + max(watch_time, 0)) / 1000)
+                traffic["early_exit"] = 1
+            except asyncio.TimeoutError:
+                pass
+
+        uniq = None
+        uniq_source = None
+        api_url = None
+        actual_username = None
+        if found["url"]:
+            parsed = up.urlparse(found["url"])
+            path_parts = parsed.path.split('/')
+            try:
+                username_idx = path_parts.index('username')
+                if username_idx >= 0 and username_idx + 1 < len(path_parts):
+                    actual_username = path_parts[username_idx + 1]
+            except ValueError:
+                pass
+
+            qs = up.parse_qs(parsed.query)
+            uvals = qs.get("uniq") or qs.get("uniq[]") or []
+            if uvals:
+                uniq = _sanitize_uniq_candidate(uvals[0])
+                uniq_source = "network-request"
+                api_url = found["url"]
+            else:
+                m = re.search(r"uniq=([A-Za-z0-9_-]+)", found["url"], re.IGNORECASE)
+                if m:
+                    uniq = _sanitize_uniq_candidate(m.group(1))
+                    uniq_source = "network-request-regex"
+                    api_url = found["url"]
+
+        if not uniq and captured_urls:
+            for entry in captured_urls:
+                m = re.search(r"uniq=([A-Za-z0-9_-]+)", entry, re.IGNORECASE)
+                if not m:
+                    continue
+                candidate = _sanitize_uniq_candidate(m.group(1))
+                if candidate:
+                    uniq = candidate
+                    uniq_source = "captured-request"
+                    break
+
+        html = await page.content()
+        if not uniq:
+            uniq_from_html = extract_uniq_from_html(username, html)
+            if uniq_from_html:
+                uniq = uniq_from_html
+                uniq_source = "page-html"
+                print(f"[Playwright] 在 HTML 中提取到 uniq={uniq}")
+        if not uniq:
+            try:
+                nuxt_snapshot = await page.evaluate("""() => {
+                    const root = window.__NUXT__ || null;
+                    if (!root) {
+                        return null;
+                    }
+                    try {
+                        return JSON.stringify(root);
+                    } catch (err) {
+                        return null;
+                    }
+                }""")
+            except Exception:
+                nuxt_snapshot = None
+            if nuxt_snapshot and not uniq:
+                uniq_from_nuxt = extract_uniq_from_html(username, nuxt_snapshot)
+                if uniq_from_nuxt:
+                    uniq = uniq_from_nuxt
+                    uniq_source = "nuxt-state"
+                    print(f"[Playwright] 在 __NUXT__ 数据中提取到 uniq={uniq}")
+
+        if not uniq:
+            try:
+                nuxt_data_script = await page.evaluate("""() => {
+                    const el = document.querySelector('script[id="__NUXT_DATA__"]');
+                    return el ? el.textContent : null;
+                }""")
+            except Exception:
+                nuxt_data_script = None
+            if nuxt_data_script:
+                uniq_from_script = extract_uniq_from_html(username, nuxt_data_script)
+                if uniq_from_script:
+                    uniq = uniq_from_script
+                    uniq_source = "nuxt-data-script"
+                    print(f"[Playwright] 在 __NUXT_DATA__ 中提取到 uniq={uniq}")
+
+        storage_snapshots: list[dict[str, str]] = []
+        if not uniq:
+            try:
+                local_storage = await page.evaluate("""() => {
+                    if (!window.localStorage) { return null; }
+                    const data = {};
+                    for (let i = 0; i < localStorage.length; i++) {
+                        const key = localStorage.key(i);
+                        data[key] = localStorage.getItem(key);
+                    }
+                    return data;
+                }""")
+                if isinstance(local_storage, dict):
+                    storage_snapshots.append(local_storage)
+            except Exception:
+                pass
+            try:
+                session_storage = await page.evaluate("""() => {
+                    if (!window.sessionStorage) { return null; }
+                    const data = {};
+                    for (let i = 0; i < sessionStorage.length; i++) {
+                        const key = sessionStorage.key(i);
+                        data[key] = sessionStorage.getItem(key);
+                    }
+                    return data;
+                }""")
+                if isinstance(session_storage, dict):
+                    storage_snapshots.append(session_storage)
+            except Exception:
+                pass
+            for snapshot in storage_snapshots:
+                if not snapshot:
+                    continue
+                for key, value in snapshot.items():
+                    if key and "uniq" in key.lower():
+                        candidate = _sanitize_uniq_candidate(value)
+                        if candidate:
+                            uniq = candidate
+                            uniq_source = f"storage:{key}"
+                            print(f"[Playwright] 在 storage {key} 中提取到 uniq={uniq}")
+                            break
+                if uniq:
+                    break
+
+        cookies = await context.cookies()
+        cookie_dict = {c['name']: c['value'] for c in cookies}
+        if not uniq:
+            for c in cookies:
+                name = c.get('name', '')
+                if name and 'uniq' in name.lower():
+                    candidate = _sanitize_uniq_candidate(c.get('value'))
+                    if candidate:
+                        uniq = candidate
+                        uniq_source = f"cookie:{name}"
+                        print(f"[Playwright] 在 Cookie {name} 中提取到 uniq={uniq}")
+                        break
+        try:
+            ua = await page.evaluate("() => navigator.userAgent")
+        except Exception:
+            ua = DEFAULT_USER_AGENT
+
+        final_username = actual_username or username
+        if uniq and not api_url:
+            api_url = build_chat_api_url(site_origin, final_username, uniq)
+
+        if uniq:
+            print(
+                f"[Playwright] 成功获取 uniq={uniq}，"
+                f"cookies_keys={list(cookie_dict.keys())}，来源={uniq_source or 'unknown'}"
+            )
+            if actual_username and actual_username != username:
+                print(f"[Playwright] ⚠️ 检测到用户名变更: {username} -> {actual_username}")
+            _record_acquired_credentials(username, actual_username, site_origin, uniq, cookie_dict, ua, api_url)
+        else:
+            print(f"[Playwright] 未提取到 uniq（network requests 和 HTML 均无），已抓取 {len(cookie_dict)} 个 cookie")
+
+        return uniq, cookie_dict, ua, html, actual_username
+    finally:
+        if pending_sizes:
+            done, not_done = await asyncio.wait(pending_sizes, timeout=1)
+            for fut in not_done:
+                fut.cancel()
+            for fut in done:
+                if not fut.cancelled() and fut.exception() is None:
+                    sizes = fut.result()
+                    traffic["bytes"] += sizes.get("responseHeadersSize", 0) + sizes.get("responseBodySize", 0)
+        try:
+            await page.close()
+        except Exception:
+            pass
+        _record_capture_stats(profile_name, traffic, (time.perf_counter() - started) * 1000)
+
+
+async def fetch_page_uniq_and_cookies(
+    username: str,
+    headless: bool = True,
+    nav_timeout: int = 30000,
+    watch_time: int = 8000,
+    profile: str | None = None,
+):
+    """
+    用 Playwright 打开主播主页，监听网络请求以捕获 '/chat?source=regular&uniq=...' 的请求。
+    返回 (uniq_or_None, cookies_dict, user_agent, html_or_error).
+    - nav_timeout: 页面导航超时时间（毫秒）
+    - watch_time: 在页面加载后继续监听网络请求的时间（毫秒）
+    - profile: 抓取配置（lite 拦截无关资源 / full 完整加载），默认取 SUPERCHAT_CAPTURE_PROFILE
+    每次调用都先经过准入队列（按房间优先级放行），准入是浏览器抓取唯一的并发闸门。
+    """
+    await BROWSER_ADMISSION.acquire(get_room_admission_priority(username))
+    try:
+        return await _fetch_page_uniq_admitted(username, headless, nav_timeout, watch_time, profile)
+    finally:
+        BROWSER_ADMISSION.release()
+
+
+async def _fetch_page_uniq_admitted(
+    username: str,
+    headless: bool,
+    nav_timeout: int,
+    watch_time: int,
+    profile: str | None,
+):
+    preferred_site = get_streamer_site_origin(username)
+    site_candidates = get_site_candidates(preferred_site)
+    last_error = ""
+    for site_origin in site_candidates:
+        home = build_room_url(site_origin, username)
+        print(
+            f"[Playwright] 打开页面获取 uniq: {home} "
+            f"(nav_timeout={nav_timeout}ms, watch_time={watch_time}ms)"
+        )
+        try:
+            return await BROWSER_POOL.run(
+                lambda context, site=site_origin: _capture_uniq_in_context(
+                    context, username, site, nav_timeout, watch_time, profile
+                ),
+                headless=headless,
+            )
+        except Exception as e:
+            err = f"ERROR in playwright fetch ({site_origin}): {e}"
+            last_error = err
+            print(err)
+            continue
+    return None, {}, "", (last_error or "ERROR in playwright fetch: no site candidates"), None
+
+
+# ---------- 免浏览器的 HTTP 快速通道 ----------
+# 每个站点的快速通道统计: {site_origin: {attempts, hits, misses, errors, rejected}}
+HTTP_FAST_PATH_STATS: Dict[str, Dict[str, int]] = {}
+
+
+def _bump_fast_path_stat(site_origin: str, key: str):
+    stats = HTTP_FAST_PATH_STATS.setdefault(
+        site_origin, {"attempts": 0, "hits": 0, "misses": 0, "errors": 0, "rejected": 0, "confirmed": 0}
+    )
+    stats[key] += 1
+
+
+async def fetch_page_uniq_via_http(username: str, exclude_uniq: str | None = None):
+    """
+    不启动浏览器，直接用共享 aiohttp 会话 GET 主播主页，从 HTML/__NUXT__ 中提取 uniq，
+    并收集响应（含重定向）中的 Set-Cookie。
+    返回与 fetch_page_uniq_and_cookies 相同的五元组；未提取到 uniq 时返回 None，由调用方回退到 Playwright。
+    """
+    session = await ensure_session()
+    for site_origin in get_site_candidates(get_streamer_site_origin(username)):
+        home = build_room_url(site_origin, username)
+        _bump_fast_path_stat(site_origin, "attempts")
+        headers = {
+            "User-Agent": DEFAULT_USER_AGENT,
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+        }
+        try:
+            async with session.get(home, headers=headers, timeout=HTTP_TIMEOUTS["room_page"]) as resp:
+                cookie_dict: Dict[str, str] = {}
+                for r in (*resp.history, resp):
+                    for name, morsel in r.cookies.items():
+                        cookie_dict[name] = morsel.value
+                if resp.status != 200:
+                    _bump_fast_path_stat(site_origin, "misses")
+                    continue
+                html = await resp.text(errors="replace")
+        except Exception as e:
+            _bump_fast_path_stat(site_origin, "errors")
+            if VERBOSE:
+                print(f"[HTTP快速通道] 请求 {home} 失败: {e}")
+            continue
+        candidates = [c for c in extract_uniq_candidates(html) if c != exclude_uniq]
+        if not candidates:
+            # 页面里只有刚被接口拒绝的 uniq 也算未命中
+            _bump_fast_path_stat(site_origin, "rejected" if exclude_uniq and exclude_uniq in html else "misses")
+            continue
+        uniq = candidates[0]
+        _bump_fast_path_stat(site_origin, "hits")
+        print(f"[HTTP快速通道] 从 {home} 提取到 uniq={uniq}，cookies_keys={list(cookie_dict.keys())}")
+        _record_acquired_credentials(
+            username, None, site_origin, uniq, cookie_dict, DEFAULT_USER_AGENT,
+            build_chat_api_url(site_origin, username, uniq), confirmed=False,
+        )
+        return uniq, cookie_dict, DEFAULT_USER_AGENT, html, None
+    return None
+
+
+def get_http_fast_path_stats() -> Dict[str, Dict[str, float]]:
+    """各站点快速通道命中率，用于评估节省了多少次浏览器启动。"""
+    result: Dict[str, Dict[str, float]] = {}
+    for site, stats in HTTP_FAST_PATH_STATS.items():
+        row: Dict[str, float] = dict(stats)
+        row["hit_rate"] = stats["hits"] / stats["attempts"] if stats["attempts"] else 0.0
+        result[site] = row
+    return result
+
+
+# 单飞（single-flight）：同一 (site_origin, username) 同时只进行一次凭据获取，
+# 并发调用方等待同一个结果；刚获取成功的结果在宽限期内直接复用。
+CREDENTIAL_FLIGHTS: Dict[tuple[str, str], asyncio.Task] = {}
+CREDENTIAL_FLIGHT_RECENT: Dict[tuple[str, str], tuple[float, Dict[str, Any]]] = {}
+CREDENTIAL_FLIGHT_STATS: Dict[str, int] = {"flights": 0, "coalesced": 0, "grace_hits": 0, "rejoined": 0}
+
+
+def _copy_credentials(creds: Dict[str, Any]) -> Dict[str, Any]:
+    result = dict(creds)
+    result["cookies"] = dict(creds.get("cookies") or {})
+    return result
+
+
+def _on_credential_flight_done(key: tuple[str, str], task: asyncio.Task):
+    if CREDENTIAL_FLIGHTS.get(key) is task:
+        CREDENTIAL_FLIGHTS.pop(key, None)
+    if task.cancelled():
+        return
+    if task.exception() is not None:
+        return
+    result = task.result()
+    if result.get("uniq"):
+        CREDENTIAL_FLIGHT_RECENT[key] = (time.time(), result)
+
+
+async def _single_flight_credentials(key: tuple[str, str], factory, exclude_uniq: str | None = None) -> Dict[str, Any]:
+    recent = CREDENTIAL_FLIGHT_RECENT.get(key)
+    if recent and time.time() - recent[0] <= CREDENTIAL_GRACE_SEC:
+        uniq = recent[1].get("uniq")
+        if uniq and uniq != exclude_uniq:
+            CREDENTIAL_FLIGHT_STATS["grace_hits"] += 1
+            if VERBOSE:
+                print(f"[{key[1]}] 复用 {CREDENTIAL_GRACE_SEC} 秒宽限期内刚获取的凭据 uniq={uniq}")
+            return _copy_credentials(recent[1])
+    task = CREDENTIAL_FLIGHTS.get(key)
+    if task is None or task.done():
+        CREDENTIAL_FLIGHT_STATS["flights"] += 1
+        # 独立任务执行，发起方被取消（如停止监控）也不影响其他等待者
+        task = asyncio.ensure_future(factory())
+        CREDENTIAL_FLIGHTS[key] = task
+        task.add_done_callback(lambda t, k=key: _on_credential_flight_done(k, t))
+        return _copy_credentials(await asyncio.shield(task))
+    CREDENTIAL_FLIGHT_STATS["coalesced"] += 1
+    if VERBOSE:
+        print(f"[{key[1]}] 已有进行中的凭据获取，合并等待")
+    result = await asyncio.shield(task)
+    if exclude_uniq and result.get("uniq") == exclude_uniq:
+        # 合并到的获取按发起方的 exclude_uniq 进行，拿回的恰好是本调用刚被拒绝的 uniq：重新发起一次
+        CREDENTIAL_FLIGHT_STATS["rejoined"] += 1
+        return await _single_flight_credentials(key, factory, exclude_uniq)
+    return _copy_credentials(result)
+
+
+def _adopt_site_credentials(username: str, shared: Dict[str, Any]) -> Dict[str, Any]:
+    SITE_CREDENTIAL_STATS["shared_hits"] += 1
+    get_room_state(username).site_origin = shared["site_origin"]
+    # 复用的凭据同样写入房间缓存，重启后该房间可直接恢复
+    remember_room_credentials(
+        username,
+        shared["site_origin"],
+        shared["uniq"],
+        shared["cookies"],
+        shared["ua"],
+        build_chat_api_url(shared["site_origin"], username, shared["uniq"]),
+        acquired_at=shared["acquired_at"],
+    )
+    if VERBOSE:
+        print(f"[{username}] 复用站点共享凭据 uniq={shared['uniq']}（来自 {shared.get('source_username')}）")
+    return {
+        "uniq": shared["uniq"],
+        "cookies": dict(shared["cookies"]),
+        "ua": shared["ua"],
+        "site_origin": shared["site_origin"],
+        "actual_username": None,
+        "scope": "site",
+    }
+
+
+def _get_site_credential_lock(site_origin: str) -> asyncio.Lock:
+    lock = SITE_CREDENTIAL_LOCKS.get(site_origin)
+    if lock is None:
+        lock = asyncio.Lock()
+        SITE_CREDENTIAL_LOCKS[site_origin] = lock
+    return lock
+
+
+async def _capture_room_credentials(
+    username: str,
+    site_origin: str,
+    nav_timeout: int,
+    exclude_uniq: str | None,
+    max_age: float | None,
+) -> Dict[str, Any]:
+    # 站点锁只保护“检查共享凭据 + 决定是否合并”，网络请求与浏览器抓取都在锁外进行，
+    # 浏览器并发完全交给准入队列按优先级控制
+    lock = _get_site_credential_lock(site_origin)
+    async with lock:
+        shared = get_site_credentials(site_origin, exclude_uniq, max_age)
+        if shared is not None:
+            return _adopt_site_credentials(username, shared)
+    SITE_CREDENTIAL_STATS["room_captures"] += 1
+    fetched = None
+    via = "http"
+    if HTTP_FAST_PATH_ENABLED:
+        fetched = await fetch_page_uniq_via_http(username, exclude_uniq)
+    if fetched is None:
+        via = "playwright"
+        async with lock:
+            shared = get_site_credentials(site_origin, exclude_uniq, max_age)
+            if shared is not None:
+                return _adopt_site_credentials(username, shared)
+            flight = SITE_CAPTURE_FLIGHTS.get(site_origin)
+            leader = flight is None
+            if leader:
+                flight = asyncio.get_running_loop().create_future()
+                SITE_CAPTURE_FLIGHTS[site_origin] = flight
+        if not leader:
+            # 同站已有浏览器抓取在进行：等它结束后复用；没拿到可用凭据再自己抓（不再合并）
+            SITE_CREDENTIAL_STATS["capture_waits"] += 1
+            await asyncio.shield(flight)
+            async with lock:
+                shared = get_site_credentials(site_origin, exclude_uniq, max_age)
+                if shared is not None:
+                    return _adopt_site_credentials(username, shared)
+        try:
+            fetched = await fetch_page_uniq_and_cookies(username, True, nav_timeout)
+        finally:
+            if leader:
+                SITE_CAPTURE_FLIGHTS.pop(site_origin, None)
+                if not flight.done():
+                    flight.set_result(None)
+    uniq, cookies, ua, html, actual_username = fetched
+    return {
+        "uniq": uniq,
+        "cookies": cookies,
+        "ua": ua,
+        "site_origin": get_streamer_site_origin(actual_username or username),
+        "actual_username": actual_username,
+        "scope": "room",
+        "via": via,
+    }
+
+
+async def acquire_room_credentials(
+    username: str,
+    nav_timeout: int = 10000,
+    exclude_uniq: str | None = None,
+    max_age: float | None = None,
+) -> Dict[str, Any]:
+    """
+    为房间获取可用凭据：优先复用站点共享凭据，没有可用的才打开浏览器抓取该房间。
+    - 同一站点同时只有一个房间启动浏览器抓取，其余房间等它结束后直接复用，避免 N 个房间启动 N 次浏览器
+    - 同一 (site_origin, username) 的并发调用合并为一次获取（single-flight）
+    返回 {"uniq", "cookies", "ua", "site_origin", "actual_username", "scope"}，uniq 为 None 表示失败。
+    """
+    site_origin = get_streamer_site_origin(username)
+    shared = get_site_credentials(site_origin, exclude_uniq, max_age)
+    if shared is not None:
+        return _adopt_site_credentials(username, shared)
+    return await _single_flight_credentials(
+        (site_origin, username),
+        lambda: _capture_room_credentials(username, site_origin, nav_timeout, exclude_uniq, max_age),
+        exclude_uniq,
+    )
+
+
+# ---------- 凭据寿命统计与主动续期 ----------
+# uniq -> 首次获取时间；同一 uniq 可能被同站多个房间共享，只记一次
+CREDENTIAL_ISSUED_AT: Dict[str, float] = {}
+# 每个站点最近观测到的凭据寿命（秒）: {site_origin: deque([...])}
+CREDENTIAL_LIFETIMES: Dict[str, deque] = {}
+CREDENTIAL_RENEW_STATS = {"expiries_observed": 0, "renewals": 0, "renew_failures": 0, "swaps": 0}
+CREDENTIAL_RENEWER_TASK: asyncio.Task | None = None
+
+
+def observe_credential_expiry(site_origin: str, uniq: str | None):
+    """chat 接口拒绝某个 uniq 时调用：记录它实际存活了多久。"""
+    issued_at = CREDENTIAL_ISSUED_AT.pop(uniq, None) if uniq else None
+    if issued_at is None:
+        return
+    lifetime = time.time() - issued_at
+    site = _normalize_site_origin(site_origin)
+    CREDENTIAL_LIFETIMES.setdefault(site, deque(maxlen=20)).append(lifetime)
+    CREDENTIAL_RENEW_STATS["expiries_observed"] += 1
+    if VERBOSE:
+        print(f"[凭据续期] {site} 的 uniq={uniq} 存活 {lifetime:.0f}s")
+
+
+def predict_credential_lifetime(site_origin: str) -> float | None:
+    """按该站点历史寿命的较低分位（20%）预测，样本不足时返回 None。"""
+    samples = CREDENTIAL_LIFETIMES.get(_normalize_site_origin(site_origin))
+    if not samples or len(samples) < CREDENTIAL_RENEW_MIN_SAMPLES:
+        return None
+    ordered = sorted(samples)
+    return ordered[int(len(ordered) * 0.2)]
+
+
+def get_credential_lifetime_stats() -> Dict[str, Dict[str, float]]:
+    result: Dict[str, Dict[str, float]] = {}
+    for site, samples in CREDENTIAL_LIFETIMES.items():
+        predicted = predict_credential_lifetime(site)
+        result[site] = {
+            "samples": len(samples),
+            "min_sec": min(samples),
+            "avg_sec": sum(samples) / len(samples),
+            "predicted_sec": predicted if predicted is not None else 0.0,
+        }
+    return result
+
+
+def _swap_room_credentials(username: str, creds: Dict[str, Any]) -> bool:
+    """把新凭据一次性写入房间状态（同步执行，中间不会切换协程，轮询任务读到的总是完整的一组）。"""
+    state = ROOM_STATE.get(username)
+    if not state or not creds.get("uniq"):
+        return False
+    if creds.get("actual_username") and creds["actual_username"] != username:
+        # 用户名变更涉及配置与任务迁移，交给 poll_room_tick 的刷新分支处理
+        return False
+    state.set_credentials(
+        username, get_streamer_site_origin(username), creds["uniq"], creds["cookies"], creds["ua"],
+        credential_source_of(creds),
+    )
+    CREDENTIAL_RENEW_STATS["swaps"] += 1
+    return True
+
+
+async def _renew_room_credentials(username: str, old_uniq: str) -> bool:
+    try:
+        creds = await acquire_room_credentials(username, exclude_uniq=old_uniq)
+    except Exception as e:
+        CREDENTIAL_RENEW_STATS["renew_failures"] += 1
+        print(f"[{username}] 主动续期失败: {e}")
+        return False
+    state = ROOM_STATE.get(username)
+    # 续期期间轮询任务可能已经自行刷新过，不再覆盖
+    if not state or state.uniq != old_uniq:
+        return True
+    if _swap_room_credentials(username, creds):
+        CREDENTIAL_RENEW_STATS["renewals"] += 1
+        print(f"[{username}] 主动续期：uniq {old_uniq} -> {creds['uniq']}")
+        return True
+    CREDENTIAL_RENEW_STATS["renew_failures"] += 1
+    return False
+
+
+def schedule_credential_renewals(renewing: Dict[str, asyncio.Task], retry_after: Dict[str, float], now: float):
+    """续期任务的一轮检查：为预计即将失效的房间启动续期，renewing / retry_after 由调用方跨轮保存。"""
+    for username, task in [(u, t) for u, t in renewing.items() if t.done()]:
+        renewing.pop(username)
+        if task.cancelled() or not task.result():
+            retry_after[username] = now + 60  # 续期失败后退避，过期时仍由轮询分支兜底刷新
+    for uniq in [u for u, t in CREDENTIAL_ISSUED_AT.items() if now - t > 86400]:
+        CREDENTIAL_ISSUED_AT.pop(uniq, None)
+    for username, task in list(RUNNING_TASKS.items()):
+        if task.done() or username in renewing or now < retry_after.get(username, 0):
+            continue
+        state = ROOM_STATE.get(username)
+        uniq = state.uniq if state else None
+        issued_at = CREDENTIAL_ISSUED_AT.get(uniq) if uniq else None
+        predicted = predict_credential_lifetime((state and state.site_origin) or get_streamer_site_origin(username))
+        if issued_at is None or predicted is None:
+            continue
+        if now < issued_at + predicted - CREDENTIAL_RENEW_LEAD_SEC:
+            continue
+        renewing[username] = asyncio.create_task(_renew_room_credentials(username, uniq))
+
+
+async def credential_renewer_loop():
+    """后台续期：在预测失效前 CREDENTIAL_RENEW_LEAD_SEC 秒换上新凭据，轮询全程继续使用旧凭据。"""
+    renewing: Dict[str, asyncio.Task] = {}
+    retry_after: Dict[str, float] = {}
+    while True:
+        await asyncio.sleep(CREDENTIAL_RENEW_CHECK_INTERVAL)
+        schedule_credential_renewals(renewing, retry_after, time.time())
+
+
+def credential_renewer_running() -> bool:
+    """续期任务在运行时由它负责轮换凭据，轮询不再按 REFRESH_UNIQ_INTERVAL 强制刷新。"""
+    return CREDENTIAL_RENEWER_TASK is not None and not CREDENTIAL_RENEWER_TASK.done()
+
+
+def ensure_credential_renewer():
+    global CREDENTIAL_RENEWER_TASK
+    if not CREDENTIAL_RENEW_ENABLED:
+        return
+    if CREDENTIAL_RENEWER_TASK is None or CREDENTIAL_RENEWER_TASK.done():
+        CREDENTIAL_RENEWER_TASK = asyncio.create_task(credential_renewer_loop())
+
+
+# ---------- 通过官方接口提取菜单（优先方案） ----------
+async def fetch_tip_menu_via_api(username: str, nav_timeout: int = 30000) -> Dict[str, Any]:
+    result = {"menu_items": [], "detailed_items": [], "error": None, "source": "api"}
+    try:
+        state = ROOM_STATE.get(username)
+        uniq = state.uniq if state else None
+        cookies = state.cookies if state else {}
+        ua = (state.ua if state else None) or DEFAULT_USER_AGENT
+
+        if not uniq:
+            creds = await acquire_room_credentials(username, nav_timeout)
+            uniq, cookies, ua, actual_username = creds["uniq"], creds["cookies"], creds["ua"], creds["actual_username"]
+            if actual_username and actual_username != username:
+                try:
+                    if update_streamer_username(username, actual_username):
+                        username = actual_username
+                        state = ROOM_STATE.get(username)
+                except Exception as rename_err:
+                    print(f"[{username}] 更新用户名失败: {rename_err}")
+            if not uniq:
+                result["error"] = "未能获取 uniq，无法调用菜单接口"
+                return result
+
+        timezone_offset = get_local_timezone_offset_minutes()
+        params = {
+            "timezoneOffset": timezone_offset,
+            "triggerRequest": "loadCam",
+            "withEnhancedMixedTags": "true",
+            "primaryTag": "girls",
+            "isRevised": "false",
+            "uniq": uniq
+        }
+
+        site_origin = get_streamer_site_origin(username)
+        headers = {
+            "User-Agent": ua,
+            "Accept": "application/json, text/plain, */*",
+            "Referer": build_room_url(site_origin, username)
+        }
+        if cookies:
+            headers["Cookie"] = "; ".join([f"{k}={v}" for k, v in cookies.items()])
+
+        base_url = build_cam_api_url(site_origin, username)
+        session = await ensure_session()
+        try:
+            async with session.get(base_url, headers=headers, params=params, timeout=HTTP_TIMEOUTS["cam"]) as resp:
+                if resp.status != 200:
+                    result["error"] = f"接口状态码 {resp.status}"
+                    return result
+                try:
+                    data = await resp.json(content_type=None)
+                except ValueError as json_err:
+                    result["error"] = f"JSON解析失败: {json_err}"
+                    return result
+        except asyncio.TimeoutError:
+            result["error"] = "接口请求超时"
+            return result
+        except aiohttp.ClientError as req_err:
+            result["error"] = f"接口请求失败: {req_err}"
+            return result
+
+        tip_menu = ((data or {}).get("cam") or {}).get("tipMenu") or {}
+        settings = tip_menu.get("settings") or []
+        if not settings:
+            result["error"] = "接口未返回 tipMenu 数据"
+            return result
+
+        detailed_items = []
+        for entry in settings:
+            activity = str(entry.get("activity") or "").strip()
+            price_val = entry.get("price")
+            if not activity or price_val in (None, ""):
+                continue
+            price_text = str(price_val)
+            detailed_items.append({
+                "activity": activity,
                 "price": price_text,
                 "text": activity,
                 "raw": entry
@@ -815,6 +2889,63 @@ def fetch_tip_menu_via_api(username: str, nav_timeout: int = 30000) -> Dict[str,
 
 
 # ---------- 在线状态检测（基于搜索/suggestion API） ----------
+# suggestion 响应一次返回多位主播，把每位的直播状态都记下来供其他房间复用
+# 结构: {username_lower: {"status": bool, "at": 时间戳, "source": 发起查询的房间}}
+SUGGESTION_STATUS_CACHE: Dict[str, Dict[str, Any]] = {}
+# 每个房间最近一次采用的缓存条目时间，同一条观测不会被同一房间用两次（下播确认需要两次独立检查）
+SUGGESTION_STATUS_CONSUMED: Dict[str, float] = {}
+SUGGESTION_STATUS_STATS = {"lookups": 0, "hits": 0, "requests": 0, "models_cached": 0}
+
+
+def _model_live_status(model: Dict[str, Any]) -> bool | None:
+    """优先使用 isLive（是否在直播），不存在则使用 isOnline（是否在线）。"""
+    is_live = model.get("isLive")
+    if is_live is not None:
+        return bool(is_live)
+    is_online = model.get("isOnline")
+    if is_online is not None:
+        return bool(is_online)
+    return None
+
+
+def _remember_suggestion_statuses(models_list: list, source_username: str):
+    now = time.time()
+    for model in models_list:
+        if not isinstance(model, dict):
+            continue
+        model_username = model.get("username") or model.get("login") or model.get("name") or ""
+        status = _model_live_status(model)
+        if not model_username or status is None:
+            continue
+        SUGGESTION_STATUS_CACHE[model_username.lower()] = {"status": status, "at": now, "source": source_username}
+        SUGGESTION_STATUS_STATS["models_cached"] += 1
+    if len(SUGGESTION_STATUS_CACHE) > 2000:
+        for key in [k for k, v in SUGGESTION_STATUS_CACHE.items() if now - v["at"] > STATUS_CACHE_TTL]:
+            SUGGESTION_STATUS_CACHE.pop(key, None)
+
+
+def get_cached_online_status(username: str) -> bool | None:
+    """其他房间的 suggestion 查询最近看到过该主播时直接返回其状态，否则返回 None。"""
+    if not STATUS_CACHE_TTL:
+        return None
+    SUGGESTION_STATUS_STATS["lookups"] += 1
+    entry = SUGGESTION_STATUS_CACHE.get(username.lower())
+    if not entry or entry["source"] == username:
+        return None
+    if time.time() - entry["at"] > STATUS_CACHE_TTL or entry["at"] <= SUGGESTION_STATUS_CONSUMED.get(username, 0):
+        return None
+    SUGGESTION_STATUS_CONSUMED[username] = entry["at"]
+    SUGGESTION_STATUS_STATS["hits"] += 1
+    return entry["status"]
+
+
+def get_status_cache_stats() -> Dict[str, float]:
+    stats: Dict[str, float] = dict(SUGGESTION_STATUS_STATS)
+    stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+    stats["entries"] = len(SUGGESTION_STATUS_CACHE)
+    return stats
+
+
 async def check_online_status_via_search(
     session: aiohttp.ClientSession,
     username: str,
@@ -824,886 +2955,1427 @@ async def check_online_status_via_search(
     site_origin: str,
 ) -> bool | None:
     """
-    通过搜索 suggestion API 检查主播在线状态。
-    返回 True(在线) / False(离线) / None(无法确定)
+    通过搜索 suggestion API 检查主播在线状态。
+    返回 True(在线) / False(离线) / None(无法确定)
+    """
+    cached_status = get_cached_online_status(username)
+    if cached_status is not None:
+        if VERBOSE:
+            print(f"[{username}] 复用其他房间 suggestion 响应中的直播状态: {cached_status}")
+        return cached_status
+    try:
+        # 构建 suggestion API URL
+        suggestion_url = build_suggestion_api_url(site_origin, username, uniq)
+        SUGGESTION_STATUS_STATS["requests"] += 1
+        
+        cookie_header = "; ".join([f"{k}={v}" for k, v in cookies.items()])
+        headers = {
+            "User-Agent": ua,
+            "Accept": "application/json, text/plain, */*",
+            "Referer": f"{site_origin.rstrip('/')}/",
+            "Cookie": cookie_header,
+        }
+        
+        async with session.get(suggestion_url, headers=headers, timeout=HTTP_TIMEOUTS["suggestion"]) as resp:
+            if resp.status != 200:
+                if VERBOSE:
+                    print(f"[{username}] suggestion API 状态码: {resp.status}")
+                return None
+            
+            try:
+                data = await resp.json(content_type=None)
+                if VERBOSE:
+                    print(f"[{username}] suggestion API 响应类型: {type(data).__name__}")
+            except Exception as e:
+                if VERBOSE:
+                    print(f"[{username}] suggestion API JSON 解析失败: {e}")
+                    text = await resp.text()
+                    print(f"[{username}] suggestion API 响应内容（前500字符）: {text[:500]}")
+                return None
+            
+            # suggestion 响应可能是字典（包含 models 键）或直接是列表
+            models_list = None
+            if isinstance(data, dict):
+                if VERBOSE:
+                    print(f"[{username}] suggestion API 响应是字典，键: {list(data.keys())}")
+                # 尝试从常见键中获取模型列表
+                models_list = data.get("models") or data.get("results") or data.get("data")
+                if models_list and isinstance(models_list, list):
+                    if VERBOSE:
+                        print(f"[{username}] 从字典中提取到 {len(models_list)} 个模型")
+                else:
+                    models_list = None
+            elif isinstance(data, list):
+                models_list = data
+                if VERBOSE:
+                    print(f"[{username}] suggestion API 响应是列表，包含 {len(models_list)} 个结果")
+            
+            # 在模型列表中查找匹配的主播
+            if models_list and isinstance(models_list, list):
+                _remember_suggestion_statuses(models_list, username)
+                for idx, model in enumerate(models_list):
+                    # 尝试匹配用户名
+                    model_username = model.get("username") or model.get("login") or model.get("name") or ""
+                    
+                    if VERBOSE and idx < 3:  # 只打印前3个结果用于调试
+                        print(f"[{username}] suggestion[{idx}]: username={model_username}")
+                    
+                    if model_username.lower() == username.lower():
+                        if VERBOSE:
+                            print(f"[{username}] 找到匹配的主播: {model_username}")
+                        
+                        # 提取直播状态（优先使用 isLive，因为主要目的是检测是否在直播）
+                        is_live = model.get("isLive")
+                        is_online = model.get("isOnline")
+                        
+                        # 优先使用 isLive（是否在直播），如果不存在则使用 isOnline（是否在线）
+                        if is_live is not None:
+                            result = bool(is_live)
+                            if VERBOSE:
+                                print(f"[{username}] 从 isLive 字段提取到直播状态: {result} (isLive={is_live}, isOnline={is_online})")
+                            return result
+                        elif is_online is not None:
+                            result = bool(is_online)
+                            if VERBOSE:
+                                print(f"[{username}] 从 isOnline 字段提取到在线状态: {result} (isOnline={is_online}, isLive未找到)")
+                            return result
+                        else:
+                            # 如果都没找到，尝试其他字段
+                            if VERBOSE:
+                                status_fields = {k: v for k, v in model.items() if any(kw in k.lower() for kw in ["status", "live", "online", "broadcast"])}
+                                print(f"[{username}] 未找到 isOnline/isLive，相关字段: {status_fields}")
+                            return None
+                
+                # 如果没找到匹配的主播
+                if VERBOSE:
+                    print(f"[{username}] suggestion API 中未找到匹配的主播（用户名: {username}）")
+                    usernames_found = [m.get("username") or m.get("login") or m.get("name") or "unknown" for m in models_list[:5]]
+                    print(f"[{username}] 找到的用户名: {usernames_found}")
+            else:
+                if VERBOSE:
+                    print(f"[{username}] suggestion API 响应格式无法识别，类型: {type(data).__name__}")
+            
+            return None
+            
+    except Exception as e:
+        if VERBOSE:
+            print(f"[{username}] 检查在线状态异常: {e}")
+        return None
+
+# ---------- 自适应轮询间隔 ----------
+# 每个房间的轮询节奏: {username: {interval, ewma_new, unseen_frac, window, polls}}
+ROOM_POLL_RATE: Dict[str, Dict[str, float]] = {}
+
+
+def record_poll_result(username: str, total: int, new: int):
+    """记录一次 chat 响应：共 total 条消息，其中 new 条此前未见过，据此调整该房间的轮询间隔。"""
+    rate = ROOM_POLL_RATE.get(username)
+    if rate is None:
+        rate = {"interval": float(POLL_INTERVAL), "ewma_new": 0.0, "unseen_frac": 0.0, "window": 0.0, "polls": 0}
+        ROOM_POLL_RATE[username] = rate
+    rate["polls"] += 1
+    # 接口单次返回的消息条数有上限，以观测到的最大值作为窗口大小
+    rate["window"] = max(rate["window"], float(total))
+    if rate["polls"] == 1:
+        # 首次响应全是历史消息，只用来估计窗口大小
+        return
+    rate["ewma_new"] = POLL_EWMA_ALPHA * new + (1 - POLL_EWMA_ALPHA) * rate["ewma_new"]
+    rate["unseen_frac"] = new / total if total else 0.0
+    interval = rate["interval"]
+    if total >= max(5.0, rate["window"] * 0.9) and rate["unseen_frac"] >= POLL_OVERFLOW_FRACTION:
+        # 响应几乎被新消息占满，窗口外可能已有消息被挤掉：立即减半
+        interval *= 0.5
+    elif rate["ewma_new"] < 0.05:
+        # 安静房间逐步退避到上限
+        interval *= 1.25
+    else:
+        # 让每次轮询的新消息约占窗口一半，单次调整幅度限制在 0.5~1.5 倍
+        target = max(1.0, rate["window"] * 0.5)
+        interval *= min(1.5, max(0.5, target / rate["ewma_new"]))
+    rate["interval"] = min(float(POLL_INTERVAL_MAX), max(float(POLL_INTERVAL_MIN), interval))
+
+
+def get_room_poll_interval(username: str) -> float:
+    """直播中房间下次轮询前等待的秒数；刚发生打赏/转轮/达标事件的房间短时间内按最短间隔轮询。"""
+    rate = ROOM_POLL_RATE.get(username)
+    interval = rate["interval"] if rate else float(POLL_INTERVAL)
+    last_event = ROOM_LAST_EVENT_AT.get(username)
+    if last_event and time.time() - last_event < POLL_EVENT_BOOST_SEC:
+        interval = float(POLL_INTERVAL_MIN)
+    return interval
+
+
+def get_poll_rate_stats() -> Dict[str, Any]:
+    rooms = {
+        username: {k: round(v, 2) for k, v in rate.items()}
+        for username, rate in ROOM_POLL_RATE.items()
+    }
+    intervals = [rate["interval"] for rate in ROOM_POLL_RATE.values()]
+    return {
+        "rooms": len(rooms),
+        "avg_interval_sec": sum(intervals) / len(intervals) if intervals else 0.0,
+        "per_room": rooms,
+    }
+
+
+# ---------- 消息分类 ----------
+# 菜单文本中需要去除的 emoji 范围（分成多个不重叠的小范围，避免误伤中文字符 0x4E00-0x9FFF）
+MENU_EMOJI_PATTERNS = [
+    re.compile("[\U0001F600-\U0001F64F]+", flags=re.UNICODE),  # emoticons
+    re.compile("[\U0001F300-\U0001F5FF]+", flags=re.UNICODE),  # symbols & pictographs
+    re.compile("[\U0001F680-\U0001F6FF]+", flags=re.UNICODE),  # transport & map symbols
+    re.compile("[\U0001F1E0-\U0001F1FF]+", flags=re.UNICODE),  # flags (iOS)
+    re.compile("[\U00002702-\U000027B0]+", flags=re.UNICODE),  # 装饰符号
+    re.compile("[\U000024C2-\U000024FF]+", flags=re.UNICODE),  # 带圈字母和数字
+    re.compile("[\U00002600-\U000026FF]+", flags=re.UNICODE),  # 符号和象形文字
+    re.compile("[\U0001F900-\U0001F9FF]+", flags=re.UNICODE),  # 补充符号和象形文字
+    re.compile("[\U0001FA00-\U0001FAFF]+", flags=re.UNICODE),  # 扩展A
+]
+
+
+@functools.lru_cache(maxsize=4096)
+def clean_menu_text(text):
+    """清理文本：去除emoji和特殊字符，只保留中文、英文、数字
+    同时处理Unicode转义序列（\\uXXXX格式）"""
+    if not text:
+        return ""
+    # 首先处理Unicode转义序列（\\uXXXX格式），转换为实际字符
+    try:
+        # 如果文本包含 \u 转义序列（字面量形式，如 "\\u4e2d"），尝试解码
+        if '\\u' in text:
+            # 使用 unicode_escape 解码
+            text = text.encode().decode('unicode_escape')
+    except Exception:
+        # 如果解码失败，保持原文本
+        pass
+    for pattern in MENU_EMOJI_PATTERNS:
+        text = pattern.sub('', text)
+    # 去除其他特殊字符，只保留中文、英文、数字和常见标点
+    text = re.sub(r'[^\w\s\u4e00-\u9fff~-]', '', text)
+    # 去除多余空白
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip().lower()
+
+
+def match_selected_menu_item(menu_body: str, selected_items: list[str]) -> tuple[str, str, str] | None:
+    """
+    按选中顺序找出第一个与菜单打赏文本匹配的选中项，返回 (选中项, 清理后的选中项, 清理后的菜单文本)。
+    逐项比较的参考实现，轮询中使用预先构建的 MenuMatcher（结果与本函数一致）。
+    匹配规则：
+    1. 完全匹配（最高优先级）
+    2. 包含匹配：要求匹配的子串（较短的字符串）长度至少是较长字符串的30%，且至少3个字符
+       这样可以避免短字符串（如"测试"）误匹配长文本（如"这是一个测试菜单项"）
+    """
+    cleaned_menu_body = clean_menu_text(menu_body)
+    # 如果清理后的菜单文本为空，不进行匹配
+    if not cleaned_menu_body:
+        return None
+    for selected_item in selected_items:
+        cleaned_selected = clean_menu_text(selected_item)
+        # 如果清理后的选中项为空，跳过
+        if not cleaned_selected:
+            continue
+        is_match = False
+        if cleaned_selected == cleaned_menu_body:
+            is_match = True
+        elif cleaned_selected in cleaned_menu_body:
+            # 匹配的子串是 cleaned_selected，要求它至少是菜单文本长度的30%，且至少3个字符
+            is_match = len(cleaned_selected) >= max(3, int(len(cleaned_menu_body) * 0.3))
+        elif cleaned_menu_body in cleaned_selected:
+            # 匹配的子串是 cleaned_menu_body，要求它至少是选中项长度的30%，且至少3个字符
+            is_match = len(cleaned_menu_body) >= max(3, int(len(cleaned_selected) * 0.3))
+        if is_match:
+            return selected_item, cleaned_selected, cleaned_menu_body
+    return None
+
+
+def menu_price_key(value) -> float | None:
+    """菜单价格 / 打赏金额统一成可比较的键（保留两位小数），无法解析或不为正数时返回 None。"""
+    try:
+        price = round(float(value), 2)
+    except (TypeError, ValueError):
+        return None
+    return price if price > 0 else None
+
+
+MENU_MATCH_STATS = {"price_exact": 0, "text": 0, "price_only": 0, "miss": 0}
+
+
+class MenuMatcher:
+    """
+    一位主播选中菜单项的匹配索引，选中项或完整菜单变化时构建一次，文本匹配规则与 match_selected_menu_item 相同：
+    - exact：清理后的选中项 -> 位掩码，处理完全匹配
+    - Aho-Corasick 自动机：扫描一遍菜单文本，找出作为其子串出现的选中项（选中项包含于菜单文本）
+    - 广义后缀自动机：沿菜单文本走一遍，找出包含菜单文本的选中项（菜单文本包含于选中项）
+    - 价格索引：完整菜单（menu_items）中 价格 -> 该价格的选中项位掩码 / 菜单项数量
+    候选用位掩码表示（第 i 位 = 第 i 个选中项），按 30% / 3 字符规则过滤后取最低位，即按选中顺序第一个命中的项。
+    带金额匹配时先查价格索引：文本与金额对上完整菜单中的某一项时直接按该项是否选中判定；多个文本候选时优先价格相符的；
+    文本缺失或无法识别时，若该价格在完整菜单中只有一项且已选中，则按金额归属。
+    同一菜单文本的候选会缓存，菜单打赏的文本通常来自固定的菜单，几乎总是命中缓存。
+    """
+
+    CANDIDATE_CACHE_MAX = 1024
+
+    __slots__ = ("source", "menu_source", "items", "cleaned", "lengths", "exact", "price_masks", "price_entries",
+                 "menu_entries", "_ac_goto", "_ac_fail", "_ac_out", "_sam_next", "_sam_mask", "_candidate_cache")
+
+    def __init__(self, selected_items, menu_items=None):
+        self.source = tuple(selected_items or ())
+        self.menu_source = menu_items  # 按对象判断完整菜单是否被替换（菜单只会整体替换）
+        self.items: list[str] = []
+        self.cleaned: list[str] = []
+        for item in self.source:
+            # 过滤掉空字符串和空白字符串，以及清理后为空的选中项
+            if not item or not item.strip():
+                continue
+            cleaned = clean_menu_text(item)
+            if cleaned:
+                self.items.append(item)
+                self.cleaned.append(cleaned)
+        self.lengths = [len(cleaned) for cleaned in self.cleaned]
+        self.exact: Dict[str, int] = {}
+        for i, cleaned in enumerate(self.cleaned):
+            self.exact[cleaned] = self.exact.get(cleaned, 0) | (1 << i)
+        self._build_price_index(menu_items)
+        self._build_aho_corasick()
+        self._build_suffix_automaton()
+        self._candidate_cache: Dict[str, int] = {}
+
+    def _build_price_index(self, menu_items):
+        self.price_masks: Dict[float, int] = {}
+        self.price_entries: Dict[float, int] = {}
+        self.menu_entries: Dict[str, set[float]] = {}  # 清理后的菜单项文本 -> 价格
+        for entry in menu_items or ():
+            # 旧版本保存的菜单项可能是纯文本，没有价格
+            if not isinstance(entry, dict):
+                continue
+            price = menu_price_key(entry.get("price"))
+            cleaned = clean_menu_text(str(entry.get("activity") or entry.get("text") or "").strip())
+            if price is None or not cleaned:
+                continue
+            self.price_entries[price] = self.price_entries.get(price, 0) + 1
+            self.menu_entries.setdefault(cleaned, set()).add(price)
+            mask = self.exact.get(cleaned, 0)
+            if mask:
+                self.price_masks[price] = self.price_masks.get(price, 0) | mask
+
+    def _build_aho_corasick(self):
+        goto: list[Dict[str, int]] = [{}]
+        out = [0]
+        for i, pattern in enumerate(self.cleaned):
+            if len(pattern) < 3:
+                continue  # 不足 3 个字符的选中项不可能通过包含匹配
+            node = 0
+            for ch in pattern:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    out.append(0)
+                node = nxt
+            out[node] |= 1 << i
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in goto[node].items():
+                queue.append(nxt)
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] |= out[fail[nxt]]
+        self._ac_goto, self._ac_fail, self._ac_out = goto, fail, out
+
+    def _build_suffix_automaton(self):
+        # 各选中项以 "\0" 相连（清理后的文本不含该字符），每个状态记录其子串出现在哪些选中项中
+        nxt: list[Dict[str, int]] = [{}]
+        link = [-1]
+        length = [0]
+        mask = [0]
+        last = 0
+        for i, cleaned in enumerate(self.cleaned):
+            for ch in cleaned + "\0":
+                cur = len(nxt)
+                nxt.append({})
+                length.append(length[last] + 1)
+                link.append(0)
+                mask.append(0 if ch == "\0" else 1 << i)
+                p = last
+                while p != -1 and ch not in nxt[p]:
+                    nxt[p][ch] = cur
+                    p = link[p]
+                if p != -1:
+                    q = nxt[p][ch]
+                    if length[p] + 1 == length[q]:
+                        link[cur] = q
+                    else:
+                        clone = len(nxt)
+                        nxt.append(dict(nxt[q]))
+                        length.append(length[p] + 1)
+                        link.append(link[q])
+                        mask.append(0)
+                        while p != -1 and nxt[p].get(ch) == q:
+                            nxt[p][ch] = clone
+                            p = link[p]
+                        link[q] = clone
+                        link[cur] = clone
+                last = cur
+        # 按长度从长到短把出现位置沿后缀链接向上合并
+        for state in sorted(range(1, len(nxt)), key=length.__getitem__, reverse=True):
+            mask[link[state]] |= mask[state]
+        self._sam_next, self._sam_mask = nxt, mask
+
+    def _contained_in(self, text: str) -> int:
+        """作为 text 子串出现的选中项（位掩码）。"""
+        goto, fail, out = self._ac_goto, self._ac_fail, self._ac_out
+        node = 0
+        found = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            found |= out[node]
+        return found
+
+    def _containing(self, text: str) -> int:
+        """包含 text 的选中项（位掩码）。"""
+        nxt = self._sam_next
+        state = 0
+        for ch in text:
+            state = nxt[state].get(ch)
+            if state is None:
+                return 0
+        return self._sam_mask[state]
+
+    def _candidates(self, cleaned_menu_body: str) -> int:
+        """按文本规则与清理后的菜单文本匹配的全部选中项（位掩码）。"""
+        cached = self._candidate_cache.get(cleaned_menu_body)
+        if cached is not None:
+            return cached
+        body_len = len(cleaned_menu_body)
+        candidates = self.exact.get(cleaned_menu_body, 0)
+        # 选中项包含于菜单文本：要求选中项长度至少是菜单文本长度的30%，且至少3个字符
+        min_len = max(3, int(body_len * 0.3))
+        bits = self._contained_in(cleaned_menu_body) & ~candidates
+        while bits:
+            low = bits & -bits
+            if self.lengths[low.bit_length() - 1] >= min_len:
+                candidates |= low
+            bits ^= low
+        # 菜单文本包含于选中项：要求菜单文本长度至少是选中项长度的30%，且至少3个字符
+        if body_len >= 3:
+            bits = self._containing(cleaned_menu_body) & ~candidates
+            while bits:
+                low = bits & -bits
+                if body_len >= int(self.lengths[low.bit_length() - 1] * 0.3):
+                    candidates |= low
+                bits ^= low
+        if len(self._candidate_cache) >= self.CANDIDATE_CACHE_MAX:
+            self._candidate_cache.clear()
+        self._candidate_cache[cleaned_menu_body] = candidates
+        return candidates
+
+    def _pick(self, candidates: int, cleaned_menu_body: str) -> tuple[str, str, str]:
+        i = (candidates & -candidates).bit_length() - 1
+        return self.items[i], self.cleaned[i], cleaned_menu_body
+
+    def match(self, menu_body: str, amount=None) -> tuple[str, str, str] | None:
+        """返回 (选中项, 清理后的选中项, 清理后的菜单文本)，没有匹配时返回 None；不传金额时只按文本匹配。"""
+        if not self.items:
+            return None
+        cleaned_menu_body = clean_menu_text(menu_body)
+        price = menu_price_key(amount) if amount is not None else None
+        price_mask = self.price_masks.get(price, 0) if price is not None else 0
+        if cleaned_menu_body:
+            if price is not None and price in self.menu_entries.get(cleaned_menu_body, ()):
+                # 文本与金额都对上完整菜单中的某一项：就是这一项，只看它是否被选中，不再做包含匹配
+                exact = self.exact.get(cleaned_menu_body, 0) & price_mask
+                if exact:
+                    MENU_MATCH_STATS["price_exact"] += 1
+                    return self._pick(exact, cleaned_menu_body)
+                MENU_MATCH_STATS["miss"] += 1
+                return None
+            candidates = self._candidates(cleaned_menu_body)
+            if candidates:
+                MENU_MATCH_STATS["text"] += 1
+                return self._pick(candidates & price_mask or candidates, cleaned_menu_body)
+        # 文本缺失或无法识别（不是完整菜单中的任何一项）：金额在菜单中唯一对应一个选中项时按金额归属
+        if price_mask and self.price_entries.get(price) == 1 and cleaned_menu_body not in self.menu_entries:
+            MENU_MATCH_STATS["price_only"] += 1
+            return self._pick(price_mask, cleaned_menu_body)
+        MENU_MATCH_STATS["miss"] += 1
+        return None
+
+
+MENU_MATCHERS: Dict[str, MenuMatcher] = {}  # 用户名 -> 选中菜单项匹配索引
+
+
+def rebuild_menu_matcher(username: str) -> MenuMatcher:
+    """按主播当前的选中菜单项与完整菜单重建匹配索引。"""
+    streamer = get_streamer(username)
+    selected_items = streamer.get("selected_menu_items", []) if streamer else []
+    menu_items = (streamer.get("menu_items") or None) if streamer else None
+    matcher = MenuMatcher(selected_items, menu_items)
+    MENU_MATCHERS[username] = matcher
+    return matcher
+
+
+def get_menu_matcher(username: str) -> MenuMatcher:
+    """取得主播的匹配索引；选中项或完整菜单在别处被改动（如从文件加载）时按当前内容重建。"""
+    streamer = get_streamer(username)
+    selected_items = streamer.get("selected_menu_items", []) if streamer else []
+    menu_items = (streamer.get("menu_items") or None) if streamer else None
+    matcher = MENU_MATCHERS.get(username)
+    if matcher is None or matcher.source != tuple(selected_items or ()) or matcher.menu_source is not menu_items:
+        matcher = rebuild_menu_matcher(username)
+    return matcher
+
+
+EVENT_MAX_AGE = timedelta(minutes=5)  # 打赏/选单事件只记录 5 分钟内的
+
+
+class RoomConfigSnapshot:
+    """一次轮询内使用的房间配置（阈值、选中菜单项匹配索引），每次轮询只读取一次 STREAMERS。"""
+
+    __slots__ = ("threshold", "menu_matcher")
+
+    def __init__(self, username: str):
+        self.threshold = get_streamer_threshold(username)
+        self.menu_matcher = get_menu_matcher(username)
+
+
+class ChatMessage:
+    """需要分类处理的一条 chat 消息：金额、用户、时间只解析一次。"""
+
+    __slots__ = ("mid", "type", "details", "amount", "user", "ts", "_age", "_age_parsed")
+
+    def __init__(self, m: Dict[str, Any], mid: str, details: Dict[str, Any]):
+        self.mid = mid
+        self.type = m.get("type")
+        self.details = details
+        # 抽取金额：支持 amount, 金额, lovense detail.amount
+        amt = 0.0
+        if "amount" in details:
+            try: amt = float(details.get("amount",0))
+            except: amt = 0.0
+        else:
+            lov = details.get("lovenseDetails") or details.get("lovense_details")
+            if lov:
+                det = lov.get("detail") or lov.get("detail ")
+                if isinstance(det, dict) and "amount" in det:
+                    try: amt = float(det.get("amount",0))
+                    except: amt = 0.0
+        self.amount = amt
+        self.user = (m.get("userData") or {}).get("username") or (details.get("clientUserInfo") or {}).get("username")
+        self.ts = m.get("createdAt")
+        self._age: timedelta | None = None
+        self._age_parsed = False
+
+    @property
+    def age(self) -> timedelta | None:
+        """距消息时间（createdAt，ISO 8601）过去了多久；缺失或解析失败为 None。"""
+        if not self._age_parsed:
+            self._age_parsed = True
+            try:
+                tip_time = datetime.fromisoformat(self.ts.replace('Z', '+00:00'))
+                if tip_time.tzinfo is None:
+                    tip_time = tip_time.replace(tzinfo=timezone.utc)
+                self._age = datetime.now(timezone.utc) - tip_time
+            except Exception:
+                self._age = None
+        return self._age
+
+    def minutes_ago(self) -> int | None:
+        """与 get_minutes_ago 相同的取整分钟数。"""
+        age = self.age
+        return None if age is None else int(age.total_seconds() / 60)
+
+
+def _newer_than(current: Dict[str, Any] | None, ts: str | None) -> bool:
+    """只保留最新一条：当前无记录、时间戳更晚（ISO 8601 可按字典序比较）或时间戳异常时更新。"""
+    if not current:
+        return True
+    current_ts = current.get("timestamp", "")
+    if ts and current_ts:
+        return ts > current_ts
+    return True
+
+
+def _handle_threshold_goal(username: str, state: RoomState, config: RoomConfigSnapshot, msg: ChatMessage):
+    # 目标达成监控：type="thresholdGoal" 且 details.goal == 0
+    goal_val = msg.details.get("goal")
+    # goal==0 代表达成（从dabiao.json样例）
+    if goal_val != 0 or not msg.ts:
+        return
+    # 只记录5分钟内的目标达成
+    minutes_ago = msg.minutes_ago()
+    if minutes_ago is None or minutes_ago > 5:
+        # 超过5分钟则忽略
+        if VERBOSE:
+            print(f"[{username}] ⏰ 达标事件已超过5分钟，忽略")
+        return
+    if _newer_than(state.last_threshold_goal, msg.ts):
+        state.last_threshold_goal = {
+            "goal": goal_val,
+            "timestamp": msg.ts,
+            "id": msg.mid
+        }
+        prioritize_streamer_on_event(username)
+        if VERBOSE:
+            print(f"[{username}] ✅ 达标事件: goal={goal_val}, ts={msg.ts}")
+        try:
+            browser_notify(f"{username} 达成目标", f" · 时间：{msg.ts}", NOTIFY_PRIORITY_HIGH)
+        except Exception:
+            pass
+
+
+def _handle_menu_tip(username: str, state: RoomState, config: RoomConfigSnapshot, msg: ChatMessage):
+    # 菜单打赏：type="tip" 且 source="tipMenu"
+    menu_body = (msg.details.get("body") or "").strip()
+    # 文本为空时仍可按金额归属（见 MenuMatcher.match）
+    if not msg.ts or not (menu_body or config.menu_matcher.price_masks):
+        return
+    # 首先检查时间：只处理5分钟内的菜单打赏
+    age = msg.age
+    if age is None:
+        # 时间解析失败，跳过
+        if VERBOSE:
+            print(f"[{username}] ⚠️ 菜单打赏时间解析失败: {msg.ts}")
+        return
+    if age > EVENT_MAX_AGE:
+        if VERBOSE:
+            print(f"[{username}] ⏰ 菜单打赏时间超过5分钟，忽略: {menu_body} ({msg.minutes_ago()}分钟前)")
+        return
+    match = config.menu_matcher.match(menu_body, msg.amount)
+    if match is None:
+        # 如果没有匹配成功，清除之前的记录（如果有的话）
+        if menu_body and state.last_menu_tip:
+            state.last_menu_tip = None
+            if VERBOSE:
+                print(f"[{username}] ⚠️ 菜单打赏未匹配选中项，清除记录: {menu_body}")
+        return
+    selected_item, cleaned_selected, cleaned_menu_body = match
+    if VERBOSE:
+        print(f"[{username}] 🔍 菜单匹配: 选中项='{selected_item}' (清理后='{cleaned_selected}') <-> 菜单文本='{menu_body}' (清理后='{cleaned_menu_body}') 金额={msg.amount}")
+    # 文本缺失、按金额归属时用选中项作为显示文本
+    menu_body = menu_body or selected_item
+    if _newer_than(state.last_menu_tip, msg.ts):
+        state.last_menu_tip = {
+            "menu_text": menu_body,
+            "amount": msg.amount,
+            "user": msg.user,
+            "timestamp": msg.ts,
+            "id": msg.mid
+        }
+        prioritize_streamer_on_event(username)
+        if VERBOSE:
+            print(f"[{username}] 🎯 菜单打赏: {menu_body} (用户: {msg.user}, 金额: {msg.amount}, 时间: {msg.ts})")
+        try:
+            browser_notify(f"{username} 选单命中", f"{menu_body} · 金额：{msg.amount}", NOTIFY_PRIORITY_HIGH)
+        except Exception:
+            pass
+
+
+def _handle_wheel_tip(username: str, state: RoomState, config: RoomConfigSnapshot, msg: ChatMessage):
+    # 转轮游戏监控：type="tip" 且 source="app_9"
+    if not msg.ts:
+        return
+    minutes_ago = msg.minutes_ago()
+    if minutes_ago is not None and minutes_ago > 5:
+        return
+    details = msg.details
+    tip_data = details.get("tipData") or {}
+    plugin_info = tip_data.get("plugins") if isinstance(tip_data, dict) else {}
+    if not isinstance(plugin_info, dict):
+        plugin_info = {}
+    plugin_data = plugin_info.get("pluginData") if isinstance(plugin_info.get("pluginData"), dict) else {}
+    rule_index = plugin_data.get("ruleIndex")
+    plugin_id = plugin_info.get("pluginId")
+    if not _newer_than(state.last_wheel_tip, msg.ts):
+        return
+    amt = msg.amount
+    state.last_wheel_tip = {
+        "amount": amt,
+        "user": msg.user,
+        "timestamp": msg.ts,
+        "id": msg.mid,
+        "rule_index": rule_index,
+        "plugin_id": plugin_id,
+        "body": details.get("body", "")
+    }
+    prioritize_streamer_on_event(username)
+    rule_text = f"规则#{rule_index}" if rule_index is not None else ""
+    user_display = msg.user or "匿名"
+    amt_display = int(amt) if isinstance(amt, (int, float)) else amt
+    text = f"[{username}] 🎡 转轮游戏: user={user_display} amount={amt_display} {rule_text}".strip()
+    notify_print_and_telegram(text, NOTIFY_PRIORITY_HIGH)
+    if VERBOSE:
+        print(text)
+    try:
+        body_parts = [user_display, f"{amt_display}代币"]
+        if rule_text:
+            body_parts.append(rule_text)
+        browser_notify(f"{username} 转轮游戏", " · ".join(body_parts), NOTIFY_PRIORITY_HIGH)
+    except Exception:
+        pass
+
+
+def _handle_high_tip(username: str, state: RoomState, config: RoomConfigSnapshot, msg: ChatMessage):
+    # 高额打赏：只处理 type=="tip" 且 source=="interactiveToy" 或 source=="" 的打赏，且 amount>=threshold
+    threshold = config.threshold
+    amt = msg.amount
+    if amt < threshold:
+        return
+    out = f"[{username}] [{msg.ts}] type={msg.type} user={msg.user} amount={amt} id={msg.mid}"
+    notify_print_and_telegram(f"💰 HIGH TIP: {out} (>= {threshold})", NOTIFY_PRIORITY_HIGH)
+    if not msg.ts:
+        # 没有时间戳，只发送通知不记录
+        try:
+            browser_notify(f"{username} 高额小费", f"金额：${amt}（≥ {threshold}）", NOTIFY_PRIORITY_HIGH)
+        except Exception:
+            pass
+        return
+    age = msg.age
+    if age is None:
+        # 时间解析失败，只发送通知不记录
+        if VERBOSE:
+            print(f"[{username}] ⚠️ 高额打赏时间解析失败: {msg.ts}")
+        return
+    if age > EVENT_MAX_AGE:
+        # 超过5分钟，只发送通知但不记录
+        try:
+            browser_notify(f"{username} 高额小费", f"金额：${amt}（≥ {threshold}）", NOTIFY_PRIORITY_HIGH)
+        except Exception:
+            pass
+        return
+    # 5分钟内的打赏：记录高额打赏统计，只保留最新的一条
+    state.high_tip_count = int(state.high_tip_count) + 1
+    if _newer_than(state.last_high_tip, msg.ts):
+        state.last_high_tip = {
+            "amount": amt,
+            "user": msg.user,
+            "timestamp": msg.ts,
+            "id": msg.mid,
+            "type": msg.type
+        }
+        prioritize_streamer_on_event(username)
+
+
+# 按 (type, details.source) 分派；source 为 "*" 的条目匹配该 type 的任意来源。
+# 菜单打赏（tipMenu）、转轮（app_9）与高额打赏（interactiveToy / 无来源）互斥，其余消息不做处理。
+MESSAGE_HANDLERS: Dict[tuple[Any, Any], Callable[[str, RoomState, RoomConfigSnapshot, ChatMessage], None]] = {
+    ("thresholdGoal", "*"): _handle_threshold_goal,
+    ("tip", "tipMenu"): _handle_menu_tip,
+    ("tip", "app_9"): _handle_wheel_tip,
+    ("tip", "interactiveToy"): _handle_high_tip,
+    ("tip", ""): _handle_high_tip,
+}
+
+
+def classify_message(username: str, state: RoomState, config: RoomConfigSnapshot, m: Dict[str, Any], mid: str):
+    """对一条新消息查表分派；没有对应处理器的消息（聊天、普通打赏来源等）不做任何解析。"""
+    mtype = m.get("type")
+    details = m.get("details") or {}
+    source = details.get("source", "")
+    try:
+        handler = MESSAGE_HANDLERS.get((mtype, source)) or MESSAGE_HANDLERS.get((mtype, "*"))
+    except TypeError:
+        return  # type / source 不是可哈希的值，不可能是需要处理的事件
+    if handler is None:
+        return
+    try:
+        handler(username, state, config, ChatMessage(m, mid, details))
+    except Exception as e:
+        if VERBOSE:
+            print(f"[{username}] ⚠️ 处理 {mtype}/{source} 消息失败: {e}")
+
+
+# ---------- 房间凭据刷新 ----------
+def _adopt_actual_username(handle: "RoomPollHandle", actual_username: str | None) -> str:
+    """抓取凭据时发现主播已改名：同步 streamers.json、ROOM_STATE 与 RUNNING_TASKS，返回此后使用的用户名。"""
+    username = handle.username
+    if not actual_username or actual_username == username:
+        return username
+    print(f"[{username}] ⚠️ 检测到用户名已变更: {username} -> {actual_username}")
+    if not update_streamer_username(username, actual_username):
+        return username
+    move_room_state(username, actual_username)
+    if username in RUNNING_TASKS:
+        RUNNING_TASKS[actual_username] = RUNNING_TASKS.pop(username)
+    handle.username = actual_username
+    print(f"[{actual_username}] 已更新配置和状态，继续正常轮询")
+    return actual_username
+
+
+def _apply_room_credentials(handle: "RoomPollHandle", creds: Dict[str, Any], initial: bool) -> float:
+    """把获取到的凭据装到房间上，返回距下次轮询的秒数。initial=True 时新建房间状态。"""
+    uniq = creds["uniq"]
+    if not uniq:
+        if initial:
+            print(f"[{handle.username}] Playwright 未提取到 uniq，稍候重试")
+            # 重要：不要让 UI 永远停在“加载中”
+            # 后台仍会重试，但前端应降级为“未知”，并可显示最近一次错误原因。
+            cur = get_room_state(handle.username)
+            cur.status_loading = False
+            cur.online_status = None
+            cur.last_error = "未能获取 uniq（页面加载超时或被拦截），后台将继续重试"
+        return 5
+    username = _adopt_actual_username(handle, creds["actual_username"])
+    if initial:
+        # 初始化完成：新建状态（清除加载状态；用户名变更不再强制进入低频模式）
+        state = RoomState()
+        ROOM_STATE[username] = state
+    else:
+        # 保留现有状态，只原地替换 uniq 相关字段
+        state = get_room_state(username)
+    state.set_credentials(
+        username, get_streamer_site_origin(username), uniq, creds["cookies"], creds["ua"], credential_source_of(creds)
+    )
+    if initial:
+        print(f"[{username}] 初始 uniq={uniq}，开始轮询 {state.api_url}")
+    else:
+        print(f"[{username}] 刷新到新 uniq={uniq}")
+    # 刷新成功后立即用新凭据继续轮询，不再额外等待
+    return 0
+
+
+def rejected_uniq_backoff(streak: int) -> float:
+    """连续被拒绝 streak 次后，换上新凭据前要等待的秒数：第一次立即重试，之后 5、10、20… 秒。"""
+    if streak <= 1:
+        return 0
+    return min(5 * 2 ** (streak - 2), REJECTED_UNIQ_BACKOFF_MAX)
+
+
+async def _run_room_refresh(
+    handle: "RoomPollHandle", initial: bool, exclude_uniq: str | None, max_age: float | None
+):
+    delay = 5.0
+    try:
+        creds = await acquire_room_credentials(handle.username, exclude_uniq=exclude_uniq, max_age=max_age)
+        if not handle.done() and RUNNING_TASKS.get(handle.username) is handle:
+            delay = _apply_room_credentials(handle, creds, initial)
+    except BrowserAdmissionRejected as e:
+        # 抓取排队已满，等高优先级房间处理完再重试
+        print(f"[{handle.username}] {e}，稍后重试")
+        delay = 30
+    except Exception as e:
+        print(f"[{handle.username}] 获取凭据异常: {e}")
+    finally:
+        handle.refresh = None
+        if handle.parked:
+            handle.parked = False
+            if not handle.done():
+                # 刚换上的凭据又被拒绝：不能无间隔地反复刷新
+                backoff = rejected_uniq_backoff(handle.reject_streak)
+                if backoff > delay:
+                    print(f"[{handle.username}] 新 uniq 连续 {handle.reject_streak} 次被拒绝，{backoff:.0f} 秒后再试")
+                    delay = backoff
+                POLL_SCHEDULER.reschedule(handle, delay)
+
+
+def start_room_refresh(
+    handle: "RoomPollHandle",
+    initial: bool = False,
+    exclude_uniq: str | None = None,
+    max_age: float | None = None,
+    park: bool = True,
+) -> bool:
+    """在独立任务中为房间获取凭据，不占用调度器 worker。
+
+    park=True 时房间在刷新期间不再排期，刷新结束后由该任务重新排期；
+    park=False 用于旧凭据仍可用的周期刷新，房间照常轮询。已有刷新在进行时不重复发起，返回 False。
+    """
+    if handle.refresh is not None:
+        handle.parked = handle.parked or park
+        return False
+    handle.parked = park
+    handle.refresh = asyncio.create_task(_run_room_refresh(handle, initial, exclude_uniq, max_age))
+    return True
+
+
+def request_room_refresh(handle: "RoomPollHandle", **kwargs) -> float:
+    """在轮询中请求暂停并刷新凭据：由 worker 在本次轮询结束后发起刷新（见 PollScheduler._worker）。"""
+    handle.refresh_request = kwargs
+    return 0
+
+
+# ---------- Async polling worker ----------
+async def poll_room_tick(handle: "RoomPollHandle") -> float | None:
+    """执行某房间的一次轮询（请求 /chat 接口并处理消息），依赖 ROOM_STATE[username] 中的 api_url 与 cookies。
+    返回距下次轮询的秒数，由 POLL_SCHEDULER 负责排期；返回 None 表示该房间已不再监控。
     """
+    session = handle.session
+    username = handle.username
     try:
-        # 构建 suggestion API URL
-        suggestion_url = build_suggestion_api_url(site_origin, username, uniq)
+        # 只允许当前登记的房间继续轮询，避免并发重复轮询造成重复通知
+        if RUNNING_TASKS.get(username) is not handle:
+            return None
+
+        state = ROOM_STATE.get(username)
+        if not state or not state.api_url:
+            # 重启后优先使用磁盘缓存的凭据；若被 chat 接口拒绝，会走下方的刷新分支重新获取
+            cached = get_cached_credentials(username)
+            if not cached:
+                # 复用站点共享凭据，或用 Playwright 获取一次 uniq + cookies：交给独立任务，拿到后再排期
+                return request_room_refresh(handle, initial=True)
+            uniq = cached["uniq"]
+            CREDENTIAL_ISSUED_AT.setdefault(uniq, float(cached.get("acquired_at") or time.time()))
+            print(f"[{username}] 使用缓存凭据 uniq={uniq}（{int(time.time() - float(cached.get('acquired_at') or 0))}秒前获取）")
+            site_origin = cached.get("site_origin") or get_room_state(username).site_origin
+            get_room_state(username).site_origin = site_origin
+            # 初始化完成：新建状态（清除加载状态）
+            state = RoomState()
+            state.set_credentials(
+                username, get_streamer_site_origin(username), uniq, cached.get("cookies") or {}, cached.get("ua"), "cache"
+            )
+            ROOM_STATE[username] = state
+            print(f"[{username}] 初始 uniq={uniq}，开始轮询 {state.api_url}")
+
+        api_url = state.api_url
+        # 请求头随凭据缓存在 RoomState 中，只有条件请求头需要每次附加
+        headers = state.chat_headers
+        conditional = build_chat_conditional_headers(username, api_url)
+        if conditional:
+            headers = {**headers, **conditional}
+
+        # 请求 API
+        request_uniq = state.uniq
+        poll_total = poll_new = None
+        async with session.get(api_url, headers=headers, timeout=HTTP_TIMEOUTS["chat"]) as resp:
+            text_ct = resp.headers.get("Content-Type","")
+            if resp.status not in (200, 304) or "text/html" in text_ct:
+                if state.uniq != request_uniq:
+                    # 请求期间后台续期已换上新凭据，直接用新凭据重试
+                    return 0
+                # 可能 uniq 失效或 CF 拦截：刷新 uniq & cookies
+                print(f"[{username}] 非 200 或返回 HTML({resp.status}), 刷新 uniq")
+                handle.reject_streak += 1
+                discard_unconfirmed_credentials(request_uniq)
+                observe_credential_expiry(state.site_origin or get_streamer_site_origin(username), request_uniq)
+                invalidate_cached_credentials(username, state.site_origin)
+                # 站点共享凭据有更新的就直接换上；当前用的就是最新共享凭据则为本房间单独抓取。
+                # 抓取可能要等浏览器数十秒，交给独立任务，拿到新凭据后立即重新排期
+                return request_room_refresh(handle, exclude_uniq=state.uniq)
+
+            handle.reject_streak = 0
+            if UNCONFIRMED_CREDENTIALS:
+                confirm_room_credentials(request_uniq)
+            msgs = await read_chat_payload(username, api_url, resp, session, state.chat_headers)
+            if msgs is None:
+                # 响应与上一次完全相同：没有新消息，跳过解码与逐条分类
+                poll_total, poll_new = CHAT_PAYLOAD_FINGERPRINTS[username]["count"], 0
+            elif not msgs:
+                poll_total, poll_new = 0, 0
+                # 只有在非低频模式下且明确为直播中时才打印"本次无消息"
+                # 已下播或状态未知时不打印，减少日志噪音
+                # 状态未知时可能还在检测中，或者状态检查失败，不应该打印
+                online_status = state.online_status
+                low_freq_mode = state.low_freq_mode
+                # 只有明确为直播中时才打印
+                if VERBOSE and (not low_freq_mode and online_status is True):
+                    print(f"[{username}] 本次无消息")
+                # 若长时间无消息，强制刷新 uniq 周期性检查（但低频模式下跳过，因为频率已经很低）；
+                # 主动续期开启时由续期任务负责轮换：强制刷新会让 uniq 永远活不到失效，寿命统计就采不到样本
+                if (
+                    not low_freq_mode
+                    and not credential_renewer_running()
+                    and time.time() - state.last_refresh > REFRESH_UNIQ_INTERVAL
+                ):
+                    if start_room_refresh(handle, exclude_uniq=state.uniq, max_age=REFRESH_UNIQ_INTERVAL, park=False):
+                        # 旧凭据仍可用：后台换凭据，本房间照常轮询
+                        print(f"[{username}] 强制周期刷新 uniq")
+
+            # 处理消息
+            else:
+                poll_total, poll_new = len(msgs), 0
+                config = RoomConfigSnapshot(username)
+                for m in select_new_messages(username, msgs):
+                    mid = str(m.get("id") or f"{m.get('createdAt')}_{m.get('cacheId')}")
+                    if is_duplicate_message(username, mid):
+                        continue
+                    poll_new += 1
+                    
+                    # 提取 modelId（如果还没有）
+                    if not state.model_id and m.get("modelId"):
+                        state.model_id = m.get("modelId")
+                        if VERBOSE:
+                            print(f"[{username}] 提取到 modelId: {state.model_id}")
+                    
+                    classify_message(username, state, config, m, mid)
+
+        # 定期检查直播状态（基于搜索/suggestion API）- 移到 async with 块外，确保每次循环都会执行
+        now = time.time()
+        state = get_room_state(username)  # 重新获取最新状态
+        offline_check_count = state.offline_check_count
+        low_freq_mode = state.low_freq_mode
         
-        cookie_header = "; ".join([f"{k}={v}" for k, v in cookies.items()])
-        headers = {
-            "User-Agent": ua,
-            "Accept": "application/json, text/plain, */*",
-            "Referer": f"{site_origin.rstrip('/')}/",
-            "Cookie": cookie_header,
-        }
+        # 根据下播检查计数和在线状态决定状态检查间隔
+        # 如果已下播/未知但计数器<2，每5秒检查一次（快速连续检查）
+        # 如果已切换到低频模式，每10分钟检查一次状态（与轮询间隔一致）
+        # 如果直播中，每3分钟检查一次状态（及时检测下播，避免状态错误保持为直播中）
+        # 如果状态未知或已下播，与已下播做相同处理（快速检查2次后进入低频模式）
+        online_status = state.online_status
+        if low_freq_mode:
+            # 低频模式：状态检查间隔也是10分钟（与轮询间隔一致）
+            status_check_interval = OFFLINE_POLL_INTERVAL
+        elif offline_check_count > 0 and offline_check_count < 2:
+            # 已检测到下播/未知但还未确认：每5秒检查一次
+            status_check_interval = POLL_INTERVAL
+        elif online_status is True:
+            # 直播中：定期检查状态（每3分钟），及时检测下播
+            # 避免状态被错误保持为直播中而无法检测到下播
+            status_check_interval = ONLINE_CHECK_INTERVAL
+        else:
+            # 状态未知或已下播：与已下播做相同处理，每5秒检查一次（快速确认）
+            # 如果是首次检测到未知状态，会在下面的逻辑中设置计数器
+            status_check_interval = POLL_INTERVAL
         
-        async with session.get(suggestion_url, headers=headers, timeout=10) as resp:
-            if resp.status != 200:
-                if VERBOSE:
-                    print(f"[{username}] suggestion API 状态码: {resp.status}")
-                return None
-            
-            try:
-                data = await resp.json(content_type=None)
-                if VERBOSE:
-                    print(f"[{username}] suggestion API 响应类型: {type(data).__name__}")
-            except Exception as e:
-                if VERBOSE:
-                    print(f"[{username}] suggestion API JSON 解析失败: {e}")
-                    text = await resp.text()
-                    print(f"[{username}] suggestion API 响应内容（前500字符）: {text[:500]}")
-                return None
+        if now - state.last_status_check > status_check_interval:
+            # 立即更新时间戳，防止在同一个循环中重复触发
+            state = get_room_state(username)
+            state.last_status_check = now
             
-            # suggestion 响应可能是字典（包含 models 键）或直接是列表
-            models_list = None
-            if isinstance(data, dict):
-                if VERBOSE:
-                    print(f"[{username}] suggestion API 响应是字典，键: {list(data.keys())}")
-                # 尝试从常见键中获取模型列表
-                models_list = data.get("models") or data.get("results") or data.get("data")
-                if models_list and isinstance(models_list, list):
-                    if VERBOSE:
-                        print(f"[{username}] 从字典中提取到 {len(models_list)} 个模型")
-                else:
-                    models_list = None
-            elif isinstance(data, list):
-                models_list = data
-                if VERBOSE:
-                    print(f"[{username}] suggestion API 响应是列表，包含 {len(models_list)} 个结果")
+            if VERBOSE:
+                print(f"[{username}] 开始检查直播状态...")
+            # 从 state 重新获取最新值
+            state = get_room_state(username)
+            uniq = state.uniq
+            cookies = state.cookies
+            ua = state.ua or DEFAULT_USER_AGENT
+            # 如果 state 中没有 uniq，尝试从 api_url 中提取
+            if not uniq:
+                import urllib.parse as up
+                parsed = up.urlparse(state.api_url or "")
+                qs = up.parse_qs(parsed.query)
+                uniq_vals = qs.get("uniq") or []
+                if uniq_vals:
+                    uniq = uniq_vals[0]
+                    state.uniq = uniq  # 保存到 state 中
             
-            # 在模型列表中查找匹配的主播
-            if models_list and isinstance(models_list, list):
-                for idx, model in enumerate(models_list):
-                    # 尝试匹配用户名
-                    model_username = model.get("username") or model.get("login") or model.get("name") or ""
+            if uniq:
+                new_status = await check_online_status_via_search(
+                    session,
+                    username,
+                    cookies,
+                    ua,
+                    uniq,
+                    get_streamer_site_origin(username),
+                )
+                old_status = state.online_status
+                # 状态检查已完成，保持已更新的时间戳
+                state.status_loading = False
+                
+                # 判断是否为直播状态：只有 new_status is True 才算直播
+                is_live = (new_status is True)
+                is_offline = (new_status is False)  # 明确下播
+                is_unknown = (new_status is None)    # 无法确定状态
+                
+                if is_live:
+                    # 直播中：重置计数器和低频模式
+                    state.online_status = True
+                    ROOM_LAST_KNOWN_LIVE[username] = True
+                    state.offline_check_count = 0
+                    state.low_freq_mode = False
                     
-                    if VERBOSE and idx < 3:  # 只打印前3个结果用于调试
-                        print(f"[{username}] suggestion[{idx}]: username={model_username}")
+                    if old_status is None:
+                        # 首次检测到直播状态
+                        notify_print_and_telegram(f"[{username}] 直播状态: 🟢 直播中", NOTIFY_PRIORITY_LOW)
+                        print(f"[{username}] 直播状态: 🟢 直播中")
+                        # 首次检测到直播时，将其移动到触发区块之后
+                        try:
+                            move_streamer_after_triggered_block(username)
+                            refresh_streamers_list()
+                        except Exception:
+                            pass
+                    elif old_status != True:
+                        # 从下播/未知变为直播
+                        state.last_status_check = now  # 重置状态检查时间
+                        notify_print_and_telegram(f"[{username}] 直播状态变化: 🟢 开播", NOTIFY_PRIORITY_LOW)
+                        print(f"[{username}] 直播状态更新: {old_status} -> True (开播)")
+                        if VERBOSE:
+                            print(f"[{username}] 状态从下播/未知变为直播，恢复正常轮询模式")
+                        # 自动排序：新上播移动到触发区块之后
+                        try:
+                            move_streamer_after_triggered_block(username)
+                            refresh_streamers_list()
+                        except Exception:
+                            pass
+                    else:
+                        # 仍然是直播状态
+                        if VERBOSE:
+                            print(f"[{username}] 直播状态检查: 🟢 直播中 (未变化)")
+                else:
+                    # 非直播状态（下播或未知）：统一处理逻辑
+                    # 设置状态：明确下播设为False，未知设为None
+                    state.online_status = False if is_offline else None
+                    if is_offline:
+                        ROOM_LAST_KNOWN_LIVE[username] = False
+                    current_count = state.offline_check_count
                     
-                    if model_username.lower() == username.lower():
+                    # 统一处理非直播状态的计数器逻辑
+                    if old_status is True:
+                        # 从直播变为非直播：计数器重置为1，立即开始快速检查
+                        state.offline_check_count = 1
+                        state.low_freq_mode = False
+                        # 不修改 last_status_check，让它自然等待下次检查间隔
+                        
+                        status_str = "🟤 下播" if is_offline else "🟡 未知"
+                        status_detail = "已下播" if is_offline else "未知"
+                        notify_print_and_telegram(f"[{username}] 直播状态变化: {status_str}", NOTIFY_PRIORITY_LOW)
+                        print(f"[{username}] 直播状态更新: True -> {state.online_status} ({status_detail})")
                         if VERBOSE:
-                            print(f"[{username}] 找到匹配的主播: {model_username}")
+                            print(f"[{username}] 状态从直播变为{status_detail}，开始快速检查（每5秒检查一次，共检查2次）")
+                        # 自动排序：新下播移动到当前最后一名直播中的下一行
+                        try:
+                            move_streamer_below_last_live(username)
+                            refresh_streamers_list()
+                        except Exception:
+                            pass
+                    elif current_count == 0:
+                        # 首次检测到非直播状态（计数器为0表示从未检测过）
+                        state.offline_check_count = 1
+                        state.low_freq_mode = False
+                        # 不修改 last_status_check，让它自然等待下次检查间隔
                         
-                        # 提取直播状态（优先使用 isLive，因为主要目的是检测是否在直播）
-                        is_live = model.get("isLive")
-                        is_online = model.get("isOnline")
+                        status_str = "🟤 已下播" if is_offline else "🟡 未知"
+                        notify_print_and_telegram(f"[{username}] 直播状态: {status_str}", NOTIFY_PRIORITY_LOW)
+                        print(f"[{username}] 直播状态: {status_str}")
+                        if VERBOSE:
+                            print(f"[{username}] 首次检测到{status_str}，开始快速检查（每5秒检查一次，共检查2次）")
+                    else:
+                        # 状态未变化或从下播/未知变为未知：计数器+1
+                        state.offline_check_count = current_count + 1
                         
-                        # 优先使用 isLive（是否在直播），如果不存在则使用 isOnline（是否在线）
-                        if is_live is not None:
-                            result = bool(is_live)
+                        # 如果计数器>=2且还未切换到低频模式，则切换
+                        if state.offline_check_count >= 2 and not state.low_freq_mode:
+                            state.low_freq_mode = True
+                            status_detail = "下播" if is_offline else "状态未知"
                             if VERBOSE:
-                                print(f"[{username}] 从 isLive 字段提取到直播状态: {result} (isLive={is_live}, isOnline={is_online})")
-                            return result
-                        elif is_online is not None:
-                            result = bool(is_online)
+                                print(f"[{username}] 已连续检测到{state.offline_check_count}次{status_detail}，切换到低频轮询模式（10分钟一次）")
+                        
+                        
+                        # 状态未变化时的日志
+                        if old_status == state.online_status:
+                            status_str = "🟤 已下播" if is_offline else "🟡 未知"
                             if VERBOSE:
-                                print(f"[{username}] 从 isOnline 字段提取到在线状态: {result} (isOnline={is_online}, isLive未找到)")
-                            return result
+                                print(f"[{username}] 直播状态检查: {status_str} (未变化，计数器: {state.offline_check_count})")
                         else:
-                            # 如果都没找到，尝试其他字段
-                            if VERBOSE:
-                                status_fields = {k: v for k, v in model.items() if any(kw in k.lower() for kw in ["status", "live", "online", "broadcast"])}
-                                print(f"[{username}] 未找到 isOnline/isLive，相关字段: {status_fields}")
-                            return None
-                
-                # 如果没找到匹配的主播
-                if VERBOSE:
-                    print(f"[{username}] suggestion API 中未找到匹配的主播（用户名: {username}）")
-                    usernames_found = [m.get("username") or m.get("login") or m.get("name") or "unknown" for m in models_list[:5]]
-                    print(f"[{username}] 找到的用户名: {usernames_found}")
+                            # 从下播变为未知，或从未知变为下播
+                            status_str = "🟡 未知" if is_unknown else "🟤 已下播"
+                            notify_print_and_telegram(f"[{username}] 直播状态变化: {status_str}", NOTIFY_PRIORITY_LOW)
+                            print(f"[{username}] 直播状态更新: {old_status} -> {state.online_status}")
             else:
                 if VERBOSE:
-                    print(f"[{username}] suggestion API 响应格式无法识别，类型: {type(data).__name__}")
-            
-            return None
-            
+                    print(f"[{username}] 直播状态检查: 跳过（未获取到 uniq）")
+
+        # 根据在线状态和低频模式决定轮询间隔
+        state = get_room_state(username)  # 重新获取最新状态
+        low_freq_mode = state.low_freq_mode
+        online_status = state.online_status
+        
+        # 如果处于低频模式（已下播且连续检测2次以上），使用10分钟间隔
+        # 否则使用正常间隔（3秒）
+        if low_freq_mode:
+            poll_interval = OFFLINE_POLL_INTERVAL  # 10分钟
+            if VERBOSE:
+                # 只在低频模式下第一次打印，避免频繁打印
+                if not state.low_freq_logged:
+                    print(f"[{username}] 进入低频轮询模式，每10分钟检查一次状态变化")
+                    state.low_freq_logged = True
+        else:
+            # 按消息速率自适应调整（事件后短时间内加速）
+            if poll_total is not None:
+                record_poll_result(username, poll_total, poll_new)
+            poll_interval = get_room_poll_interval(username)
+            # 退出低频模式时，清除日志标志
+            if state.low_freq_logged:
+                state.low_freq_logged = False
+        
+        return poll_interval
+    except asyncio.TimeoutError:
+        print(f"[{username}] 请求超时，稍后重试")
+        return 3
     except Exception as e:
-        if VERBOSE:
-            print(f"[{username}] 检查在线状态异常: {e}")
-        return None
+        print(f"[{username}] 轮询异常: {e}")
+        # 本次响应可能没处理完，不能让下一次相同的响应被指纹跳过
+        CHAT_PAYLOAD_FINGERPRINTS.pop(username, None)
+        return 5
 
-# ---------- Async polling worker ----------
-async def poll_room(session: aiohttp.ClientSession, username: str):
-    """异步轮询某房间的 /chat 接口，依赖 ROOM_STATE[username]['api_url'] & cookies"""
-    task_self = asyncio.current_task()
-    last_uniq_refresh = 0
-    while True:
-        try:
-            # 只允许当前登记任务继续运行，避免并发重复轮询造成重复通知
-            current = RUNNING_TASKS.get(username)
-            if current is None:
-                return
-            if current is not task_self:
-                return
 
-            state = ROOM_STATE.get(username)
-            if not state or not state.get("api_url"):
-                # 先用 Playwright 获取一次 uniq + cookies（在 executor 中运行）
-                loop = asyncio.get_event_loop()
-                uniq, cookies, ua, html, actual_username = await loop.run_in_executor(None, fetch_page_uniq_and_cookies, username, True, 10000)
-                if not uniq:
-                    print(f"[{username}] Playwright 未提取到 uniq，稍候重试")
-                    # 重要：不要让 UI 永远停在“加载中”
-                    # 后台仍会重试，但前端应降级为“未知”，并可显示最近一次错误原因。
-                    try:
-                        cur = ROOM_STATE.get(username) or {}
-                        cur["status_loading"] = False
-                        cur["online_status"] = None
-                        cur["last_error"] = "未能获取 uniq（页面加载超时或被拦截），后台将继续重试"
-                        ROOM_STATE[username] = cur
-                    except Exception:
-                        pass
-                    await asyncio.sleep(5)
-                    continue
-                
-                # 检测用户名变更
-                username_changed = False
-                if actual_username and actual_username != username:
-                    print(f"[{username}] ⚠️ 检测到用户名已变更: {username} -> {actual_username}")
-                    # 更新 streamers.json 中的用户名
-                    if update_streamer_username(username, actual_username):
-                        # 更新 ROOM_STATE 和 RUNNING_TASKS 的键名
-                        old_state = ROOM_STATE.get(username, {})
-                        if username in ROOM_STATE:
-                            del ROOM_STATE[username]
-                        if username in RUNNING_TASKS:
-                            RUNNING_TASKS[actual_username] = RUNNING_TASKS.pop(username)
-                        # 使用新用户名
-                        username = actual_username
-                        ROOM_STATE[username] = old_state
-                        username_changed = True
-                        print(f"[{username}] 已更新配置和状态，设置为低频模式等待下次刷新")
-                
-                site_origin = get_streamer_site_origin(username)
-                api_url = build_chat_api_url(site_origin, username, uniq)
-                ROOM_STATE[username] = {
-                    "api_url": api_url, 
-                    "cookies": cookies, 
-                    "ua": ua, 
-                    "site_origin": site_origin,
-                    "last_refresh": time.time(),
-                    "online_status": None,
-                    "last_status_check": 0,
-                    "uniq": uniq,
-                    "high_tip_count": 0,
-                    "last_high_tip": None,
-                    "status_loading": False,  # 初始化完成，清除加载状态
-                    "model_id": None,  # 从消息中提取
-                    "last_menu_tip": None,  # 最后匹配的菜单打赏信息
-                    "last_wheel_tip": None,  # 最后一次转轮游戏信息
-                    "offline_check_count": 0,  # 连续检测到已下播的次数
-                    "low_freq_mode": False  # 用户名变更不再强制进入低频模式
-                }
-                state = ROOM_STATE[username]
-                print(f"[{username}] 初始 uniq={uniq}，开始轮询 {api_url}")
-
-            api_url = state["api_url"]
-            cookies = state.get("cookies", {})
-            ua = state.get("ua") or "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/109.0.0.0 Safari/537.36"
-            # 构造 cookie 字符串
-            cookie_header = "; ".join([f"{k}={v}" for k, v in cookies.items()])
-
-            headers = {
-                "User-Agent": ua,
-                "Accept": "application/json, text/plain, */*",
-                "Referer": build_room_url(get_streamer_site_origin(username), username),
-                "Cookie": cookie_header,
-            }
-
-            # 请求 API
-            async with session.get(api_url, headers=headers, timeout=15) as resp:
-                text_ct = resp.headers.get("Content-Type","")
-                if resp.status != 200 or "text/html" in text_ct:
-                    # 可能 uniq 失效或 CF 拦截：刷新 uniq & cookies
-                    print(f"[{username}] 非 200 或返回 HTML({resp.status}), 刷新 uniq")
-                    # 使用 Playwright 在后台刷新
-                    loop = asyncio.get_event_loop()
-                    uniq, cookies, ua, html, actual_username = await loop.run_in_executor(None, fetch_page_uniq_and_cookies, username, True, 10000)
-                    if uniq:
-                        # 检测用户名变更
-                        username_changed = False
-                        if actual_username and actual_username != username:
-                            print(f"[{username}] ⚠️ 检测到用户名已变更: {username} -> {actual_username}")
-                            if update_streamer_username(username, actual_username):
-                                old_state = ROOM_STATE.get(username, {})
-                                if username in ROOM_STATE:
-                                    del ROOM_STATE[username]
-                                if username in RUNNING_TASKS:
-                                    RUNNING_TASKS[actual_username] = RUNNING_TASKS.pop(username)
-                                username = actual_username
-                                ROOM_STATE[username] = old_state
-                                username_changed = True
-                                print(f"[{username}] 已更新配置和状态，继续正常轮询")
-                        
-                        site_origin = get_streamer_site_origin(username)
-                        new_api = build_chat_api_url(site_origin, username, uniq)
-                        # 保留现有状态，只更新 uniq 相关字段
-                        old_state = ROOM_STATE.get(username, {})
-                        ROOM_STATE[username] = {
-                            "api_url": new_api, 
-                            "cookies": cookies, 
-                            "ua": ua, 
-                            "site_origin": site_origin,
-                            "last_refresh": time.time(),
-                            "online_status": old_state.get("online_status"),
-                            "last_status_check": old_state.get("last_status_check", 0),
-                            "uniq": uniq,
-                            "high_tip_count": old_state.get("high_tip_count", 0),
-                            "last_high_tip": old_state.get("last_high_tip"),
-                            "status_loading": old_state.get("status_loading", True),  # 刷新时保持加载状态
-                            "model_id": old_state.get("model_id"),
-                            "last_menu_tip": old_state.get("last_menu_tip"),
-                            "last_wheel_tip": old_state.get("last_wheel_tip"),
-                            "offline_check_count": old_state.get("offline_check_count", 0),
-                            "low_freq_mode": old_state.get("low_freq_mode", False)
-                        }
-                        print(f"[{username}] 刷新到新 uniq={uniq}")
-                    await asyncio.sleep(5)
-                    continue
+# ---------- 轮询调度器 ----------
+class RoomPollHandle:
+    """调度器中的一个监控房间，登记在 RUNNING_TASKS 中。
 
-                doc = await resp.json(content_type=None)
-                # doc 可能是 list 或 dict{'messages':[...] }
-                msgs = doc if isinstance(doc, list) else doc.get("messages") or doc.get("data") or []
-                if not msgs:
-                    # 只有在非低频模式下且明确为直播中时才打印"本次无消息"
-                    # 已下播或状态未知时不打印，减少日志噪音
-                    # 状态未知时可能还在检测中，或者状态检查失败，不应该打印
-                    online_status = state.get("online_status")
-                    low_freq_mode = state.get("low_freq_mode", False)
-                    # 只有明确为直播中时才打印
-                    if VERBOSE and (not low_freq_mode and online_status is True):
-                        print(f"[{username}] 本次无消息")
-                    # 若长时间无消息，强制刷新 uniq 周期性检查（但低频模式下跳过，因为频率已经很低）
-                    if not low_freq_mode and time.time() - state.get("last_refresh",0) > REFRESH_UNIQ_INTERVAL:
-                        print(f"[{username}] 强制周期刷新 uniq")
-                        loop = asyncio.get_event_loop()
-                        uniq, cookies, ua, html, actual_username = await loop.run_in_executor(None, fetch_page_uniq_and_cookies, username, True, 10000)
-                        if uniq:
-                            # 检测用户名变更
-                            username_changed = False
-                            if actual_username and actual_username != username:
-                                print(f"[{username}] ⚠️ 检测到用户名已变更: {username} -> {actual_username}")
-                                if update_streamer_username(username, actual_username):
-                                    old_state = ROOM_STATE.get(username, {})
-                                    if username in ROOM_STATE:
-                                        del ROOM_STATE[username]
-                                    if username in RUNNING_TASKS:
-                                        RUNNING_TASKS[actual_username] = RUNNING_TASKS.pop(username)
-                                    username = actual_username
-                                    ROOM_STATE[username] = old_state
-                                    username_changed = True
-                                    print(f"[{username}] 已更新配置和状态，继续正常轮询")
-                            
-                            old_state = ROOM_STATE.get(username, {})
-                            site_origin = get_streamer_site_origin(username)
-                            ROOM_STATE[username] = {
-                                "api_url": build_chat_api_url(site_origin, username, uniq), 
-                                "cookies": cookies, 
-                                "ua": ua, 
-                                "site_origin": site_origin,
-                                "last_refresh": time.time(),
-                                "online_status": old_state.get("online_status"),
-                                "last_status_check": old_state.get("last_status_check", 0),
-                                "uniq": uniq,
-                                "high_tip_count": old_state.get("high_tip_count", 0),
-                                "last_high_tip": old_state.get("last_high_tip"),
-                                "status_loading": old_state.get("status_loading", False),  # 强制刷新时保持原有加载状态
-                                "model_id": old_state.get("model_id"),
-                                "last_menu_tip": old_state.get("last_menu_tip"),
-                                "last_wheel_tip": old_state.get("last_wheel_tip"),
-                                "offline_check_count": old_state.get("offline_check_count", 0),
-                                "low_freq_mode": old_state.get("low_freq_mode", False)
-                            }
-                            state = ROOM_STATE[username]  # 更新 state 引用
-
-                # 处理消息
-                else:
-                    for m in msgs:
-                        mid = str(m.get("id") or f"{m.get('createdAt')}_{m.get('cacheId')}")
-                        if is_duplicate_message(username, mid):
-                            continue
-                        
-                        # 提取 modelId（如果还没有）
-                        if not state.get("model_id") and m.get("modelId"):
-                            state["model_id"] = m.get("modelId")
-                            if VERBOSE:
-                                print(f"[{username}] 提取到 modelId: {state['model_id']}")
-                        
-                        mtype = m.get("type")
-                        details = m.get("details") or {}
-                        
-                        # 抽取金额：支持 amount, 金额, lovense detail.amount
-                        amt = 0.0
-                        if "amount" in details:
-                            try: amt = float(details.get("amount",0))
-                            except: amt = 0.0
-                        else:
-                            lov = details.get("lovenseDetails") or details.get("lovense_details")
-                            if lov:
-                                det = lov.get("detail") or lov.get("detail ")
-                                if isinstance(det, dict) and "amount" in det:
-                                    try: amt = float(det.get("amount",0))
-                                    except: amt = 0.0
-
-                        user = (m.get("userData") or {}).get("username") or (details.get("clientUserInfo") or {}).get("username")
-                        ts = m.get("createdAt")
-                        
-                        # 目标达成监控：type="thresholdGoal" 且 details.goal == 0
-                        if mtype == "thresholdGoal":
-                            try:
-                                goal_val = (details or {}).get("goal")
-                                # goal==0 代表达成（从dabiao.json样例）
-                                if goal_val == 0 and ts:
-                                    # 只记录5分钟内的目标达成
-                                    minutes_ago = get_minutes_ago(ts)
-                                    if minutes_ago is not None and minutes_ago <= 5:
-                                        try:
-                                            state = ROOM_STATE.get(username) or {}
-                                            current_last_goal = state.get("last_threshold_goal")
-                                            # 只保留最新一条
-                                            should_update = False
-                                            if not current_last_goal:
-                                                should_update = True
-                                            else:
-                                                cur_ts = current_last_goal.get("timestamp", "")
-                                                if ts and cur_ts:
-                                                    if ts > cur_ts:
-                                                        should_update = True
-                                                else:
-                                                    should_update = True
-                                            if should_update:
-                                                state["last_threshold_goal"] = {
-                                                    "goal": goal_val,
-                                                    "timestamp": ts,
-                                                    "id": mid
-                                                }
-                                                ROOM_STATE[username] = state
-                                                prioritize_streamer_on_event(username)
-                                                if VERBOSE:
-                                                    print(f"[{username}] ✅ 达标事件: goal={goal_val}, ts={ts}")
-                                                try:
-                                                    browser_notify(f"{username} 达成目标", f" · 时间：{ts}")
-                                                except Exception:
-                                                    pass
-                                        except Exception:
-                                            pass
-                                    else:
-                                        # 超过5分钟则忽略
-                                        if VERBOSE:
-                                            print(f"[{username}] ⏰ 达标事件已超过5分钟，忽略")
-                            except Exception:
-                                pass
-                        
-                        # 检查菜单打赏：type="tip" 且 source="tipMenu"
-                        if mtype == "tip" and details.get("source") == "tipMenu":
-                            menu_body = details.get("body", "").strip()
-                            if menu_body and ts:
-                                # 首先检查时间：只处理5分钟内的菜单打赏
-                                try:
-                                    # 解析时间戳（ISO 8601格式）
-                                    ts_iso = ts.replace('Z', '+00:00')
-                                    tip_time = datetime.fromisoformat(ts_iso)
-                                    if tip_time.tzinfo is None:
-                                        tip_time = tip_time.replace(tzinfo=timezone.utc)
-                                    
-                                    # 计算时间差
-                                    now = datetime.now(timezone.utc)
-                                    time_diff = now - tip_time
-                                    
-                                    # 如果超过5分钟，忽略
-                                    if time_diff > timedelta(minutes=5):
-                                        if VERBOSE:
-                                            minutes_ago = int(time_diff.total_seconds() / 60)
-                                            print(f"[{username}] ⏰ 菜单打赏时间超过5分钟，忽略: {menu_body} ({minutes_ago}分钟前)")
-                                        continue  # 跳过这条消息
-                                    
-                                    # 5分钟内的消息，继续检查是否匹配选中的菜单项
-                                except Exception as e:
-                                    # 时间解析失败，跳过
-                                    if VERBOSE:
-                                        print(f"[{username}] ⚠️ 菜单打赏时间解析失败: {ts}, 错误: {e}")
-                                    continue
-                                
-                                # 获取已选中的菜单项
-                                selected_items = get_streamer_selected_menu_items(username)
-                                matched = False  # 标记是否匹配成功
-                                
-                                # 过滤掉空字符串和空白字符串，只保留有效的菜单项
-                                valid_selected_items = [item for item in selected_items if item and item.strip()]
-                                
-                                if valid_selected_items:
-                                    # 清理menu_body：去除emoji和特殊字符，转换为小写进行匹配
-                                    def clean_text(text):
-                                        """清理文本：去除emoji和特殊字符，只保留中文、英文、数字
-                                        同时处理Unicode转义序列（\\uXXXX格式）"""
-                                        if not text:
-                                            return ""
-                                        # 首先处理Unicode转义序列（\\uXXXX格式），转换为实际字符
-                                        try:
-                                            # 如果文本包含 \u 转义序列（字面量形式，如 "\\u4e2d"），尝试解码
-                                            if '\\u' in text:
-                                                # 使用 unicode_escape 解码
-                                                text = text.encode().decode('unicode_escape')
-                                        except Exception:
-                                            # 如果解码失败，保持原文本
-                                            pass
-                                        
-                                        # 去除emoji（使用正则表达式匹配emoji范围）
-                                        # 注意：避免使用大范围（如 \U000024C2-\U0001F251），因为它包含了中文字符范围（0x4E00-0x9FFF）
-                                        # 使用精确的emoji范围，分成多个不重叠的小范围
-                                        emoji_patterns = [
-                                            re.compile("[\U0001F600-\U0001F64F]+", flags=re.UNICODE),  # emoticons
-                                            re.compile("[\U0001F300-\U0001F5FF]+", flags=re.UNICODE),  # symbols & pictographs
-                                            re.compile("[\U0001F680-\U0001F6FF]+", flags=re.UNICODE),  # transport & map symbols
-                                            re.compile("[\U0001F1E0-\U0001F1FF]+", flags=re.UNICODE),  # flags (iOS)
-                                            re.compile("[\U00002702-\U000027B0]+", flags=re.UNICODE),  # 装饰符号
-                                            re.compile("[\U000024C2-\U000024FF]+", flags=re.UNICODE),  # 带圈字母和数字
-                                            re.compile("[\U00002600-\U000026FF]+", flags=re.UNICODE),  # 符号和象形文字
-                                            re.compile("[\U0001F900-\U0001F9FF]+", flags=re.UNICODE),  # 补充符号和象形文字
-                                            re.compile("[\U0001FA00-\U0001FAFF]+", flags=re.UNICODE),  # 扩展A
-                                        ]
-                                        # 使用更安全的方法：分别匹配不重叠的范围，避免包含中文字符范围（0x4E00-0x9FFF）
-                                        for pattern in emoji_patterns:
-                                            text = pattern.sub('', text)
-                                        # 去除其他特殊字符，只保留中文、英文、数字和常见标点
-                                        text = re.sub(r'[^\w\s\u4e00-\u9fff~-]', '', text)
-                                        # 去除多余空白
-                                        text = re.sub(r'\s+', ' ', text)
-                                        return text.strip().lower()
-                                    
-                                    cleaned_menu_body = clean_text(menu_body)
-
-                                    
-                                    # 如果清理后的菜单文本为空，不进行匹配
-                                    if not cleaned_menu_body:
-                                        matched = False
-                                    else:
-                                        # 检查是否匹配
-                                        for selected_item in valid_selected_items:
-                                            cleaned_selected = clean_text(selected_item)
-                                            
-                                            # 如果清理后的选中项为空，跳过
-                                            if not cleaned_selected:
-                                                continue
-                                            
-                                            # 更严格的匹配逻辑：
-                                            # 1. 完全匹配（最高优先级）
-                                            # 2. 包含匹配：要求匹配的子串（较短的字符串）长度至少是较长字符串的30%，且至少3个字符
-                                            #    这样可以避免短字符串（如"测试"）误匹配长文本（如"这是一个测试菜单项"）
-                                            is_match = False
-                                            if cleaned_selected == cleaned_menu_body:
-                                                is_match = True
-                                            else:
-                                                # 检查选中项是否包含在菜单文本中
-                                                if cleaned_selected in cleaned_menu_body:
-                                                    # 匹配的子串是 cleaned_selected，要求它至少是菜单文本长度的30%，且至少3个字符
-                                                    min_match_len = max(3, int(len(cleaned_menu_body) * 0.3))
-                                                    if len(cleaned_selected) >= min_match_len:
-                                                        is_match = True
-                                                # 检查菜单文本是否包含在选中项中
-                                                elif cleaned_menu_body in cleaned_selected:
-                                                    # 匹配的子串是 cleaned_menu_body，要求它至少是选中项长度的30%，且至少3个字符
-                                                    min_match_len = max(3, int(len(cleaned_selected) * 0.3))
-                                                    if len(cleaned_menu_body) >= min_match_len:
-                                                        is_match = True
-                                            
-                                            if is_match:
-                                                # 匹配成功，检查时间戳，只保留最新的菜单打赏
-                                                if VERBOSE:
-                                                    print(f"[{username}] 🔍 菜单匹配: 选中项='{selected_item}' (清理后='{cleaned_selected}') <-> 菜单文本='{menu_body}' (清理后='{cleaned_menu_body}')")
-                                                matched = True
-                                                try:
-                                                    state = ROOM_STATE.get(username) or {}
-                                                    current_last_tip = state.get("last_menu_tip")
-                                                    
-                                                    # 如果当前没有记录，或者新消息的时间更晚，则更新
-                                                    should_update = False
-                                                    if not current_last_tip:
-                                                        should_update = True
-                                                    else:
-                                                        # 比较时间戳（ISO 8601格式）
-                                                        current_ts = current_last_tip.get("timestamp", "")
-                                                        if ts and current_ts:
-                                                            # 直接比较字符串（ISO 8601格式可以按字典序比较）
-                                                            if ts > current_ts:
-                                                                should_update = True
-                                                        else:
-                                                            # 如果时间戳格式异常，默认更新
-                                                            should_update = True
-                                                    
-                                                    if should_update:
-                                                        state["last_menu_tip"] = {
-                                                            "menu_text": menu_body,
-                                                            "amount": amt,
-                                                            "user": user,
-                                                            "timestamp": ts,
-                                                            "id": mid
-                                                        }
-                                                        ROOM_STATE[username] = state
-                                                        prioritize_streamer_on_event(username)
-                                                        if VERBOSE:
-                                                            print(f"[{username}] 🎯 菜单打赏: {menu_body} (用户: {user}, 金额: {amt}, 时间: {ts})")
-                                                        try:
-                                                            browser_notify(f"{username} 选单命中", f"{menu_body} · 金额：{amt}")
-                                                        except Exception:
-                                                            pass
-                                                except Exception:
-                                                    pass
-                                                break  # 找到匹配后退出循环
-                                
-                                # 如果没有匹配成功，清除之前的记录（如果有的话）
-                                if not matched:
-                                    try:
-                                        state = ROOM_STATE.get(username) or {}
-                                        if state.get("last_menu_tip"):
-                                            state["last_menu_tip"] = None
-                                            ROOM_STATE[username] = state
-                                            if VERBOSE:
-                                                print(f"[{username}] ⚠️ 菜单打赏未匹配选中项，清除记录: {menu_body}")
-                                    except Exception:
-                                        pass
-                        
-                        # 转轮游戏监控：type="tip" 且 source="app_9"
-                        if mtype == "tip" and details.get("source") == "app_9" and ts:
-                            minutes_ago = get_minutes_ago(ts)
-                            if minutes_ago is None or minutes_ago <= 5:
-                                try:
-                                    tip_data = details.get("tipData") or {}
-                                    plugin_info = tip_data.get("plugins") if isinstance(tip_data, dict) else {}
-                                    if not isinstance(plugin_info, dict):
-                                        plugin_info = {}
-                                    plugin_data = plugin_info.get("pluginData") if isinstance(plugin_info.get("pluginData"), dict) else {}
-                                    rule_index = plugin_data.get("ruleIndex")
-                                    plugin_id = plugin_info.get("pluginId")
-                                    state = ROOM_STATE.get(username) or {}
-                                    existing = state.get("last_wheel_tip") or {}
-                                    should_update = False
-                                    current_ts = existing.get("timestamp")
-                                    if not existing:
-                                        should_update = True
-                                    elif current_ts and ts:
-                                        if ts > current_ts:
-                                            should_update = True
-                                    else:
-                                        should_update = True
-                                    if should_update:
-                                        wheel_payload = {
-                                            "amount": amt,
-                                            "user": user,
-                                            "timestamp": ts,
-                                            "id": mid,
-                                            "rule_index": rule_index,
-                                            "plugin_id": plugin_id,
-                                            "body": details.get("body", "")
-                                        }
-                                        state["last_wheel_tip"] = wheel_payload
-                                        ROOM_STATE[username] = state
-                                        prioritize_streamer_on_event(username)
-                                        rule_text = f"规则#{rule_index}" if rule_index is not None else ""
-                                        user_display = user or "匿名"
-                                        amt_display = int(amt) if isinstance(amt, (int, float)) else amt
-                                        msg = f"[{username}] 🎡 转轮游戏: user={user_display} amount={amt_display} {rule_text}".strip()
-                                        notify_print_and_telegram(msg)
-                                        if VERBOSE:
-                                            print(msg)
-                                        try:
-                                            body_parts = [user_display, f"{amt_display}代币"]
-                                            if rule_text:
-                                                body_parts.append(rule_text)
-                                            browser_notify(f"{username} 转轮游戏", " · ".join(body_parts))
-                                        except Exception:
-                                            pass
-                                except Exception as wheel_err:
-                                    if VERBOSE:
-                                        print(f"[{username}] ⚠️ 处理转轮游戏事件失败: {wheel_err}")
-                        
-                        # 高额打赏检查：只处理 type=="tip" 且 source=="interactiveToy" 或 source=="" 的打赏
-                        # 排除菜单打赏（source="tipMenu"）和其他类型的打赏
-                        source = details.get("source", "")
-                        threshold = get_streamer_threshold(username)
-                        out = f"[{username}] [{ts}] type={mtype} user={user} amount={amt} id={mid}"
-                        
-                        # 检查是否符合高额打赏条件：type=="tip" 且 (source=="interactiveToy" 或 source=="") 且 amount>=threshold
-                        if mtype == "tip" and (source == "interactiveToy" or source == "") and amt >= threshold:
-                            # 首先检查时间：只处理5分钟内的打赏
-                            if ts:
-                                try:
-                                    # 解析时间戳（ISO 8601格式）
-                                    ts_iso = ts.replace('Z', '+00:00')
-                                    tip_time = datetime.fromisoformat(ts_iso)
-                                    if tip_time.tzinfo is None:
-                                        tip_time = tip_time.replace(tzinfo=timezone.utc)
-                                    
-                                    # 计算时间差
-                                    now = datetime.now(timezone.utc)
-                                    time_diff = now - tip_time
-                                    
-                                    # 如果超过5分钟，只发送通知但不记录
-                                    if time_diff > timedelta(minutes=5):
-                                        notify_print_and_telegram(f"💰 HIGH TIP: {out} (>= {threshold})")
-                                        try:
-                                            browser_notify(f"{username} 高额小费", f"金额：${amt}（≥ {threshold}）")
-                                        except Exception:
-                                            pass
-                                    else:
-                                        # 5分钟内的打赏，发送通知并记录
-                                        notify_print_and_telegram(f"💰 HIGH TIP: {out} (>= {threshold})")
-                                        # 记录高额打赏统计
-                                        try:
-                                            state = ROOM_STATE.get(username) or {}
-                                            state["high_tip_count"] = int(state.get("high_tip_count", 0)) + 1
-                                            
-                                            # 检查时间戳，只保留最新的
-                                            current_last_tip = state.get("last_high_tip")
-                                            should_update = False
-                                            if not current_last_tip:
-                                                should_update = True
-                                            else:
-                                                current_ts = current_last_tip.get("timestamp", "")
-                                                if ts and current_ts:
-                                                    if ts > current_ts:
-                                                        should_update = True
-                                                else:
-                                                    should_update = True
-                                            
-                                            updated_high_tip = False
-                                            if should_update:
-                                                state["last_high_tip"] = {
-                                                    "amount": amt,
-                                                    "user": user,
-                                                    "timestamp": ts,
-                                                    "id": mid,
-                                                    "type": mtype
-                                                }
-                                                updated_high_tip = True
-                                            ROOM_STATE[username] = state
-                                            if updated_high_tip:
-                                                prioritize_streamer_on_event(username)
-                                        except Exception:
-                                            pass
-                                except Exception as e:
-                                    # 时间解析失败，仍然发送通知但不记录
-                                    notify_print_and_telegram(f"💰 HIGH TIP: {out} (>= {threshold})")
-                                    if VERBOSE:
-                                        print(f"[{username}] ⚠️ 高额打赏时间解析失败: {ts}, 错误: {e}")
-                            else:
-                                # 没有时间戳，仍然发送通知但不记录
-                                notify_print_and_telegram(f"💰 HIGH TIP: {out} (>= {threshold})")
-                                try:
-                                    browser_notify(f"{username} 高额小费", f"金额：${amt}（≥ {threshold}）")
-                                except Exception:
-                                    pass
-                        # 不再打印通用消息，避免小额打赏刷屏
-                        else:
-                            pass
+    取代原先每个房间一个常驻 asyncio.Task，对外保留 done()/cancel()/cancelled()/exception()/
+    add_done_callback() 这些 Task 同名方法，UI 与任务管理代码无需区分。
+    """
 
-            # 定期检查直播状态（基于搜索/suggestion API）- 移到 async with 块外，确保每次循环都会执行
-            now = time.time()
-            state = ROOM_STATE.get(username, {})  # 重新获取最新状态
-            offline_check_count = state.get("offline_check_count", 0)
-            low_freq_mode = state.get("low_freq_mode", False)
-            
-            # 根据下播检查计数和在线状态决定状态检查间隔
-            # 如果已下播/未知但计数器<2，每5秒检查一次（快速连续检查）
-            # 如果已切换到低频模式，每10分钟检查一次状态（与轮询间隔一致）
-            # 如果直播中，每3分钟检查一次状态（及时检测下播，避免状态错误保持为直播中）
-            # 如果状态未知或已下播，与已下播做相同处理（快速检查2次后进入低频模式）
-            online_status = state.get("online_status")
-            if low_freq_mode:
-                # 低频模式：状态检查间隔也是10分钟（与轮询间隔一致）
-                status_check_interval = OFFLINE_POLL_INTERVAL
-            elif offline_check_count > 0 and offline_check_count < 2:
-                # 已检测到下播/未知但还未确认：每5秒检查一次
-                status_check_interval = POLL_INTERVAL
-            elif online_status is True:
-                # 直播中：定期检查状态（每3分钟），及时检测下播
-                # 避免状态被错误保持为直播中而无法检测到下播
-                status_check_interval = ONLINE_CHECK_INTERVAL
-            else:
-                # 状态未知或已下播：与已下播做相同处理，每5秒检查一次（快速确认）
-                # 如果是首次检测到未知状态，会在下面的逻辑中设置计数器
-                status_check_interval = POLL_INTERVAL
-            
-            if now - state.get("last_status_check", 0) > status_check_interval:
-                # 立即更新时间戳，防止在同一个循环中重复触发
-                state = ROOM_STATE.get(username, {})
-                state["last_status_check"] = now
-                ROOM_STATE[username] = state
-                
-                if VERBOSE:
-                    print(f"[{username}] 开始检查直播状态...")
-                # 从 state 重新获取最新值
-                state = ROOM_STATE.get(username, {})
-                uniq = state.get("uniq")
-                cookies = state.get("cookies", {})
-                ua = state.get("ua") or "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/109.0.0.0 Safari/537.36"
-                # 如果 state 中没有 uniq，尝试从 api_url 中提取
-                if not uniq:
-                    import urllib.parse as up
-                    parsed = up.urlparse(state.get("api_url", ""))
-                    qs = up.parse_qs(parsed.query)
-                    uniq_vals = qs.get("uniq") or []
-                    if uniq_vals:
-                        uniq = uniq_vals[0]
-                        state["uniq"] = uniq  # 保存到 state 中
-                
-                if uniq:
-                    new_status = await check_online_status_via_search(
-                        session,
-                        username,
-                        cookies,
-                        ua,
-                        uniq,
-                        get_streamer_site_origin(username),
-                    )
-                    old_status = state.get("online_status")
-                    # 状态检查已完成，保持已更新的时间戳
-                    state["status_loading"] = False
-                    
-                    # 判断是否为直播状态：只有 new_status is True 才算直播
-                    is_live = (new_status is True)
-                    is_offline = (new_status is False)  # 明确下播
-                    is_unknown = (new_status is None)    # 无法确定状态
-                    
-                    if is_live:
-                        # 直播中：重置计数器和低频模式
-                        state["online_status"] = True
-                        state["offline_check_count"] = 0
-                        state["low_freq_mode"] = False
-                        
-                        if old_status is None:
-                            # 首次检测到直播状态
-                            ROOM_STATE[username] = state
-                            notify_print_and_telegram(f"[{username}] 直播状态: 🟢 直播中")
-                            print(f"[{username}] 直播状态: 🟢 直播中")
-                            # 首次检测到直播时，将其移动到触发区块之后
-                            try:
-                                move_streamer_after_triggered_block(username)
-                                refresh_streamers_list()
-                            except Exception:
-                                pass
-                        elif old_status != True:
-                            # 从下播/未知变为直播
-                            ROOM_STATE[username] = state
-                            state["last_status_check"] = now  # 重置状态检查时间
-                            notify_print_and_telegram(f"[{username}] 直播状态变化: 🟢 开播")
-                            print(f"[{username}] 直播状态更新: {old_status} -> True (开播)")
-                            if VERBOSE:
-                                print(f"[{username}] 状态从下播/未知变为直播，恢复正常轮询模式")
-                            # 自动排序：新上播移动到触发区块之后
-                            try:
-                                move_streamer_after_triggered_block(username)
-                                refresh_streamers_list()
-                            except Exception:
-                                pass
-                        else:
-                            # 仍然是直播状态
-                            ROOM_STATE[username] = state
-                            if VERBOSE:
-                                print(f"[{username}] 直播状态检查: 🟢 直播中 (未变化)")
-                    else:
-                        # 非直播状态（下播或未知）：统一处理逻辑
-                        # 设置状态：明确下播设为False，未知设为None
-                        state["online_status"] = False if is_offline else None
-                        current_count = state.get("offline_check_count", 0)
-                        
-                        # 统一处理非直播状态的计数器逻辑
-                        if old_status is True:
-                            # 从直播变为非直播：计数器重置为1，立即开始快速检查
-                            state["offline_check_count"] = 1
-                            state["low_freq_mode"] = False
-                            # 不修改 last_status_check，让它自然等待下次检查间隔
-                            
-                            status_str = "🟤 下播" if is_offline else "🟡 未知"
-                            status_detail = "已下播" if is_offline else "未知"
-                            ROOM_STATE[username] = state
-                            notify_print_and_telegram(f"[{username}] 直播状态变化: {status_str}")
-                            print(f"[{username}] 直播状态更新: True -> {state['online_status']} ({status_detail})")
-                            if VERBOSE:
-                                print(f"[{username}] 状态从直播变为{status_detail}，开始快速检查（每5秒检查一次，共检查2次）")
-                            # 自动排序：新下播移动到当前最后一名直播中的下一行
-                            try:
-                                move_streamer_below_last_live(username)
-                                refresh_streamers_list()
-                            except Exception:
-                                pass
-                        elif current_count == 0:
-                            # 首次检测到非直播状态（计数器为0表示从未检测过）
-                            state["offline_check_count"] = 1
-                            state["low_freq_mode"] = False
-                            # 不修改 last_status_check，让它自然等待下次检查间隔
-                            
-                            status_str = "🟤 已下播" if is_offline else "🟡 未知"
-                            ROOM_STATE[username] = state
-                            notify_print_and_telegram(f"[{username}] 直播状态: {status_str}")
-                            print(f"[{username}] 直播状态: {status_str}")
-                            if VERBOSE:
-                                print(f"[{username}] 首次检测到{status_str}，开始快速检查（每5秒检查一次，共检查2次）")
-                        else:
-                            # 状态未变化或从下播/未知变为未知：计数器+1
-                            state["offline_check_count"] = current_count + 1
-                            
-                            # 如果计数器>=2且还未切换到低频模式，则切换
-                            if state["offline_check_count"] >= 2 and not state.get("low_freq_mode", False):
-                                state["low_freq_mode"] = True
-                                status_detail = "下播" if is_offline else "状态未知"
-                                if VERBOSE:
-                                    print(f"[{username}] 已连续检测到{state['offline_check_count']}次{status_detail}，切换到低频轮询模式（10分钟一次）")
-                            
-                            ROOM_STATE[username] = state
-                            
-                            # 状态未变化时的日志
-                            if old_status == state["online_status"]:
-                                status_str = "🟤 已下播" if is_offline else "🟡 未知"
-                                if VERBOSE:
-                                    print(f"[{username}] 直播状态检查: {status_str} (未变化，计数器: {state['offline_check_count']})")
-                            else:
-                                # 从下播变为未知，或从未知变为下播
-                                status_str = "🟡 未知" if is_unknown else "🟤 已下播"
-                                notify_print_and_telegram(f"[{username}] 直播状态变化: {status_str}")
-                                print(f"[{username}] 直播状态更新: {old_status} -> {state['online_status']}")
-                else:
-                    if VERBOSE:
-                        print(f"[{username}] 直播状态检查: 跳过（未获取到 uniq）")
+    def __init__(self, username: str, session: aiohttp.ClientSession):
+        self.username = username
+        self.session = session
+        self.due_at = 0.0
+        self.current: asyncio.Task | None = None  # 正在执行的那一次轮询
+        self.refresh: asyncio.Task | None = None  # 正在后台获取凭据的任务
+        self.refresh_request: Dict[str, Any] | None = None  # 本次轮询请求的凭据刷新，由 worker 发起
+        self.parked = False  # 等待凭据刷新完成，期间不在调度堆中
+        self.reject_streak = 0  # 自上次成功轮询以来 chat 接口连续拒绝的次数
+        self._done = False
+        self._cancelled = False
+        self._exception: BaseException | None = None
+        self._callbacks: list = []
+
+    def done(self) -> bool:
+        return self._done
+
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def exception(self) -> BaseException | None:
+        return self._exception
+
+    def cancel(self) -> bool:
+        if self._done:
+            return False
+        self._cancelled = True
+        if self.current is not None and not self.current.done():
+            self.current.cancel()
+        if self.refresh is not None:
+            self.refresh.cancel()
+        self._finish()
+        return True
 
-            # 根据在线状态和低频模式决定轮询间隔
-            state = ROOM_STATE.get(username, {})  # 重新获取最新状态
-            low_freq_mode = state.get("low_freq_mode", False)
-            online_status = state.get("online_status")
-            
-            # 如果处于低频模式（已下播且连续检测2次以上），使用10分钟间隔
-            # 否则使用正常间隔（3秒）
-            if low_freq_mode:
-                poll_interval = OFFLINE_POLL_INTERVAL  # 10分钟
-                if VERBOSE:
-                    # 只在低频模式下第一次打印，避免频繁打印
-                    if not state.get("low_freq_logged", False):
-                        print(f"[{username}] 进入低频轮询模式，每10分钟检查一次状态变化")
-                        state["low_freq_logged"] = True
-                        ROOM_STATE[username] = state
+    def add_done_callback(self, fn):
+        if self._done:
+            asyncio.get_running_loop().call_soon(fn, self)
+        else:
+            self._callbacks.append(fn)
+
+    def _finish(self, exc: BaseException | None = None):
+        if self._done:
+            return
+        self._done = True
+        self._exception = exc
+        # 与 asyncio.Task 一致：回调在下一轮事件循环执行，而不是在 cancel() 内同步执行
+        loop = asyncio.get_running_loop()
+        for fn in self._callbacks:
+            loop.call_soon(fn, self)
+        self._callbacks.clear()
+
+
+class PollScheduler:
+    """统一的轮询调度器：用最小堆维护每个房间的下次到期时间，由固定数量的 worker 执行轮询。
+
+    任务数量与房间数无关（1 个分发协程 + workers 个 worker），到期时间带随机抖动，避免请求扎堆。
+    """
+
+    def __init__(self, workers: int, jitter: float):
+        self.workers = workers
+        self.jitter = jitter
+        self._heap: list[tuple[float, int, RoomPollHandle]] = []
+        self._seq = 0
+        self._ready: asyncio.Queue[tuple[float, RoomPollHandle]] = asyncio.Queue()
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+        self._in_flight = 0
+        self.metrics: Dict[str, float] = {
+            "ticks": 0,
+            "lateness_ms_total": 0.0,
+            "lateness_ms_max": 0.0,
+            "lateness_ms_last": 0.0,
+            "tick_ms_total": 0.0,
+        }
+
+    def add(self, handle: RoomPollHandle):
+        """登记新房间：首次轮询在 1 秒内随机错开，避免批量开启时同时请求。"""
+        self.ensure_started()
+        self._schedule(handle, random.uniform(0, 1.0))
+
+    def ensure_started(self):
+        if self._tasks and not any(t.done() for t in self._tasks):
+            return
+        for t in self._tasks:
+            t.cancel()
+        self._tasks = [asyncio.create_task(self._dispatch())]
+        self._tasks += [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self):
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def get_metrics(self) -> Dict[str, float]:
+        metrics = dict(self.metrics)
+        ticks = metrics["ticks"]
+        metrics["lateness_ms_avg"] = metrics["lateness_ms_total"] / ticks if ticks else 0.0
+        metrics["tick_ms_avg"] = metrics["tick_ms_total"] / ticks if ticks else 0.0
+        now = time.monotonic()
+        live = [entry for entry in self._heap if not entry[2].done()]
+        metrics["scheduled"] = len(live)
+        metrics["overdue"] = sum(1 for entry in live if entry[0] < now)
+        metrics["ready_queue"] = self._ready.qsize()
+        metrics["in_flight"] = self._in_flight
+        metrics["refreshing"] = sum(1 for h in RUNNING_TASKS.values() if getattr(h, "refresh", None) is not None)
+        metrics["workers"] = self.workers
+        return metrics
+
+    def reschedule(self, handle: RoomPollHandle, delay: float):
+        """凭据刷新完成后把暂停的房间放回调度堆。"""
+        self.ensure_started()
+        self._schedule(handle, delay)
+
+    def _schedule(self, handle: RoomPollHandle, delay: float):
+        if self.jitter and delay > 0:
+            delay *= 1 + random.uniform(-self.jitter, self.jitter)
+        handle.due_at = time.monotonic() + max(0.0, delay)
+        self._seq += 1
+        heapq.heappush(self._heap, (handle.due_at, self._seq, handle))
+        self._wakeup.set()
+
+    async def _dispatch(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                due, _, handle = heapq.heappop(self._heap)
+                if not handle.done():
+                    self._ready.put_nowait((due, handle))
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self):
+        while True:
+            due, handle = await self._ready.get()
+            if handle.done():
+                continue
+            started = time.monotonic()
+            lateness_ms = (started - due) * 1000
+            self.metrics["ticks"] += 1
+            self.metrics["lateness_ms_total"] += lateness_ms
+            self.metrics["lateness_ms_last"] = lateness_ms
+            self.metrics["lateness_ms_max"] = max(self.metrics["lateness_ms_max"], lateness_ms)
+            self._in_flight += 1
+            handle.current = asyncio.create_task(poll_room_tick(handle))
+            try:
+                delay = await handle.current
+            except asyncio.CancelledError:
+                if handle.cancelled():
+                    continue  # 房间被停止，worker 继续服务其他房间
+                raise
+            except Exception as e:
+                print(f"[{handle.username}] 轮询异常: {e}")
+                delay = 5
+            finally:
+                handle.current = None
+                self._in_flight -= 1
+                self.metrics["tick_ms_total"] += (time.monotonic() - started) * 1000
+            if delay is None:
+                handle._finish()
+            elif handle.done():
+                continue
+            elif handle.refresh_request is not None:
+                # 凭据获取可能要等浏览器数十秒，不能占着 worker：交给独立任务，完成后由它重新排期
+                request, handle.refresh_request = handle.refresh_request, None
+                start_room_refresh(handle, **request)
             else:
-                poll_interval = POLL_INTERVAL  # 3秒
-                # 退出低频模式时，清除日志标志
-                if state.get("low_freq_logged", False):
-                    state["low_freq_logged"] = False
-                    ROOM_STATE[username] = state
-            
-            await asyncio.sleep(poll_interval)
-        except asyncio.TimeoutError:
-            print(f"[{username}] 请求超时，稍后重试")
-            await asyncio.sleep(3)
-        except Exception as e:
-            print(f"[{username}] 轮询异常: {e}")
-            await asyncio.sleep(5)
+                self._schedule(handle, delay)
+
+
+POLL_SCHEDULER = PollScheduler(POLL_WORKERS, POLL_JITTER_PERCENT / 100)
 
 
 # ---------- 任务与会话管理（供 UI 调用） ----------
+# 共享会话连接池的实时统计（由 aiohttp TraceConfig 回调更新）
+HTTP_POOL_STATS = {
+    "requests": 0,
+    "in_flight": 0,
+    "queued": 0,  # 当前正在等待空闲连接的请求数
+    "queued_total": 0,
+    "queue_wait_ms_total": 0.0,
+    "queue_wait_ms_max": 0.0,
+    "connections_created": 0,
+    "connections_reused": 0,
+    "dns_cache_hits": 0,
+    "dns_cache_misses": 0,
+}
+
+
+async def _on_pool_request_start(session, ctx, params):
+    HTTP_POOL_STATS["requests"] += 1
+    HTTP_POOL_STATS["in_flight"] += 1
+
+
+async def _on_pool_request_done(session, ctx, params):
+    HTTP_POOL_STATS["in_flight"] -= 1
+
+
+async def _on_pool_queued_start(session, ctx, params):
+    ctx.queued_at = time.monotonic()
+    HTTP_POOL_STATS["queued"] += 1
+    HTTP_POOL_STATS["queued_total"] += 1
+
+
+async def _on_pool_queued_end(session, ctx, params):
+    HTTP_POOL_STATS["queued"] -= 1
+    wait_ms = (time.monotonic() - getattr(ctx, "queued_at", time.monotonic())) * 1000
+    HTTP_POOL_STATS["queue_wait_ms_total"] += wait_ms
+    HTTP_POOL_STATS["queue_wait_ms_max"] = max(HTTP_POOL_STATS["queue_wait_ms_max"], wait_ms)
+
+
+def _bump_pool_stat(key: str):
+    async def _callback(session, ctx, params):
+        HTTP_POOL_STATS[key] += 1
+    return _callback
+
+
+def make_pool_trace_config() -> aiohttp.TraceConfig:
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(_on_pool_request_start)
+    trace.on_request_end.append(_on_pool_request_done)
+    trace.on_request_exception.append(_on_pool_request_done)
+    trace.on_connection_queued_start.append(_on_pool_queued_start)
+    trace.on_connection_queued_end.append(_on_pool_queued_end)
+    trace.on_connection_create_end.append(_bump_pool_stat("connections_created"))
+    trace.on_connection_reuseconn.append(_bump_pool_stat("connections_reused"))
+    trace.on_dns_cache_hit.append(_bump_pool_stat("dns_cache_hits"))
+    trace.on_dns_cache_miss.append(_bump_pool_stat("dns_cache_misses"))
+    return trace
+
+
+def get_http_pool_stats() -> Dict[str, Any]:
+    """共享会话连接池的配置与实时统计。"""
+    stats: Dict[str, Any] = dict(HTTP_POOL_STATS)
+    connector = ASYNC_SESSION.connector if ASYNC_SESSION is not None and not ASYNC_SESSION.closed else None
+    # acquired：正被请求占用的连接；idle：保留在池中等待复用的连接
+    stats["acquired"] = len(getattr(connector, "_acquired", ())) if connector else 0
+    stats["idle"] = sum(len(conns) for conns in getattr(connector, "_conns", {}).values()) if connector else 0
+    stats["limit"] = HTTP_POOL_LIMIT
+    stats["limit_per_host"] = HTTP_POOL_LIMIT_PER_HOST
+    stats["keepalive_sec"] = HTTP_KEEPALIVE_SEC
+    stats["dns_cache_ttl"] = HTTP_DNS_CACHE_TTL
+    stats["proxy"] = bool(PROXY)
+    stats["queue_wait_ms_total"] = round(stats["queue_wait_ms_total"], 1)
+    stats["queue_wait_ms_max"] = round(stats["queue_wait_ms_max"], 1)
+    opened = stats["connections_created"] + stats["connections_reused"]
+    stats["reuse_ratio"] = round(stats["connections_reused"] / opened, 3) if opened else None
+    stats["queue_wait_ms_avg"] = (
+        round(stats["queue_wait_ms_total"] / stats["queued_total"], 1) if stats["queued_total"] else None
+    )
+    return stats
+
+
 async def ensure_session() -> aiohttp.ClientSession:
     global ASYNC_SESSION
     if ASYNC_SESSION is None or ASYNC_SESSION.closed:
-        ASYNC_SESSION = aiohttp.ClientSession(connector=make_aiohttp_connector())
+        ASYNC_SESSION = aiohttp.ClientSession(
+            connector=make_aiohttp_connector(),
+            trace_configs=[make_pool_trace_config()],
+        )
     return ASYNC_SESSION
 
 
@@ -1718,17 +4390,19 @@ async def start_monitor(username: str):
         if current and not current.done():
             return
         # 设置加载状态
-        if username not in ROOM_STATE:
-            ROOM_STATE[username] = {}
-        ROOM_STATE[username]["status_loading"] = True
+        get_room_state(username).status_loading = True
         session = await ensure_session()
-        task = asyncio.create_task(poll_room(session, username))
-        task.add_done_callback(lambda t, u=username: _on_monitor_task_done(u, t))
-        RUNNING_TASKS[username] = task
+        handle = RoomPollHandle(username, session)
+        handle.add_done_callback(lambda t, u=username: _on_monitor_task_done(u, t))
+        RUNNING_TASKS[username] = handle
+        POLL_SCHEDULER.add(handle)
+        ensure_credential_renewer()
+        ensure_browser_watchdog()
+        ensure_seen_snapshotter()
         set_streamer_running(username, True)
 
 
-def _on_monitor_task_done(username: str, task: asyncio.Task):
+def _on_monitor_task_done(username: str, task: RoomPollHandle):
     """监控任务结束后的收尾，防止状态长期停留在“加载中”或“运行中”"""
     current = RUNNING_TASKS.get(username)
     if current is not task:
@@ -1738,9 +4412,9 @@ def _on_monitor_task_done(username: str, task: asyncio.Task):
     set_streamer_running(username, False)
     state = ROOM_STATE.get(username)
     if state is not None:
-        state["status_loading"] = False
-        if state.get("online_status") not in (True, False):
-            state["online_status"] = None
+        state.status_loading = False
+        if state.online_status not in (True, False):
+            state.online_status = None
     if not task.cancelled():
         try:
             exc = task.exception()
@@ -1758,9 +4432,10 @@ def stop_monitor(username: str, persist_running: bool = True):
     if persist_running:
         set_streamer_running(username, False)
     # 清除加载状态并将状态置为未知
-    if username in ROOM_STATE:
-        ROOM_STATE[username]["status_loading"] = False
-        ROOM_STATE[username]["online_status"] = None
+    state = ROOM_STATE.get(username)
+    if state is not None:
+        state.status_loading = False
+        state.online_status = None
     ensure_stopped_streamers_at_end(persist=persist_running)
 
 
@@ -1771,11 +4446,55 @@ async def stop_all_monitors(persist_running: bool = True):
 
 async def close_session():
     global ASYNC_SESSION
+    # 通知派发器收尾时仍要用共享会话发送排队中的通知，先关它
+    await NOTIFIER.close()
     if ASYNC_SESSION is not None and not ASYNC_SESSION.closed:
         await ASYNC_SESSION.close()
     ASYNC_SESSION = None
 
 
+async def close_browser_pool():
+    await BROWSER_POOL.close()
+    # 关闭后仍残留的 Chromium（如抓取中途崩溃的渲染进程）一并清理
+    try:
+        snapshot = await collect_browser_processes()
+        BROWSER_WATCHDOG_STATS["orphans_killed"] += kill_orphan_browser_processes(snapshot["orphans"])
+    except Exception:
+        pass
+
+
+async def collect_diagnostics() -> Dict[str, Dict[str, Any]]:
+    """汇总浏览器子系统与凭据获取的运行数据，供诊断面板展示。"""
+    watchdog = dict(BROWSER_WATCHDOG_STATS)
+    try:
+        snapshot = await collect_browser_processes()
+        watchdog["processes"] = snapshot["processes"]
+        watchdog["rss_mb"] = snapshot["rss_mb"]
+        watchdog["orphans_found"] = len(snapshot["orphans"])
+    except Exception as e:
+        watchdog["last_error"] = f"无法读取进程表: {e}"
+    watchdog["memory_ceiling_mb"] = BROWSER_MEMORY_CEILING_MB
+    watchdog["max_age_sec"] = BROWSER_MAX_AGE_SEC
+    return {
+        "浏览器进程": watchdog,
+        "浏览器池": BROWSER_POOL.get_metrics(),
+        "抓取准入队列": BROWSER_ADMISSION.get_metrics(),
+        "抓取配置统计": dict(CAPTURE_STATS),
+        "HTTP 快速通道": get_http_fast_path_stats(),
+        "站点凭据共享": {**SITE_CREDENTIAL_STATS, **CREDENTIAL_FLIGHT_STATS},
+        "凭据续期": {**CREDENTIAL_RENEW_STATS, "lifetimes": get_credential_lifetime_stats()},
+        "轮询间隔": get_poll_rate_stats(),
+        "轮询调度器": POLL_SCHEDULER.get_metrics(),
+        "直播状态缓存": get_status_cache_stats(),
+        "消息增量扫描": dict(MESSAGE_SCAN_STATS),
+        "chat 响应指纹": dict(CHAT_PAYLOAD_STATS),
+        "选单匹配": dict(MENU_MATCH_STATS),
+        "消息去重": get_seen_store_stats(),
+        "HTTP 连接池": get_http_pool_stats(),
+        "通知派发": NOTIFIER.get_metrics(),
+    }
+
+
 # ---------- 持久化存储 ----------
 # load_streamers 和 save_streamers 已在文件开头定义
 
@@ -1881,11 +4600,11 @@ def toggle_dark_mode_manual() -> None:
 
 
 def human_status(username: str) -> str:
-    state = ROOM_STATE.get(username) or {}
+    state = ROOM_STATE.get(username) or RoomState()
     # 如果正在加载状态，显示加载中
-    if state.get("status_loading", False):
+    if state.status_loading:
         return "🟡 加载中..."
-    status = state.get("online_status")
+    status = state.online_status
     if status is True:
         return "🟢 直播中"
     if status is False:
@@ -1912,8 +4631,8 @@ def to_beijing_time(iso_ts: str) -> str:
 
 def get_high_tip_amount(username: str) -> str:
     """获取最新高额打赏的金额（如果有5分钟内的记录，显示整数金额+圆点，否则显示"小费"）"""
-    state = ROOM_STATE.get(username) or {}
-    last_high = state.get("last_high_tip") or {}
+    state = ROOM_STATE.get(username) or RoomState()
+    last_high = state.last_high_tip or {}
     if last_high:
         ts_utc = last_high.get("timestamp", "")
         if ts_utc:
@@ -1922,9 +4641,8 @@ def get_high_tip_amount(username: str) -> str:
                 # 如果超过5分钟，清除记录
                 if minutes_ago > 5:
                     try:
-                        state = ROOM_STATE.get(username) or {}
-                        state["last_high_tip"] = None
-                        ROOM_STATE[username] = state
+                        state = get_room_state(username)
+                        state.last_high_tip = None
                     except Exception:
                         pass
                     return "小费"
@@ -1938,8 +4656,8 @@ def get_high_tip_amount(username: str) -> str:
 
 def get_high_tip_time(username: str) -> str:
     """获取最新高额打赏的时间（显示为"x分钟前"）"""
-    state = ROOM_STATE.get(username) or {}
-    last_high = state.get("last_high_tip") or {}
+    state = ROOM_STATE.get(username) or RoomState()
+    last_high = state.last_high_tip or {}
     if last_high:
         ts_utc = last_high.get("timestamp", "")
         if ts_utc:
@@ -1948,9 +4666,8 @@ def get_high_tip_time(username: str) -> str:
                 # 如果超过5分钟，清除记录
                 if minutes_ago > 5:
                     try:
-                        state = ROOM_STATE.get(username) or {}
-                        state["last_high_tip"] = None
-                        ROOM_STATE[username] = state
+                        state = get_room_state(username)
+                        state.last_high_tip = None
                     except Exception:
                         pass
                     return "—"
@@ -1964,8 +4681,8 @@ def get_high_tip_time(username: str) -> str:
 
 def get_wheel_display(username: str) -> str:
     """获取转轮游戏显示文本（包含金额和提示圆点）"""
-    state = ROOM_STATE.get(username) or {}
-    last_wheel = state.get("last_wheel_tip") or {}
+    state = ROOM_STATE.get(username) or RoomState()
+    last_wheel = state.last_wheel_tip or {}
     if last_wheel:
         ts_utc = last_wheel.get("timestamp", "")
         if ts_utc:
@@ -1973,8 +4690,7 @@ def get_wheel_display(username: str) -> str:
             if minutes_ago is not None:
                 if minutes_ago > 5:
                     try:
-                        state["last_wheel_tip"] = None
-                        ROOM_STATE[username] = state
+                        state.last_wheel_tip = None
                     except Exception:
                         pass
                     return "转轮"
@@ -1992,8 +4708,8 @@ def get_wheel_display(username: str) -> str:
 
 def get_wheel_time(username: str) -> str:
     """获取转轮游戏发生时间（显示为"x分钟前"）"""
-    state = ROOM_STATE.get(username) or {}
-    last_wheel = state.get("last_wheel_tip") or {}
+    state = ROOM_STATE.get(username) or RoomState()
+    last_wheel = state.last_wheel_tip or {}
     if last_wheel:
         ts_utc = last_wheel.get("timestamp", "")
         if ts_utc:
@@ -2001,8 +4717,7 @@ def get_wheel_time(username: str) -> str:
             if minutes_ago is not None:
                 if minutes_ago > 5:
                     try:
-                        state["last_wheel_tip"] = None
-                        ROOM_STATE[username] = state
+                        state.last_wheel_tip = None
                     except Exception:
                         pass
                     return "—"
@@ -2012,10 +4727,10 @@ def get_wheel_time(username: str) -> str:
 
 def has_active_events(username: str) -> bool:
     """检查是否有满足条件的小费、菜单、达标或转轮事件（即是否有粉色圆点）"""
-    state = ROOM_STATE.get(username) or {}
+    state = ROOM_STATE.get(username) or RoomState()
     
     # 检查是否有满足条件的高额打赏（5分钟内）
-    last_high = state.get("last_high_tip") or {}
+    last_high = state.last_high_tip or {}
     if last_high:
         ts_utc = last_high.get("timestamp", "")
         if ts_utc:
@@ -2024,7 +4739,7 @@ def has_active_events(username: str) -> bool:
                 return True
     
     # 检查是否有满足条件的菜单打赏（5分钟内）
-    last_menu_tip = state.get("last_menu_tip")
+    last_menu_tip = state.last_menu_tip
     if last_menu_tip:
         ts_utc = last_menu_tip.get("timestamp", "")
         if ts_utc:
@@ -2033,7 +4748,7 @@ def has_active_events(username: str) -> bool:
                 return True
     
     # 检查是否有满足条件的达标事件（5分钟内）
-    last_goal = state.get("last_threshold_goal")
+    last_goal = state.last_threshold_goal
     if last_goal:
         ts_utc = last_goal.get("timestamp", "")
         if ts_utc:
@@ -2042,7 +4757,7 @@ def has_active_events(username: str) -> bool:
                 return True
 
     # 检查是否有转轮游戏事件（5分钟内）
-    last_wheel = state.get("last_wheel_tip")
+    last_wheel = state.last_wheel_tip
     if last_wheel:
         ts_utc = last_wheel.get("timestamp", "")
         if ts_utc:
@@ -2058,22 +4773,13 @@ def clear_streamer_events(username: str):
     state = ROOM_STATE.get(username)
     if not state:
         return
-    changed = False
-    for key in ("last_high_tip", "last_menu_tip", "last_threshold_goal", "last_wheel_tip"):
-        if state.get(key):
-            state[key] = None
-            changed = True
-    if state.get("high_tip_count"):
-        state["high_tip_count"] = 0
-        changed = True
-    if changed:
-        ROOM_STATE[username] = state
+    state.clear_events()
     EVENT_ACTIVE_STATE.pop(username, None)
 
 def get_menu_info(username: str) -> str:
     """获取菜单信息（如果有匹配的菜单打赏，显示"选单●"，否则显示"选单"）"""
-    state = ROOM_STATE.get(username) or {}
-    last_menu_tip = state.get("last_menu_tip")
+    state = ROOM_STATE.get(username) or RoomState()
+    last_menu_tip = state.last_menu_tip
     if last_menu_tip:
         # 检查时间是否在5分钟内
         try:
@@ -2087,8 +4793,7 @@ def get_menu_info(username: str) -> str:
                 time_diff = now - tip_time
                 # 如果超过5分钟，清除记录
                 if time_diff > timedelta(minutes=5):
-                    state["last_menu_tip"] = None
-                    ROOM_STATE[username] = state
+                    state.last_menu_tip = None
                     return "选单"
                 # 5分钟内，显示带圆点的"选单"
                 return "选单●"
@@ -2111,8 +4816,8 @@ def get_minutes_ago(iso_ts: str) -> int:
 
 def get_threshold_info(username: str) -> str:
     """获取达标信息（如果5分钟内有达标事件，显示"达标●"，否则显示"达标"）"""
-    state = ROOM_STATE.get(username) or {}
-    last_goal = state.get("last_threshold_goal")
+    state = ROOM_STATE.get(username) or RoomState()
+    last_goal = state.last_threshold_goal
     if last_goal:
         ts_utc = last_goal.get("timestamp", "")
         if ts_utc:
@@ -2120,8 +4825,7 @@ def get_threshold_info(username: str) -> str:
             if minutes_ago is not None:
                 if minutes_ago > 5:
                     try:
-                        state["last_threshold_goal"] = None
-                        ROOM_STATE[username] = state
+                        state.last_threshold_goal = None
                     except Exception:
                         pass
                     return "达标"
@@ -2130,8 +4834,8 @@ def get_threshold_info(username: str) -> str:
 
 def get_threshold_time(username: str) -> str:
     """获取达标时间（显示为"x分钟前"，超过5分钟或无记录显示—）"""
-    state = ROOM_STATE.get(username) or {}
-    last_goal = state.get("last_threshold_goal")
+    state = ROOM_STATE.get(username) or RoomState()
+    last_goal = state.last_threshold_goal
     if last_goal:
         ts_utc = last_goal.get("timestamp", "")
         if ts_utc:
@@ -2139,8 +4843,7 @@ def get_threshold_time(username: str) -> str:
             if minutes_ago is not None:
                 if minutes_ago > 5:
                     try:
-                        state["last_threshold_goal"] = None
-                        ROOM_STATE[username] = state
+                        state.last_threshold_goal = None
                     except Exception:
                         pass
                     return "—"
@@ -2149,8 +4852,8 @@ def get_threshold_time(username: str) -> str:
 
 def get_menu_tip_time(username: str) -> str:
     """获取菜单打赏时间（显示为"x分钟前"）"""
-    state = ROOM_STATE.get(username) or {}
-    last_menu_tip = state.get("last_menu_tip")
+    state = ROOM_STATE.get(username) or RoomState()
+    last_menu_tip = state.last_menu_tip
     if last_menu_tip:
         ts_utc = last_menu_tip.get("timestamp", "")
         if ts_utc:
@@ -2159,9 +4862,8 @@ def get_menu_tip_time(username: str) -> str:
                 # 如果超过5分钟，清除记录
                 if minutes_ago > 5:
                     try:
-                        state = ROOM_STATE.get(username) or {}
-                        state["last_menu_tip"] = None
-                        ROOM_STATE[username] = state
+                        state = get_room_state(username)
+                        state.last_menu_tip = None
                     except Exception:
                         pass
                     return "—"
@@ -2174,8 +4876,8 @@ def get_menu_tip_time(username: str) -> str:
 
 def get_menu_detail(username: str) -> str:
     """获取菜单详情（完整的菜单项内容）"""
-    state = ROOM_STATE.get(username) or {}
-    last_menu_tip = state.get("last_menu_tip")
+    state = ROOM_STATE.get(username) or RoomState()
+    last_menu_tip = state.last_menu_tip
     if last_menu_tip:
         ts_utc = last_menu_tip.get("timestamp", "")
         if ts_utc:
@@ -2367,8 +5069,8 @@ def build_streamer_row(streamer: dict):
                     with ui.row().classes('w-full gap-2').style('margin-top: 2px;'):
                         refresh_btn = ui.button('刷新菜单').classes('q-btn--no-uppercase')
                         # 仅在主播直播中才允许刷新菜单
-                        state = ROOM_STATE.get(username) or {}
-                        can_refresh_menu = state.get("online_status") is True
+                        state = ROOM_STATE.get(username) or RoomState()
+                        can_refresh_menu = state.online_status is True
                         refresh_btn.set_enabled(can_refresh_menu)
                         if not can_refresh_menu:
                             refresh_btn.tooltip('主播未直播，无法刷新菜单')
@@ -2385,8 +5087,7 @@ def build_streamer_row(streamer: dict):
                                     if checkbox.value:
                                         current_dialog_selected.add(item_key)
                                 
-                                loop = asyncio.get_event_loop()
-                                menu_result = await loop.run_in_executor(None, fetch_tip_menu_via_api, username, 30000) or {}
+                                menu_result = await fetch_tip_menu_via_api(username, 30000) or {}
 
                                 if menu_result.get("error"):
                                     ui.notify(f'获取菜单失败: {menu_result["error"]}', type='negative')
@@ -2617,8 +5318,8 @@ def sort_streamers_by_live_status():
         username = get_streamer_username(streamer)
         if not username:
             return (1,)
-        state = ROOM_STATE.get(username) or {}
-        status = state.get("online_status")
+        state = ROOM_STATE.get(username) or RoomState()
+        status = state.online_status
         running = get_streamer_running(username)
         if not running:
             return (2,)
@@ -2658,7 +5359,7 @@ def move_streamer_below_last_live(username: str):
     for i, s in enumerate(STREAMERS):
         uname = get_streamer_username(s)
         if uname:
-            st = (ROOM_STATE.get(uname) or {}).get("online_status")
+            st = (ROOM_STATE.get(uname) or RoomState()).online_status
             if st is True:
                 last_live_index = i
     # 计算插入位置（最后直播中的下一行；若无直播中，则插入到0）
@@ -2713,6 +5414,7 @@ def reorder_streamers_by_event_state() -> bool:
 
 def prioritize_streamer_on_event(username: str):
     """监控事件触发时将对应主播移动到事件区块末尾并刷新 UI"""
+    ROOM_LAST_EVENT_AT[username] = time.time()
     try:
         reorder_streamers_by_event_state()
     except Exception:
@@ -2881,7 +5583,7 @@ def build_ui():
                                 return
                             
                             # 检查是否已存在
-                            _, existing = find_streamer_by_username(username)
+                            existing = get_streamer(username)
                             if existing is not None:
                                 ui.notify('该主播已存在', type='warning')
                                 return
@@ -2936,6 +5638,7 @@ def build_ui():
                     except ValueError:
                         pass
                     EVENT_ACTIVE_STATE.pop(username, None)
+                    MENU_MATCHERS.pop(username, None)
 
                 deleted_count = len(to_delete)
                 save_streamers()
@@ -2962,6 +5665,7 @@ def build_ui():
                             ui.notify('正在退出程序...', type='warning')
                             await stop_all_monitors(persist_running=False)
                             await close_session()
+                            await close_browser_pool()
                             app.shutdown()
 
                         ui.button('取消', on_click=exit_dialog.close).classes('q-btn--no-uppercase')
@@ -2975,6 +5679,35 @@ def build_ui():
                         await start_monitor(username)
             async def stop_all():
                 await stop_all_monitors()
+            async def open_diagnostics():
+                with ui.dialog() as diag_dialog, ui.card().style('width: 640px; max-height: 80vh; padding: 20px;'):
+                    ui.label('运行诊断').classes('text-h6')
+                    diag_container = ui.column().classes('w-full gap-1').style('overflow-y: auto;')
+
+                    async def render_diagnostics():
+                        data = await collect_diagnostics()
+                        diag_container.clear()
+                        with diag_container:
+                            for section, values in data.items():
+                                ui.label(section).classes('text-subtitle2').style('font-weight: bold; margin-top: 8px;')
+                                for key, value in values.items():
+                                    if isinstance(value, float):
+                                        text = f"{value:.1f}"
+                                    elif isinstance(value, dict):
+                                        text = json.dumps(value, ensure_ascii=False, default=str)
+                                    else:
+                                        text = str(value)
+                                    ui.label(f"{key}: {text}").classes('text-sm text-gray-700').style('word-break: break-all;')
+
+                    with ui.row().classes('w-full justify-end gap-2').style('margin-top: 14px;'):
+                        ui.button('刷新', on_click=render_diagnostics).classes('q-btn--no-uppercase')
+                        ui.button('关闭', on_click=diag_dialog.close).classes('q-btn--no-uppercase')
+                await render_diagnostics()
+                diag_dialog.open()
+
+            admission_label = ui.label(format_browser_admission_status()).classes('text-xs whitespace-nowrap').style('opacity: 0.85;')
+            ui.timer(1.0, lambda: admission_label.set_text(format_browser_admission_status()))
+            ui.button('诊断', on_click=open_diagnostics).props('flat').classes('q-btn--no-uppercase')
             ui.button('退出程序', on_click=request_program_exit).props('text-color=negative').classes('q-btn--no-uppercase')
             ui.button('全部开启', on_click=start_all).classes('q-btn--no-uppercase')
             ui.button('全部关闭', on_click=stop_all).classes('q-btn--no-uppercase')
@@ -3083,15 +5816,16 @@ async def _on_startup():
 
 async def _on_shutdown():
     await stop_all_monitors(persist_running=False)
+    await stop_seen_snapshotter()
     await close_session()
+    await close_browser_pool()
 
 async def poll_superchat(username: str):
     """
     演示：使用 Playwright 获取 uniq + cookies + UA，然后用 aiohttp 复用这些信息请求 chat API。
     """
     # 先用 Playwright 抓一次
-    loop = asyncio.get_event_loop()
-    uniq, cookies, ua, html = await loop.run_in_executor(None, fetch_page_uniq_and_cookies, username, True, 20000)
+    uniq, cookies, ua, html, _ = await fetch_page_uniq_and_cookies(username, True, 20000)
     if not uniq:
         print(f"[{username}] 未能通过 Playwright 获取 uniq，退出演示。")
         return
@@ -3099,14 +5833,14 @@ async def poll_superchat(username: str):
     api_url = build_chat_api_url(site_origin, username, uniq)
     cookie_header = "; ".join([f"{k}={v}" for k, v in cookies.items()])
     headers = {
-        "User-Agent": ua or "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/109.0.0.0 Safari/537.36",
+        "User-Agent": ua or DEFAULT_USER_AGENT,
         "Accept": "application/json, text/plain, */*",
         "Referer": build_room_url(site_origin, username),
         "Cookie": cookie_header,
     }
 
     async with aiohttp.ClientSession(connector=make_aiohttp_connector()) as session:
-        async with session.get(api_url, headers=headers, timeout=15) as resp:
+        async with session.get(api_url, headers=headers, timeout=HTTP_TIMEOUTS["chat"]) as resp:
             print(f"[{username}] 状态码:", resp.status)
             text_ct = resp.headers.get("Content-Type","")
             if resp.status == 200 and "application/json" in text_ct:
@@ -3118,11 +5852,18 @@ async def poll_superchat(username: str):
                 print(f"[{username}] 返回内容片段:", data[:300])
 
 async def main():
-    # 多房间异步轮询：共享一个会话与代理，分别跑每个主播
-    async with aiohttp.ClientSession(connector=make_aiohttp_connector()) as session:
-        tasks = [asyncio.create_task(poll_room(session, get_streamer_username(streamer))) 
-                 for streamer in STREAMERS if get_streamer_username(streamer)]
-        await asyncio.gather(*tasks)
+    # 无界面多房间轮询：全部主播交给 POLL_SCHEDULER，共享一个会话与代理
+    for streamer in STREAMERS:
+        username = get_streamer_username(streamer)
+        if username:
+            await start_monitor(username)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await stop_all_monitors(persist_running=False)
+        await stop_seen_snapshotter()
+        await close_session()
+        await close_browser_pool()
 
 
 def run():
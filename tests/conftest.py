@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# monitor_tip 在导入时读取并写入数据目录，测试使用独立的临时目录
+os.environ["SUPERCHAT_DATA_DIR"] = tempfile.mkdtemp(prefix="superchat-test-")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
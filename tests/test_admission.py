@@ -0,0 +1,147 @@
+import asyncio
+
+import pytest
+
+import monitor_tip as m
+
+SITE = "https://example.com"
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_waiters_are_admitted_by_priority_then_arrival():
+    async def scenario():
+        admission = m.BrowserAdmission(1, 10)
+        await admission.acquire(m.ADMISSION_PRIORITY_OTHER)
+        order = []
+
+        async def waiter(name, priority):
+            await admission.acquire(priority)
+            order.append(name)
+
+        tasks = [
+            asyncio.create_task(waiter("other", m.ADMISSION_PRIORITY_OTHER)),
+            asyncio.create_task(waiter("live-1", m.ADMISSION_PRIORITY_LIVE)),
+            asyncio.create_task(waiter("event", m.ADMISSION_PRIORITY_RECENT_EVENT)),
+            asyncio.create_task(waiter("live-2", m.ADMISSION_PRIORITY_LIVE)),
+        ]
+        await _settle()
+        assert admission.get_metrics()["queued"] == 4
+        for _ in tasks:
+            admission.release()
+            await _settle()
+        admission.release()
+        await asyncio.gather(*tasks)
+        assert order == ["live-1", "live-2", "event", "other"]
+        metrics = admission.get_metrics()
+        assert metrics["active"] == 0 and metrics["admitted"] == 5
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_rejects_or_evicts_the_least_important_waiter():
+    async def scenario():
+        admission = m.BrowserAdmission(1, 1)
+        await admission.acquire(m.ADMISSION_PRIORITY_LIVE)
+        queued = asyncio.create_task(admission.acquire(m.ADMISSION_PRIORITY_OTHER))
+        await _settle()
+        with pytest.raises(m.BrowserAdmissionRejected):
+            await admission.acquire(m.ADMISSION_PRIORITY_OTHER)
+        urgent = asyncio.create_task(admission.acquire(m.ADMISSION_PRIORITY_LIVE))
+        await _settle()
+        with pytest.raises(m.BrowserAdmissionRejected):
+            await queued
+        admission.release()
+        await urgent
+        assert admission.metrics["evicted"] == 1 and admission.metrics["rejected"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiters_give_up_their_place():
+    async def scenario():
+        admission = m.BrowserAdmission(1, 10)
+        await admission.acquire(m.ADMISSION_PRIORITY_LIVE)
+        cancelled = asyncio.create_task(admission.acquire(m.ADMISSION_PRIORITY_LIVE))
+        later = asyncio.create_task(admission.acquire(m.ADMISSION_PRIORITY_OTHER))
+        await _settle()
+        cancelled.cancel()
+        await _settle()
+        admission.release()
+        await asyncio.wait_for(later, 1)
+        # 被放行的同时被取消：名额移交给下一个，不会泄漏
+        granted = asyncio.create_task(admission.acquire(m.ADMISSION_PRIORITY_LIVE))
+        last = asyncio.create_task(admission.acquire(m.ADMISSION_PRIORITY_OTHER))
+        await _settle()
+        admission.release()
+        granted.cancel()
+        await asyncio.wait_for(last, 1)
+        admission.release()
+        assert admission.get_metrics()["active"] == 0
+
+    asyncio.run(scenario())
+
+
+@pytest.fixture
+def capture_state(monkeypatch):
+    monkeypatch.setattr(m, "BROWSER_ADMISSION", m.BrowserAdmission(2, 100))
+    monkeypatch.setattr(m, "SITE_CREDENTIALS", {})
+    monkeypatch.setattr(m, "SITE_CREDENTIAL_LOCKS", {})
+    monkeypatch.setattr(m, "SITE_CAPTURE_FLIGHTS", {})
+    monkeypatch.setattr(m, "SITE_CREDENTIAL_STATS", dict.fromkeys(m.SITE_CREDENTIAL_STATS, 0))
+    monkeypatch.setattr(m, "CREDENTIAL_FLIGHTS", {})
+    monkeypatch.setattr(m, "CREDENTIAL_FLIGHT_RECENT", {})
+    monkeypatch.setattr(m, "CREDENTIAL_CACHE", {})
+    monkeypatch.setattr(m, "CREDENTIAL_ISSUED_AT", {})
+    monkeypatch.setattr(m, "ROOM_STATE", {})
+    monkeypatch.setattr(m, "HTTP_FAST_PATH_ENABLED", False)
+    monkeypatch.setattr(m, "VERBOSE", False)
+    monkeypatch.setattr(m, "_save_credential_cache", lambda: None)
+    monkeypatch.setattr(m, "get_streamer_site_origin", lambda username: SITE)
+    launches: list[str] = []
+    peak = {"active": 0, "max": 0}
+    outcome = {"uniq": "U1"}
+
+    async def fake_capture(username, headless, nav_timeout, watch_time, profile):
+        launches.append(username)
+        peak["active"] += 1
+        peak["max"] = max(peak["max"], peak["active"])
+        await asyncio.sleep(0.05)
+        peak["active"] -= 1
+        if not outcome["uniq"]:
+            return None, {}, "", "ERROR", None
+        m._record_acquired_credentials(username, None, SITE, outcome["uniq"], {"c": "1"}, "UA", "")
+        return outcome["uniq"], {"c": "1"}, "UA", "", None
+
+    monkeypatch.setattr(m, "_fetch_page_uniq_admitted", fake_capture)
+    return launches, peak, outcome
+
+
+def test_rooms_on_one_site_share_a_single_browser_capture(capture_state):
+    launches, _, _ = capture_state
+
+    async def scenario():
+        return await asyncio.gather(*[m.acquire_room_credentials(f"r{i}") for i in range(40)])
+
+    results = asyncio.run(scenario())
+    assert len(launches) == 1
+    assert {r["uniq"] for r in results} == {"U1"}
+    assert m.SITE_CREDENTIAL_STATS["capture_waits"] == 39
+    assert m.SITE_CAPTURE_FLIGHTS == {}
+
+
+def test_failed_captures_stay_within_the_admission_limit(capture_state):
+    launches, peak, outcome = capture_state
+    outcome["uniq"] = None
+
+    async def scenario():
+        return await asyncio.gather(*[m.acquire_room_credentials(f"r{i}") for i in range(10)])
+
+    results = asyncio.run(scenario())
+    assert all(r["uniq"] is None for r in results)
+    assert sorted(launches) == sorted(f"r{i}" for i in range(10))
+    assert peak["max"] == m.BROWSER_ADMISSION.max_active
+    assert m.BROWSER_ADMISSION.get_metrics()["active"] == 0
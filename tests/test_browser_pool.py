@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+import monitor_tip as m
+
+
+class _FakeContext:
+    def __init__(self, browser):
+        self.browser = browser
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+class _FakeBrowser:
+    def __init__(self, headless):
+        self.headless = headless
+        self.connected = True
+        self.contexts: list[_FakeContext] = []
+
+    def is_connected(self):
+        return self.connected
+
+    async def new_context(self):
+        context = _FakeContext(self)
+        self.contexts.append(context)
+        return context
+
+    async def close(self):
+        self.connected = False
+
+
+class _FakePlaywright:
+    def __init__(self):
+        self.browsers: list[_FakeBrowser] = []
+        self.stopped = False
+        self.chromium = self
+
+    async def launch(self, headless=True):
+        browser = _FakeBrowser(headless)
+        self.browsers.append(browser)
+        return browser
+
+    async def stop(self):
+        self.stopped = True
+
+
+@pytest.fixture
+def playwright(monkeypatch):
+    driver = _FakePlaywright()
+
+    class _Starter:
+        async def start(self):
+            return driver
+
+    monkeypatch.setattr(m, "async_playwright", _Starter)
+    monkeypatch.setattr(m, "VERBOSE", False)
+    return driver
+
+
+def test_pool_bounds_concurrency_and_reuses_browsers_and_contexts(playwright):
+    active = {"now": 0, "peak": 0}
+
+    async def job(context):
+        active["now"] += 1
+        active["peak"] = max(active["peak"], active["now"])
+        await asyncio.sleep(0.01)
+        active["now"] -= 1
+        return context
+
+    async def scenario():
+        pool = m.BrowserPool(2, 3)
+        contexts = await asyncio.gather(*[pool.run(job) for _ in range(10)])
+        await pool.close()
+        return pool, contexts
+
+    pool, contexts = asyncio.run(scenario())
+    assert active["peak"] == 2
+    assert len(playwright.browsers) == 2
+    metrics = pool.metrics
+    assert metrics["browser_launches"] == 2
+    # 每个 context 最多使用 3 次：10 次抓取需要 4 个 context
+    assert metrics["contexts_created"] == 4 and metrics["contexts_reused"] == 6
+    assert len(set(map(id, contexts))) == 4
+    assert all(c.closed for c in contexts) and all(not b.connected for b in playwright.browsers)
+    assert playwright.stopped
+
+
+def test_failed_capture_discards_its_context(playwright):
+    async def boom(context):
+        raise RuntimeError("page crashed")
+
+    async def scenario():
+        pool = m.BrowserPool(1, 10)
+        with pytest.raises(RuntimeError):
+            await pool.run(boom)
+        fresh = await pool.run(lambda context: asyncio.sleep(0, context))
+        return pool, fresh
+
+    pool, fresh = asyncio.run(scenario())
+    first, second = playwright.browsers[0].contexts
+    assert first.closed and fresh is second
+    assert pool.metrics["contexts_discarded"] == 1 and pool.metrics["browser_launches"] == 1
+
+
+def test_disconnected_browser_is_relaunched(playwright):
+    async def scenario():
+        pool = m.BrowserPool(1, 10)
+        await pool.run(lambda context: asyncio.sleep(0))
+        playwright.browsers[0].connected = False
+        await pool.run(lambda context: asyncio.sleep(0))
+        return pool
+
+    pool = asyncio.run(scenario())
+    assert len(playwright.browsers) == 2 and pool.metrics["browser_launches"] == 2
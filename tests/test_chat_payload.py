@@ -0,0 +1,55 @@
+import asyncio
+import json
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import monitor_tip as m
+
+MESSAGES = [{"id": 1, "type": "tip"}, {"id": 2, "type": "text"}]
+
+
+async def _with_server(monkeypatch, scenario):
+    monkeypatch.setattr(m, "CHAT_PAYLOAD_FINGERPRINTS", {})
+    monkeypatch.setattr(m, "CHAT_PAYLOAD_STATS", dict.fromkeys(m.CHAT_PAYLOAD_STATS, 0))
+    body = json.dumps({"messages": MESSAGES}).encode()
+    requests = []
+
+    async def chat(request):
+        requests.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304)
+        return web.Response(body=body, content_type="application/json", headers={"ETag": '"v1"'})
+
+    app = web.Application()
+    app.router.add_get("/chat", chat)
+    async with TestServer(app) as server:
+        async with aiohttp.ClientSession() as session:
+            await scenario(session, str(server.make_url("/chat")), requests)
+
+
+def test_conditional_request_uses_fingerprint(monkeypatch):
+    async def scenario(session, url, requests):
+        async with session.get(url) as resp:
+            assert await m.read_chat_payload("alice", url, resp, session, {}) == MESSAGES
+        headers = m.build_chat_conditional_headers("alice", url)
+        assert headers == {"If-None-Match": '"v1"'}
+        async with session.get(url, headers=headers) as resp:
+            assert resp.status == 304
+            assert await m.read_chat_payload("alice", url, resp, session, {}) is None
+        assert m.CHAT_PAYLOAD_STATS["not_modified"] == 1
+
+    asyncio.run(_with_server(monkeypatch, scenario))
+
+
+def test_304_without_fingerprint_refetches_unconditionally(monkeypatch):
+    async def scenario(session, url, requests):
+        async with session.get(url, headers={"If-None-Match": '"v1"'}) as resp:
+            assert resp.status == 304
+            assert await m.read_chat_payload("alice", url, resp, session, {"Accept": "application/json"}) == MESSAGES
+        assert requests == ['"v1"', None]
+        assert m.CHAT_PAYLOAD_STATS["refetched"] == 1
+        assert m.CHAT_PAYLOAD_FINGERPRINTS["alice"]["etag"] == '"v1"'
+
+    asyncio.run(_with_server(monkeypatch, scenario))
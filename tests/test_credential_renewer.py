@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+import pytest
+
+import monitor_tip as m
+
+SITE = "https://example.com"
+
+
+class _RunningHandle:
+    def done(self):
+        return False
+
+
+@pytest.fixture
+def renewer_state(monkeypatch):
+    monkeypatch.setattr(m, "CREDENTIAL_ISSUED_AT", {})
+    monkeypatch.setattr(m, "CREDENTIAL_LIFETIMES", {})
+    monkeypatch.setattr(m, "ROOM_STATE", {})
+    monkeypatch.setattr(m, "RUNNING_TASKS", {"alice": _RunningHandle()})
+    monkeypatch.setattr(m, "CREDENTIAL_RENEW_STATS", dict.fromkeys(m.CREDENTIAL_RENEW_STATS, 0))
+    monkeypatch.setattr(m, "get_streamer_site_origin", lambda username: SITE)
+    state = m.get_room_state("alice")
+    state.set_credentials("alice", SITE, "current", {"c": "1"}, "UA", "http")
+    return state
+
+
+def _observe_expiries(lifetime: float, count: int):
+    now = time.time()
+    for i in range(count):
+        m.CREDENTIAL_ISSUED_AT[f"expired{i}"] = now - lifetime
+        m.observe_credential_expiry(SITE, f"expired{i}")
+
+
+def test_no_renewal_without_enough_samples(renewer_state):
+    _observe_expiries(100, m.CREDENTIAL_RENEW_MIN_SAMPLES - 1)
+    m.CREDENTIAL_ISSUED_AT["current"] = time.time() - 1000
+    renewing = {}
+    m.schedule_credential_renewals(renewing, {}, time.time())
+    assert renewing == {}
+
+
+def test_renewer_swaps_credentials_before_predicted_expiry(renewer_state, monkeypatch):
+    calls = []
+
+    async def fake_acquire(username, nav_timeout=10000, exclude_uniq=None, max_age=None):
+        calls.append((username, exclude_uniq))
+        return {"uniq": "fresh", "cookies": {"c": "2"}, "ua": "UA", "site_origin": SITE,
+                "actual_username": None, "scope": "room", "via": "http"}
+
+    monkeypatch.setattr(m, "acquire_room_credentials", fake_acquire)
+    _observe_expiries(100, m.CREDENTIAL_RENEW_MIN_SAMPLES)
+    assert m.predict_credential_lifetime(SITE) == pytest.approx(100, abs=1)
+
+    async def scenario():
+        renewing, retry_after = {}, {}
+        # 距预计失效还早：不续期
+        m.CREDENTIAL_ISSUED_AT["current"] = time.time() - 10
+        m.schedule_credential_renewals(renewing, retry_after, time.time())
+        assert renewing == {}
+        # 进入提前量窗口：续期
+        m.CREDENTIAL_ISSUED_AT["current"] = time.time() - (100 - m.CREDENTIAL_RENEW_LEAD_SEC + 5)
+        m.schedule_credential_renewals(renewing, retry_after, time.time())
+        assert list(renewing) == ["alice"]
+        assert await renewing["alice"] is True
+
+    asyncio.run(scenario())
+    assert calls == [("alice", "current")]
+    assert renewer_state.uniq == "fresh"
+    assert m.CREDENTIAL_RENEW_STATS["renewals"] == 1
+
+
+def test_renewer_running_follows_task(monkeypatch):
+    async def scenario():
+        monkeypatch.setattr(m, "CREDENTIAL_RENEWER_TASK", None)
+        assert not m.credential_renewer_running()
+        task = asyncio.create_task(asyncio.sleep(3600))
+        monkeypatch.setattr(m, "CREDENTIAL_RENEWER_TASK", task)
+        assert m.credential_renewer_running()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert not m.credential_renewer_running()
+
+    asyncio.run(scenario())
@@ -0,0 +1,48 @@
+import monitor_tip as m
+
+SITE = "https://example.com"
+
+
+def _reset(monkeypatch):
+    monkeypatch.setattr(m, "UNCONFIRMED_CREDENTIALS", {})
+    monkeypatch.setattr(m, "SITE_CREDENTIALS", {})
+    monkeypatch.setattr(m, "CREDENTIAL_ISSUED_AT", {})
+    monkeypatch.setattr(m, "HTTP_FAST_PATH_STATS", {})
+    monkeypatch.setattr(m, "ROOM_STATE", {})
+    monkeypatch.setattr(m, "CREDENTIAL_CACHE", {})
+    monkeypatch.setattr(m, "_save_credential_cache", lambda: None)
+
+
+def _record_scraped(uniq: str):
+    m._record_acquired_credentials(
+        "alice", None, SITE, uniq, {"c": "1"}, "UA", m.build_chat_api_url(SITE, "alice", uniq), confirmed=False,
+    )
+
+
+def test_scraped_uniq_is_published_only_after_a_successful_poll(monkeypatch):
+    _reset(monkeypatch)
+    _record_scraped("scraped")
+    assert m.get_site_credentials(SITE) is None
+    assert m.CREDENTIAL_CACHE == {}
+
+    m.confirm_room_credentials("scraped")
+    shared = m.get_site_credentials(SITE)
+    assert shared is not None and shared["uniq"] == "scraped"
+    assert m.CREDENTIAL_CACHE[m._credential_cache_key(SITE, "alice")]["uniq"] == "scraped"
+    assert m.HTTP_FAST_PATH_STATS[SITE]["confirmed"] == 1
+    assert m.UNCONFIRMED_CREDENTIALS == {}
+
+
+def test_rejected_scraped_uniq_is_never_published(monkeypatch):
+    _reset(monkeypatch)
+    _record_scraped("stale")
+    m.discard_unconfirmed_credentials("stale")
+    m.confirm_room_credentials("stale")
+    assert m.get_site_credentials(SITE) is None
+    assert m.CREDENTIAL_CACHE == {}
+
+
+def test_browser_captures_are_published_immediately(monkeypatch):
+    _reset(monkeypatch)
+    m._record_acquired_credentials("alice", None, SITE, "captured", {}, "UA", "")
+    assert m.get_site_credentials(SITE)["uniq"] == "captured"
@@ -0,0 +1,46 @@
+import random
+
+import pytest
+
+import monitor_tip as m
+
+WORDS = ["dance", "flash", "show", "跳舞", "唱歌", "pvt", "oil", "spin", "10分钟", "ab", "x", "💃", "🔥", "😍"]
+
+
+@pytest.fixture(autouse=True)
+def match_stats(monkeypatch):
+    monkeypatch.setattr(m, "MENU_MATCH_STATS", dict.fromkeys(m.MENU_MATCH_STATS, 0))
+
+
+def _phrase(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4)))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_index_agrees_with_the_reference_matcher(seed):
+    rng = random.Random(seed)
+    selected = [_phrase(rng) for _ in range(rng.randint(1, 30))] + ["", "   ", "🔥"]
+    rng.shuffle(selected)
+    matcher = m.MenuMatcher(selected)
+    bodies = [_phrase(rng) for _ in range(300)] + selected + [s + " extra" for s in selected] + ["", "💃"]
+    for body in bodies * 2:  # 第二遍走候选缓存
+        assert matcher.match(body) == m.match_selected_menu_item(body, selected), body
+
+
+def test_first_selected_item_wins():
+    selected = ["oil show", "show", "oil show deluxe"]
+    assert m.MenuMatcher(selected).match("Oil Show 🔥") == ("oil show", "oil show", "oil show")
+    # 按选中顺序取第一个命中的项，排在后面的完全匹配也不优先
+    assert m.MenuMatcher(selected[1:]).match("oil show deluxe") == ("show", "show", "oil show deluxe")
+    assert m.match_selected_menu_item("oil show deluxe", selected[1:])[0] == "show"
+
+
+def test_short_substrings_do_not_match_long_menu_text():
+    matcher = m.MenuMatcher(["测试"])
+    assert matcher.match("这是一个测试菜单项") is None
+    assert m.match_selected_menu_item("这是一个测试菜单项", ["测试"]) is None
+
+
+def test_matcher_without_usable_items_never_matches():
+    assert m.MenuMatcher(["", "  ", "😍"]).match("anything") is None
+    assert m.MenuMatcher([]).match("") is None
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import monitor_tip as m
+
+ROOM = "alice"
+
+
+@pytest.fixture
+def events(monkeypatch):
+    """通知与置顶钩子换成记录器，返回 (置顶, 推送) 两个列表。"""
+    prioritized: list[str] = []
+    pushed: list[tuple] = []
+    monkeypatch.setattr(m, "prioritize_streamer_on_event", prioritized.append)
+    monkeypatch.setattr(m, "browser_notify", lambda *args: pushed.append(args))
+    monkeypatch.setattr(m, "notify_print_and_telegram", lambda *args: pushed.append(args))
+    monkeypatch.setattr(m, "VERBOSE", False)
+    return prioritized, pushed
+
+
+def _config(monkeypatch, threshold=50.0, selected=()):
+    record = {"username": ROOM, "threshold": threshold, "selected_menu_items": list(selected)}
+    # STREAMERS 可能是普通列表或带索引的列表子类，按原类型构造
+    monkeypatch.setattr(m, "STREAMERS", type(m.STREAMERS)([record]))
+    return m.RoomConfigSnapshot(ROOM)
+
+
+def _msg(mtype, minutes_ago=0, mid="1", **details):
+    ts = (datetime.now(timezone.utc) - timedelta(minutes=minutes_ago)).isoformat()
+    return {"id": mid, "type": mtype, "createdAt": ts, "userData": {"username": "fan"}, "details": details}
+
+
+def _classify(state, config, msg):
+    m.classify_message(ROOM, state, config, msg, str(msg["id"]))
+
+
+def test_every_handled_event_is_registered():
+    assert set(m.MESSAGE_HANDLERS) == {
+        ("thresholdGoal", "*"), ("tip", "tipMenu"), ("tip", "app_9"), ("tip", "interactiveToy"), ("tip", ""),
+    }
+
+
+@pytest.mark.parametrize("msg", [
+    _msg("text", body="hello"),
+    _msg("tip", source="app_5", amount=500),
+    _msg("thresholdGoal", goal=1),
+    {"id": "1", "type": ["tip"], "details": {"source": {}}},
+    {"id": "1"},
+])
+def test_unhandled_messages_leave_no_trace(monkeypatch, events, msg):
+    state = m.RoomState()
+    _classify(state, _config(monkeypatch), msg)
+    assert events == ([], [])
+    assert state.last_high_tip is None and state.last_threshold_goal is None
+
+
+@pytest.mark.parametrize("source", ["", "interactiveToy"])
+def test_high_tips_at_or_above_the_threshold_are_recorded(monkeypatch, events, source):
+    state = m.RoomState()
+    config = _config(monkeypatch, threshold=50.0)
+    _classify(state, config, _msg("tip", mid="1", source=source, amount=49))
+    assert state.high_tip_count == 0 and events == ([], [])
+    _classify(state, config, _msg("tip", mid="2", source=source, amount=50))
+    assert state.high_tip_count == 1
+    assert state.last_high_tip["amount"] == 50.0 and state.last_high_tip["user"] == "fan"
+    assert events[0] == [ROOM]
+
+
+def test_stale_high_tip_notifies_without_recording(monkeypatch, events):
+    state = m.RoomState()
+    _classify(state, _config(monkeypatch), _msg("tip", minutes_ago=10, source="", amount=100))
+    assert state.high_tip_count == 0 and state.last_high_tip is None
+    assert events[0] == [] and len(events[1]) == 2  # Telegram + 浏览器
+
+
+def test_menu_tip_matches_selected_items_and_clears_on_miss(monkeypatch, events):
+    state = m.RoomState()
+    config = _config(monkeypatch, selected=["Oil Show", "Dance"])
+    _classify(state, config, _msg("tip", mid="1", source="tipMenu", amount=25, body="💃 oil show 🔥"))
+    assert state.last_menu_tip["menu_text"] == "💃 oil show 🔥"
+    assert state.last_menu_tip["amount"] == 25.0
+    _classify(state, config, _msg("tip", mid="2", source="tipMenu", amount=25, body="something else"))
+    assert state.last_menu_tip is None
+    assert events[0] == [ROOM]
+
+
+def test_wheel_and_goal_events_are_recorded(monkeypatch, events):
+    state = m.RoomState()
+    config = _config(monkeypatch)
+    _classify(state, config, _msg("tip", mid="1", source="app_9", amount=20))
+    _classify(state, config, _msg("thresholdGoal", mid="2", goal=0))
+    _classify(state, config, _msg("thresholdGoal", mid="3", minutes_ago=10, goal=0))
+    assert state.last_wheel_tip["amount"] == 20.0
+    assert state.last_threshold_goal["id"] == "2"
+    assert events[0] == [ROOM, ROOM]
+
+
+def test_handler_errors_do_not_escape(monkeypatch, events):
+    def boom(*args):
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(m.MESSAGE_HANDLERS, ("tip", ""), boom)
+    _classify(m.RoomState(), _config(monkeypatch), _msg("tip", source="", amount=100))
@@ -0,0 +1,57 @@
+import pytest
+
+import monitor_tip as m
+
+
+@pytest.fixture(autouse=True)
+def scan_state(monkeypatch):
+    monkeypatch.setattr(m, "MESSAGE_WATERMARKS", {})
+    monkeypatch.setattr(m, "MESSAGE_SCAN_STATS", dict.fromkeys(m.MESSAGE_SCAN_STATS, 0))
+
+
+def _msgs(*ids):
+    return [{"id": mid} for mid in ids]
+
+
+def _ids(msgs):
+    return [msg["id"] for msg in msgs]
+
+
+def test_ascending_responses_only_yield_messages_above_the_watermark():
+    assert _ids(m.select_new_messages("alice", _msgs(1, 2, 3))) == [1, 2, 3]
+    assert m.MESSAGE_WATERMARKS["alice"] == 3
+    assert _ids(m.select_new_messages("alice", _msgs(2, 3, 4, 5))) == [4, 5]
+    assert m.MESSAGE_WATERMARKS["alice"] == 5
+    assert m.select_new_messages("alice", _msgs(3, 4, 5)) == []
+    assert m.MESSAGE_WATERMARKS["alice"] == 5
+    assert m.MESSAGE_SCAN_STATS["watermark_hits"] == 2
+    assert m.MESSAGE_SCAN_STATS["full_scans"] == 0
+
+
+def test_descending_responses_keep_their_order():
+    m.select_new_messages("alice", _msgs(3, 2, 1))
+    assert _ids(m.select_new_messages("alice", _msgs(6, 5, 4, 3, 2))) == [6, 5, 4]
+    assert m.MESSAGE_WATERMARKS["alice"] == 6
+
+
+def test_watermark_scan_stops_at_the_first_seen_id():
+    m.select_new_messages("alice", _msgs(1, 2, 3))
+    m.select_new_messages("alice", _msgs(*range(1, 51)))
+    before = m.MESSAGE_SCAN_STATS["messages_scanned"]
+    m.select_new_messages("alice", _msgs(*range(2, 53)))
+    assert m.MESSAGE_SCAN_STATS["messages_scanned"] - before == 3  # 两条新消息 + 停下的那一条
+
+
+@pytest.mark.parametrize("ids", [(1, 5, 3, 7), (1, "x", 3), ("a", "b")])
+def test_unordered_or_non_numeric_ids_fall_back_to_a_full_scan(ids):
+    m.MESSAGE_WATERMARKS["alice"] = 2
+    msgs = _msgs(*ids)
+    assert m.select_new_messages("alice", msgs) == msgs
+    assert "alice" not in m.MESSAGE_WATERMARKS
+    assert m.MESSAGE_SCAN_STATS["full_scans"] == 1
+
+
+def test_rooms_keep_separate_watermarks():
+    m.select_new_messages("alice", _msgs(10, 11))
+    assert _ids(m.select_new_messages("bob", _msgs(10, 11))) == [10, 11]
+    assert m.MESSAGE_WATERMARKS == {"alice": 11, "bob": 11}
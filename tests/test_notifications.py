@@ -0,0 +1,48 @@
+import asyncio
+
+import monitor_tip as m
+
+
+def test_phone_push_defaults_to_normal_and_events_pass_high(monkeypatch):
+    submitted = []
+    monkeypatch.setattr(m, "PHONE_PUSH_BASE_URL", "https://push.example/key")
+    monkeypatch.setattr(m, "LAST_NOTIFICATION_TS", {})
+    monkeypatch.setattr(m, "PENDING_BROWSER_NOTIFICATIONS", [])
+    monkeypatch.setattr(m.NOTIFIER, "submit", lambda channel, payload, priority: submitted.append((channel, priority)))
+    m.push_phone_notification("title", "body")
+    m.browser_notify("alice 高额小费", "金额：$100", m.NOTIFY_PRIORITY_HIGH)
+    m.browser_notify("plain", "body")
+    assert submitted == [
+        ("bark", m.NOTIFY_PRIORITY_NORMAL),
+        ("bark", m.NOTIFY_PRIORITY_HIGH),
+        ("bark", m.NOTIFY_PRIORITY_NORMAL),
+    ]
+
+
+def test_dispatcher_sends_higher_priority_first_on_shared_session(monkeypatch):
+    sent = []
+    async def scenario():
+        gate = asyncio.Event()
+        session = object()
+
+        async def fake_ensure_session():
+            return session
+
+        async def sink(used_session, payload):
+            assert used_session is session
+            if payload["text"] == "first":
+                await gate.wait()
+            sent.append(payload["text"])
+
+        monkeypatch.setattr(m, "ensure_session", fake_ensure_session)
+        monkeypatch.setitem(m.NOTIFY_SINKS, "telegram", sink)
+        dispatcher = m.NotificationDispatcher(max_queue=10, concurrency=1, max_attempts=1)
+        dispatcher.submit("telegram", {"text": "first"}, m.NOTIFY_PRIORITY_NORMAL)
+        await asyncio.sleep(0)
+        dispatcher.submit("telegram", {"text": "status"}, m.NOTIFY_PRIORITY_LOW)
+        dispatcher.submit("telegram", {"text": "tip"}, m.NOTIFY_PRIORITY_HIGH)
+        gate.set()
+        await dispatcher.close(drain_timeout=2)
+
+    asyncio.run(scenario())
+    assert sent == ["first", "tip", "status"]
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+import monitor_tip as m
+
+
+@pytest.fixture
+def ticks(monkeypatch):
+    """poll_room_tick 换成假的轮询：每个房间轮询 rounds 次后停止，记录并发数与轮询顺序。"""
+    record = {"order": [], "active": 0, "peak": 0, "rounds": 3, "refreshes": []}
+
+    async def fake_tick(handle):
+        record["order"].append(handle.username)
+        record["active"] += 1
+        record["peak"] = max(record["peak"], record["active"])
+        try:
+            await asyncio.sleep(0.01)
+        finally:
+            record["active"] -= 1
+        if record["order"].count(handle.username) >= record["rounds"]:
+            return None
+        if handle.username == "refresh" and not record["refreshes"]:
+            handle.refresh_request = {"reason": "test"}
+        return 0.01
+
+    monkeypatch.setattr(m, "poll_room_tick", fake_tick)
+    monkeypatch.setattr(m, "start_room_refresh", lambda handle, **request: record["refreshes"].append(
+        (handle.username, request)))
+    return record
+
+
+async def _run_until_done(scheduler, handles, timeout=5.0):
+    for handle in handles:
+        scheduler.reschedule(handle, 0)
+    try:
+        await asyncio.wait_for(_all_done(handles), timeout)
+    finally:
+        await scheduler.close()
+
+
+async def _all_done(handles):
+    while not all(h.done() for h in handles):
+        await asyncio.sleep(0.005)
+
+
+def test_workers_bound_concurrency_and_every_room_keeps_polling(ticks):
+    async def scenario():
+        scheduler = m.PollScheduler(2, 0)
+        handles = [m.RoomPollHandle(f"r{i}", None) for i in range(6)]
+        await _run_until_done(scheduler, handles)
+        return scheduler, handles
+
+    scheduler, handles = asyncio.run(scenario())
+    assert ticks["peak"] == 2
+    assert all(ticks["order"].count(h.username) == 3 for h in handles)
+    assert all(h.done() and not h.cancelled() for h in handles)
+    assert scheduler.metrics["ticks"] == 18
+
+
+def test_cancelled_room_stops_without_stalling_its_worker(ticks):
+    ticks["rounds"] = 1000
+
+    async def scenario():
+        scheduler = m.PollScheduler(1, 0)
+        stopped, other = m.RoomPollHandle("stopped", None), m.RoomPollHandle("other", None)
+        scheduler.reschedule(stopped, 0)
+        scheduler.reschedule(other, 0)
+        await asyncio.sleep(0.005)
+        stopped.cancel()
+        seen = ticks["order"].count("stopped")
+        ticks["rounds"] = ticks["order"].count("other") + 3
+        await asyncio.wait_for(_all_done([other]), 5)
+        await scheduler.close()
+        return stopped, seen
+
+    stopped, seen = asyncio.run(scenario())
+    assert stopped.cancelled()
+    assert ticks["order"].count("stopped") == seen
+
+
+def test_refresh_requests_leave_the_worker_and_the_heap(ticks):
+    async def scenario():
+        scheduler = m.PollScheduler(1, 0)
+        handle = m.RoomPollHandle("refresh", None)
+        scheduler.reschedule(handle, 0)
+        await asyncio.sleep(0.1)
+        await scheduler.close()
+        return handle
+
+    handle = asyncio.run(scenario())
+    assert ticks["refreshes"] == [("refresh", {"reason": "test"})]
+    # 刷新任务负责重新排期，在此之前不再轮询
+    assert ticks["order"] == ["refresh"] and not handle.done()
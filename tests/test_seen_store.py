@@ -0,0 +1,91 @@
+import asyncio
+import random
+from collections import deque
+
+import pytest
+
+import monitor_tip as m
+
+
+@pytest.fixture
+def seen_state(monkeypatch, tmp_path):
+    monkeypatch.setattr(m, "SEEN_MESSAGES", {})
+    monkeypatch.setattr(m, "MESSAGE_WATERMARKS", {})
+    monkeypatch.setattr(m, "SEEN_MESSAGES_DIRTY", False)
+    monkeypatch.setattr(m, "SEEN_SNAPSHOT_LOADED", True)
+    monkeypatch.setattr(m, "SEEN_SNAPSHOT_STATS", dict(m.SEEN_SNAPSHOT_STATS, rooms_restored=0, ids_restored=0))
+    monkeypatch.setattr(m, "SEEN_MESSAGES_FILE", str(tmp_path / "seen_messages.json"))
+    monkeypatch.setattr(m, "STREAMERS", [{"username": "alice"}, {"username": "bob"}])
+
+
+@pytest.mark.parametrize("capacity", [1, 2, 7, 64])
+def test_ring_matches_a_bounded_fifo_of_recent_ids(capacity):
+    rng = random.Random(capacity)
+    ring = m.SeenIdRing(capacity)
+    window: deque = deque(maxlen=capacity)
+    next_id = 1_000
+    for _ in range(5_000):
+        roll = rng.random()
+        if roll < 0.6:
+            next_id += rng.randint(1, 3)
+            key = next_id  # 大多数消息 id 递增
+        elif roll < 0.9 and window:
+            key = rng.choice(list(window))  # 重复出现的消息
+        else:
+            key = rng.randint(0, next_id)  # 乱序或早已淘汰的 id
+        expected_new = key not in window
+        assert ring.add(key) is expected_new
+        if expected_new:
+            window.append(key)
+        assert len(ring) == len(window)
+        assert ring.ordered[ring.head:].tolist() == sorted(window)
+    assert ring.recent(capacity) == list(window)
+    assert ring.recent(3) == list(window)[-3:]
+    assert all(key in ring for key in window)
+    assert -1 not in ring
+
+
+def test_message_keys_are_stable_integers():
+    assert m.seen_message_key("123") == 123
+    text_key = m.seen_message_key("2024-01-01T00:00:00Z_abc")
+    assert text_key == m.seen_message_key("2024-01-01T00:00:00Z_abc")
+    assert -(1 << 63) <= text_key < (1 << 63)
+    assert m.seen_message_key(str(1 << 70)) != m.seen_message_key(str((1 << 70) + 1))
+
+
+def test_duplicate_detection_marks_the_store_dirty(seen_state):
+    assert m.is_duplicate_message("alice", "10") is False
+    assert m.SEEN_MESSAGES_DIRTY is True
+    assert m.is_duplicate_message("alice", "10") is True
+    assert m.is_duplicate_message("bob", "10") is False
+    assert m.is_duplicate_message("alice", "") is False
+
+
+def test_snapshot_round_trip_restores_ids_and_watermarks(seen_state):
+    for mid in ("1", "2", "3"):
+        m.is_duplicate_message("alice", mid)
+    m.is_duplicate_message("carol", "9")  # 不在主播列表中，不写入快照
+    m.MESSAGE_WATERMARKS["alice"] = 3
+    asyncio.run(m.save_seen_snapshot())
+    assert m.SEEN_MESSAGES_DIRTY is False
+    assert m.SEEN_SNAPSHOT_STATS["last_snapshot_bytes"] > 0
+
+    m.SEEN_MESSAGES.clear()
+    m.MESSAGE_WATERMARKS.clear()
+    m.load_seen_snapshot()
+    assert set(m.SEEN_MESSAGES) == {"alice"}
+    assert m.SEEN_MESSAGES["alice"].recent(10) == [1, 2, 3]
+    assert m.MESSAGE_WATERMARKS == {"alice": 3}
+    assert m.is_duplicate_message("alice", "2") is True
+
+
+def test_rename_moves_ids_and_watermark(seen_state):
+    m.is_duplicate_message("alice", "5")
+    m.MESSAGE_WATERMARKS["alice"] = 5
+    m.MESSAGE_WATERMARKS["alice2"] = 3
+    m.SEEN_MESSAGES_DIRTY = False
+    m.move_seen_messages("alice", "alice2")
+    assert "alice" not in m.SEEN_MESSAGES and "alice" not in m.MESSAGE_WATERMARKS
+    assert m.is_duplicate_message("alice2", "5") is True
+    assert m.MESSAGE_WATERMARKS["alice2"] == 5
+    assert m.SEEN_MESSAGES_DIRTY is True
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+import monitor_tip as m
+
+KEY = ("https://example.com", "alice")
+
+
+@pytest.fixture(autouse=True)
+def flight_state(monkeypatch):
+    monkeypatch.setattr(m, "CREDENTIAL_FLIGHTS", {})
+    monkeypatch.setattr(m, "CREDENTIAL_FLIGHT_RECENT", {})
+    monkeypatch.setattr(m, "CREDENTIAL_FLIGHT_STATS", dict.fromkeys(m.CREDENTIAL_FLIGHT_STATS, 0))
+    monkeypatch.setattr(m, "VERBOSE", False)
+
+
+class _Factory:
+    """每次调用返回 uniqs 中的下一个 uniq，并记录调用次数。"""
+
+    def __init__(self, *uniqs, delay=0.05):
+        self.uniqs = list(uniqs)
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        uniq = self.uniqs.pop(0)
+        if isinstance(uniq, Exception):
+            raise uniq
+        return {"uniq": uniq, "cookies": {"c": uniq}}
+
+
+def test_concurrent_callers_share_one_flight():
+    factory = _Factory("U1")
+
+    async def scenario():
+        return await asyncio.gather(*[m._single_flight_credentials(KEY, factory) for _ in range(10)])
+
+    results = asyncio.run(scenario())
+    assert factory.calls == 1
+    assert {r["uniq"] for r in results} == {"U1"}
+    # 每个调用方拿到各自的副本
+    results[0]["cookies"]["c"] = "changed"
+    assert results[1]["cookies"]["c"] == "U1"
+    assert m.CREDENTIAL_FLIGHT_STATS["flights"] == 1 and m.CREDENTIAL_FLIGHT_STATS["coalesced"] == 9
+    assert m.CREDENTIAL_FLIGHTS == {}
+
+
+def test_recent_result_is_reused_unless_it_was_rejected():
+    factory = _Factory("U1", "U2", delay=0)
+
+    async def scenario():
+        first = await m._single_flight_credentials(KEY, factory)
+        again = await m._single_flight_credentials(KEY, factory)
+        fresh = await m._single_flight_credentials(KEY, factory, exclude_uniq="U1")
+        return first, again, fresh
+
+    first, again, fresh = asyncio.run(scenario())
+    assert (first["uniq"], again["uniq"], fresh["uniq"]) == ("U1", "U1", "U2")
+    assert factory.calls == 2
+    assert m.CREDENTIAL_FLIGHT_STATS["grace_hits"] == 1
+
+
+def test_coalesced_caller_reruns_when_the_flight_returns_its_rejected_uniq():
+    factory = _Factory("STALE", "U2")
+
+    async def scenario():
+        leader = asyncio.create_task(m._single_flight_credentials(KEY, factory))
+        await asyncio.sleep(0)
+        follower = await m._single_flight_credentials(KEY, factory, exclude_uniq="STALE")
+        return await leader, follower
+
+    leader, follower = asyncio.run(scenario())
+    assert leader["uniq"] == "STALE" and follower["uniq"] == "U2"
+    assert m.CREDENTIAL_FLIGHT_STATS["rejoined"] == 1
+
+
+def test_cancelling_the_initiator_does_not_cancel_the_flight():
+    factory = _Factory("U1")
+
+    async def scenario():
+        initiator = asyncio.create_task(m._single_flight_credentials(KEY, factory))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(m._single_flight_credentials(KEY, factory))
+        await asyncio.sleep(0)
+        initiator.cancel()
+        return await waiter
+
+    assert asyncio.run(scenario())["uniq"] == "U1"
+    assert factory.calls == 1
+
+
+def test_failures_are_not_cached():
+    factory = _Factory(RuntimeError("boom"), "U1", delay=0)
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await m._single_flight_credentials(KEY, factory)
+        return await m._single_flight_credentials(KEY, factory)
+
+    assert asyncio.run(scenario())["uniq"] == "U1"
+    assert factory.calls == 2
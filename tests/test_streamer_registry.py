@@ -0,0 +1,87 @@
+import random
+
+import pytest
+
+import monitor_tip as m
+
+
+def _expected_index(records) -> dict:
+    index = {}
+    for record in records:
+        index.setdefault(record["username"], record)
+    return index
+
+
+def _check(registry):
+    assert registry._index == _expected_index(registry)
+    for name, record in _expected_index(registry).items():
+        assert registry.get(name) is record
+
+
+def _record(rng: random.Random) -> dict:
+    # 名字池很小，经常出现同名记录
+    return {"username": f"s{rng.randrange(8)}", "running": rng.random() < 0.5}
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_index_tracks_every_list_mutation(seed):
+    rng = random.Random(seed)
+    registry = m.StreamerRegistry([_record(rng) for _ in range(5)])
+    _check(registry)
+    for _ in range(400):
+        op = rng.randrange(12)
+        if op == 0:
+            registry.append(_record(rng))
+        elif op == 1:
+            registry.insert(rng.randint(0, len(registry)), _record(rng))
+        elif op == 2 and registry:
+            registry.remove(rng.choice(registry))
+        elif op == 3 and registry:
+            registry.pop(rng.randrange(len(registry)))
+        elif op == 4 and registry:
+            del registry[rng.randrange(len(registry))]
+        elif op == 5 and registry:
+            registry[rng.randrange(len(registry))] = _record(rng)
+        elif op == 6:
+            shuffled = list(registry)
+            rng.shuffle(shuffled)
+            registry[:] = shuffled
+        elif op == 7:
+            registry.sort(key=lambda s: not s["running"])
+        elif op == 8:
+            registry.extend([_record(rng) for _ in range(rng.randrange(3))])
+        elif op == 9 and registry:
+            registry.rename(rng.choice(registry), f"s{rng.randrange(8)}")
+        elif op == 10 and len(registry) > 2:
+            del registry[:2]
+        elif op == 11 and len(registry) > 20:
+            registry.clear()
+        _check(registry)
+
+
+def test_duplicate_names_resolve_to_the_earliest_record():
+    first, second = {"username": "a"}, {"username": "a"}
+    registry = m.StreamerRegistry([first, second])
+    assert registry.get("a") is first
+    registry.remove(first)
+    assert registry.get("a") is second
+
+
+def test_remove_matches_by_identity():
+    first, twin = {"username": "a"}, {"username": "a"}
+    registry = m.StreamerRegistry([first, twin])
+    registry.remove(twin)
+    assert list(registry) == [first] and registry[0] is first
+    with pytest.raises(ValueError):
+        registry.remove({"username": "a"})
+
+
+def test_lookups_go_through_the_registry(monkeypatch):
+    alice, bob = {"username": "alice", "threshold": 10.0}, {"username": "bob"}
+    monkeypatch.setattr(m, "STREAMERS", m.StreamerRegistry([alice, bob]))
+    assert m.get_streamer("alice") is alice
+    assert m.get_streamer_threshold("alice") == 10.0
+    assert m.find_streamer_by_username("bob") == (1, bob)
+    assert m.find_streamer_by_username("carol") == (None, None)
+    m.STREAMERS.rename(alice, "alice2")
+    assert m.get_streamer("alice") is None and m.get_streamer("alice2") is alice